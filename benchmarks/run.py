@@ -0,0 +1,241 @@
+"""Benchmarks for the load, join and export pipeline over synthetic feeds.
+
+Run from the repository root with:
+
+    python -m benchmarks.run --scale small --output results.json
+
+and compare two runs with --compare previous.json.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+import zipfile
+from typing import Callable, Dict, List, Optional, Tuple
+
+import main
+from src.gtfs import FILE_TO_OBJECT_MAPPINGS, FILE_TO_PARAMETER_NAME, load_gtfs_from_file, load_stop_times_columns
+from src.gtfs import StopTime, StopTimeColumns, parse_gtfs_time
+from src.parallel import load_gtfs_parallel
+from src.patterns import PatternCompressor
+from src.routing import Timetable
+from src.snapshot import Snapshot, write_snapshot
+from src.spatial import StopIndex, brute_force_nearest
+from src.times import TripTimes, parse_times
+from src.translation import connect_route_stops, group_by, stream_route_stops
+from src.upload import insert_routes_to_db
+from tests.utils import FakeDatabase, FolderDownloadService
+from .synthetic import FeedScale, SCALES, generate_feed
+
+Case = Tuple[str, Callable[[], object], int]  # Name, function to time and rows it handles
+NEAREST_QUERIES = 1000  # Nearest stop lookups timed for the spatial index and brute force
+JOURNEY_QUERIES = 20  # Earliest arrival queries timed for each routing algorithm
+
+
+def measure(name: str, func: Callable[[], object], rows: int, repeat: int = 1) -> Dict:
+    """Time a function and record its peak traced memory.
+
+    Arguments:
+        name:   Name of the benchmark.
+        func:   Function to run.
+        rows:   Number of rows the function handles, for rows/s.
+        repeat: Optional, number of timed runs, the fastest is kept.
+
+    Returns:
+        Benchmark result.
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    # Memory is measured on a separate run since tracing slows everything down
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    result = {"name": name, "seconds": best, "peak_bytes": peak, "rows": rows,
+              "rows_per_second": rows / best if best > 0 else 0.0}
+    logging.info(f"{name}: {best:.3f}s, peak {peak / 1e6:.1f} MB, {result['rows_per_second']:.0f} rows/s")
+    return result
+
+
+def benchmark_cases(feed_dir: str, work_dir: str, counts: Dict[str, int]) -> List[Case]:
+    """Every benchmark to run over a generated feed.
+
+    Arguments:
+        feed_dir:   Directory holding the generated feed.
+        work_dir:   Scratch directory benchmarks can write to.
+        counts:     Mapping of file name to number of rows in the feed.
+
+    Returns:
+        List of benchmark cases.
+    """
+    cases: List[Case] = []
+    for filename, obj_type in FILE_TO_OBJECT_MAPPINGS.items():
+        path = os.path.join(feed_dir, filename)
+        cases.append((f"load_gtfs_from_file[{filename}]",
+                      lambda path=path, obj_type=obj_type: load_gtfs_from_file(path, obj_type), counts[filename]))
+    stop_times_path = os.path.join(feed_dir, "stop_times.txt")
+    cases.append(("load_gtfs_from_file[stop_times.txt, trip_id and stop_id]",
+                  lambda: load_gtfs_from_file(stop_times_path, StopTime, columns=["trip_id", "stop_id"]),
+                  counts["stop_times.txt"]))
+    cases.append(("load_stop_times_columns", lambda: load_stop_times_columns(stop_times_path),
+                  counts["stop_times.txt"]))
+    processes = os.cpu_count() or 1
+    cases.append((f"load_gtfs_parallel[{processes} processes]",
+                  lambda: load_gtfs_parallel(stop_times_path, StopTimeColumns, processes), counts["stop_times.txt"]))
+
+    loaded = {filename: load_gtfs_from_file(os.path.join(feed_dir, filename), obj_type)
+              for filename, obj_type in FILE_TO_OBJECT_MAPPINGS.items()}
+    routes, trips, stop_times = loaded["routes.txt"], loaded["trips.txt"], loaded["stop_times.txt"]
+    cases.append(("group_by[stop_times.trip_id]", lambda: group_by("trip_id", stop_times), len(stop_times)))
+    cases.append(("connect_route_stops", lambda: connect_route_stops(routes, stop_times, trips), len(stop_times)))
+    def connect_patterns():
+        compressor = PatternCompressor()
+        return [compressor.trip(x) for x in connect_route_stops(routes, stop_times, trips)]
+    cases.append(("PatternCompressor.trip", connect_patterns, len(stop_times)))
+    arrival_times = [x.arrival_time for x in stop_times]
+    cases.append(("parse_gtfs_time[arrival_time]", lambda: [parse_gtfs_time(x) for x in arrival_times],
+                  len(stop_times)))
+    cases.append(("parse_times[arrival_time]", lambda: parse_times(arrival_times), len(stop_times)))
+    columns = load_stop_times_columns(stop_times_path)
+    cases.append(("TripTimes.from_stop_times[columns]", lambda: TripTimes.from_stop_times(columns),
+                  len(stop_times)))
+    cases.append(("stream_route_stops", lambda: sum(1 for _ in stream_route_stops(routes, trips, stop_times_path)),
+                  len(stop_times)))
+
+    stops = loaded["stops.txt"]
+    stop_index = StopIndex(stops)
+    rand = random.Random(0)
+    queries = [(rand.choice(stops).stop_lat + rand.uniform(-0.01, 0.01),
+                rand.choice(stops).stop_lon + rand.uniform(-0.01, 0.01)) for _ in range(NEAREST_QUERIES)]
+    cases.append(("StopIndex", lambda: StopIndex(stops), len(stops)))
+    cases.append(("StopIndex.nearest[k=5]", lambda: [stop_index.nearest(lat, lon, 5) for lat, lon in queries],
+                  NEAREST_QUERIES))
+    cases.append(("brute_force_nearest[k=5]", lambda: [brute_force_nearest(stops, lat, lon, 5)
+                                                       for lat, lon in queries], NEAREST_QUERIES))
+
+    timetable = Timetable.build(trips, columns)
+    timetable_path = os.path.join(work_dir, "timetable.npz")
+    timetable.save(timetable_path)
+    stop_ids = timetable.stop_ids.tolist()
+    journeys = [(rand.choice(stop_ids), rand.choice(stop_ids), rand.randint(5 * 3600, 20 * 3600))
+                for _ in range(JOURNEY_QUERIES)] if stop_ids else []
+    cases.append(("Timetable.build", lambda: Timetable.build(trips, columns), len(stop_times)))
+    cases.append(("Timetable.load", lambda: Timetable.load(timetable_path), len(timetable.connection_trip)))
+    cases.append(("Timetable.earliest_arrival", lambda: [timetable.earliest_arrival(source, time, target)
+                                                         for source, target, time in journeys], len(journeys)))
+    cases.append(("Timetable.raptor", lambda: [timetable.raptor(source, time, target)
+                                               for source, target, time in journeys], len(journeys)))
+
+    snapshot_path = os.path.join(work_dir, "feed.snap")
+    feed = {FILE_TO_PARAMETER_NAME[k]: v for k, v in loaded.items()}
+    cases.append(("write_snapshot", lambda: write_snapshot(snapshot_path, feed), len(stop_times)))
+    write_snapshot(snapshot_path, feed)
+
+    def load_snapshot():
+        snapshot = Snapshot(snapshot_path)
+        snapshot.feed()
+        snapshot.close()
+    cases.append(("load_snapshot", load_snapshot, len(stop_times)))
+
+    output_dir = os.path.join(work_dir, "output")
+    os.makedirs(output_dir, exist_ok=True)
+    cases.append(("main", lambda: main.main(["main.py", feed_dir, output_dir]), len(stop_times)))
+    cases.append(("main[--stream]", lambda: main.main(["main.py", feed_dir, output_dir, "--stream"]),
+                  len(stop_times)))
+
+    download_service = FolderDownloadService({"synthetic": feed_dir}, zipfile.ZIP_DEFLATED)
+    cases.append(("insert_routes_to_db", lambda: insert_routes_to_db(
+        "synthetic", os.path.join(work_dir, "download"), download_service, FakeDatabase(), "routes"),
+        len(trips)))
+    return cases
+
+
+def compare(results: Dict, previous: Dict) -> List[str]:
+    """Describe how each benchmark changed since a previous run.
+
+    Arguments:
+        results:    Results of this run.
+        previous:   Results of the run to compare against.
+
+    Returns:
+        One line per benchmark present in both runs.
+    """
+    before = {x["name"]: x for x in previous["results"]}
+    lines = []
+    for result in results["results"]:
+        if result["name"] not in before:
+            continue
+        old = before[result["name"]]
+        time_ratio = result["seconds"] / old["seconds"] if old["seconds"] > 0 else float("inf")
+        memory_ratio = result["peak_bytes"] / old["peak_bytes"] if old["peak_bytes"] > 0 else float("inf")
+        lines.append(f"{result['name']}: time x{time_ratio:.2f}, peak memory x{memory_ratio:.2f}")
+    return lines
+
+
+def run(scale: FeedScale, seed: int = 0, repeat: int = 1, only: Optional[str] = None) -> Dict:
+    """Generate a feed and run every benchmark over it.
+
+    Arguments:
+        scale:  Size of the feed.
+        seed:   Optional, seed of the feed generator.
+        repeat: Optional, number of timed runs of each benchmark.
+        only:   Optional, only run benchmarks whose name contains this.
+
+    Returns:
+        Results with the configuration they were run with.
+    """
+    with tempfile.TemporaryDirectory() as work_dir:
+        feed_dir = os.path.join(work_dir, "feed")
+        counts = generate_feed(feed_dir, scale, seed)
+        results = [measure(name, func, rows, repeat) for name, func, rows in benchmark_cases(feed_dir, work_dir, counts)
+                   if only is None or only in name]
+    return {"config": {"scale": scale.__dict__, "seed": seed, "repeat": repeat, "rows": counts},
+            "python": platform.python_version(), "platform": platform.platform(),
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"), "results": results}
+
+
+def parse_args(args: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark the GTFS conversion pipeline on a synthetic feed.")
+    parser.add_argument("--scale", choices=sorted(SCALES), default="small", help="Preset feed size")
+    parser.add_argument("--stops", type=int, help="Override number of stops")
+    parser.add_argument("--routes", type=int, help="Override number of routes")
+    parser.add_argument("--trips", type=int, help="Override number of trips per route")
+    parser.add_argument("--stop-times", type=int, help="Override number of stop times per trip")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the feed generator")
+    parser.add_argument("--repeat", type=int, default=1, help="Timed runs per benchmark, fastest is kept")
+    parser.add_argument("--only", help="Only run benchmarks whose name contains this")
+    parser.add_argument("--output", help="File to write json results to, printed if not given")
+    parser.add_argument("--compare", help="Previous results file to compare against")
+    return parser.parse_args(args)
+
+
+def cli(args: List[str]):
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    options = parse_args(args)
+    preset = SCALES[options.scale]
+    scale = FeedScale(options.stops or preset.stops, options.routes or preset.routes,
+                      options.trips or preset.trips, options.stop_times or preset.stop_times, preset.services)
+    results = run(scale, options.seed, options.repeat, options.only)
+    if options.output:
+        with open(options.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+    if options.compare:
+        with open(options.compare) as f:
+            for line in compare(results, json.load(f)):
+                print(line)
+
+
+if __name__ == "__main__":
+    cli(sys.argv[1:])
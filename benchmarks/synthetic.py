@@ -0,0 +1,114 @@
+import csv
+import itertools
+import os
+import random
+from typing import Dict, List
+from src.gtfs import STOP_HEADERS, ROUTE_HEADERS, STOP_TIMES_HEADERS, TRIP_HEADERS, AGENCY_HEADERS, \
+    format_gtfs_time
+
+CALENDAR_HEADERS = ["service_id", "monday", "tuesday", "wednesday", "thursday", "friday",
+                    "saturday", "sunday", "start_date", "end_date"]
+
+# Centre and spread of generated stops, roughly the greater Dublin area
+CENTRE_LAT, CENTRE_LON = 53.35, -6.26
+SPREAD = 0.25
+
+
+class FeedScale:
+    """Size of a synthetic feed.
+
+    Attributes:
+        stops:          Number of stops.
+        routes:         Number of routes.
+        trips:          Number of trips per route.
+        stop_times:     Number of stop times per trip.
+        services:       Number of services trips are spread across.
+    """
+    stops: int
+    routes: int
+    trips: int
+    stop_times: int
+    services: int
+
+    def __init__(self, stops: int = 1000, routes: int = 50, trips: int = 40,
+                 stop_times: int = 30, services: int = 3) -> None:
+        """Constructor"""
+        self.stops = stops
+        self.routes = routes
+        self.trips = trips
+        self.stop_times = stop_times
+        self.services = services
+
+
+SCALES = {
+    "tiny": FeedScale(50, 5, 4, 10, 2),
+    "small": FeedScale(1000, 50, 40, 30, 3),
+    "medium": FeedScale(5000, 200, 100, 40, 4),
+    "large": FeedScale(20000, 800, 150, 50, 5),
+}
+
+
+def _write(directory: str, filename: str, headers: List[str], rows: List[Dict]) -> None:
+    with open(os.path.join(directory, filename), 'w', newline='', encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=headers)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def generate_feed(directory: str, scale: FeedScale, seed: int = 0) -> Dict[str, int]:
+    """Write a synthetic GTFS feed. The same scale and seed always give the same files.
+    Each route follows a fixed random sequence of stops and its trips are spread through
+    the day, so trips on a route share a stop pattern like real feeds do.
+
+    Arguments:
+        directory:  Directory to write the txt files into, created if missing.
+        scale:      Size of the feed.
+        seed:       Optional, seed of the random generator.
+
+    Returns:
+        Mapping of file name to number of rows written.
+    """
+    rand = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+    stops = [{"stop_id": f"S{i}", "stop_name": f"Stop {i}",
+              "stop_lat": f"{CENTRE_LAT + rand.uniform(-SPREAD, SPREAD):.6f}",
+              "stop_lon": f"{CENTRE_LON + rand.uniform(-SPREAD, SPREAD):.6f}"} for i in range(scale.stops)]
+    services = [f"SV{i}" for i in range(scale.services)]
+    calendar = [{"service_id": x, "monday": "1", "tuesday": "1", "wednesday": "1", "thursday": "1",
+                 "friday": "1", "saturday": str(i % 2), "sunday": str(i % 2),
+                 "start_date": "20220101", "end_date": "20221231"} for i, x in enumerate(services)]
+    routes, trips = [], []
+    stop_times_count = 0
+    with open(os.path.join(directory, "stop_times.txt"), 'w', newline='', encoding="utf-8") as f:
+        # Stop times are written as they are generated since they are by far the largest file
+        stop_times = csv.DictWriter(f, fieldnames=STOP_TIMES_HEADERS)
+        stop_times.writeheader()
+        for r in range(scale.routes):
+            route_id = f"R{r}"
+            routes.append({"route_id": route_id, "agency_id": "1", "route_short_name": str(r),
+                           "route_long_name": f"Route {r}", "route_type": "3"})
+            pattern = rand.sample(range(scale.stops), min(scale.stop_times, scale.stops))
+            # Distances follow the route's shape so every trip on a route shares them
+            distances = list(itertools.accumulate(rand.uniform(0.2, 1.0) for _ in pattern[1:]))
+            for t in range(scale.trips):
+                trip_id = f"{route_id}_T{t}"
+                trips.append({"route_id": route_id, "service_id": rand.choice(services), "trip_id": trip_id,
+                              "shape_id": f"SH{r}", "trip_headsign": f"Route {r}", "direction_id": "0"})
+                time = 5 * 3600 + t * (19 * 3600 // max(scale.trips, 1))
+                for sequence, (stop, distance) in enumerate(zip(pattern, [0.0] + distances), 1):
+                    stop_times.writerow({"trip_id": trip_id, "arrival_time": format_gtfs_time(time),
+                                         "departure_time": format_gtfs_time(time + 30), "stop_id": f"S{stop}",
+                                         "stop_sequence": str(sequence), "stop_headsign": "", "pickup_type": "0",
+                                         "drop_off_type": "0", "shape_dist_traveled": f"{distance:.2f}"})
+                    time += rand.randint(60, 240)
+                    stop_times_count += 1
+    agency = [{"agency_id": "1", "agency_name": "Synthetic", "agency_url": "http://example.com",
+               "agency_timezone": "Europe/Dublin", "agency_lang": "EN", "agency_phone": ""}]
+    files = {"agency.txt": (AGENCY_HEADERS, agency), "stops.txt": (STOP_HEADERS, stops),
+             "routes.txt": (ROUTE_HEADERS, routes), "trips.txt": (TRIP_HEADERS, trips),
+             "calendar.txt": (CALENDAR_HEADERS, calendar)}
+    for filename, (headers, rows) in files.items():
+        _write(directory, filename, headers, rows)
+    counts = {filename: len(rows) for filename, (_, rows) in files.items()}
+    counts["stop_times.txt"] = stop_times_count
+    return counts
@@ -1,11 +1,22 @@
-
+import argparse
 import json
 import logging
 import sys
 import os
-from typing import List
-from src.gtfs import FILE_TO_PARAMETER_NAME, load_gtfs_from_file, FILE_TO_OBJECT_MAPPINGS
-from src.translation import connect_route_stops
+from functools import partial
+from typing import List, Optional
+from src.gtfs import FILE_TO_PARAMETER_NAME, FILE_TO_OBJECT_MAPPINGS, to_dict
+from src.departures import build_stop_indexes
+from src.feed import Feed
+from src.merge import FeedMerger
+from src.metrics import Metrics, profiled
+from src.patterns import PatternCompressor
+from src.routing import Timetable
+from src.snapshot import Snapshot, write_snapshot
+from src.spatial import StopIndex
+from src.times import TripTimes, attach_trip_times
+from src.translation import connect_route_stops, stream_route_stops
+from src.writer import write_records
 
 
 def get_folder_files(folder_path: str) -> List[str]:
@@ -13,22 +24,187 @@ def get_folder_files(folder_path: str) -> List[str]:
     return items
 
 
-def main(args):
-    output_folder: str = args[2]
-    files = get_folder_files(args[1])
-    parameters = {}
+def parse_args(args: List[str]) -> argparse.Namespace:
+    """Parse the command line arguments, not including the program name.
+
+    Arguments:
+        args:   Command line arguments.
+
+    Returns:
+        Namespace with input_folder, output_folder and any options.
+    """
+    parser = argparse.ArgumentParser(description="Convert GTFS txt files into json.")
+    parser.add_argument("input_folder", help="Folder containing the GTFS txt files")
+    parser.add_argument("output_folder", help="Folder to write the json output to")
+    parser.add_argument("--columnar", action="store_true",
+                        help="Load stop_times.txt into typed columns to save memory")
+    parser.add_argument("--stream", action="store_true",
+                        help="Never hold all of stop_times.txt in memory, join it trip by trip")
+    parser.add_argument("--ndjson", action="store_true",
+                        help="Write newline delimited json (.ndjson) instead of json arrays")
+    parser.add_argument("--processes", type=int, metavar="N",
+                        help="Parse stop_times.txt into typed columns with N processes")
+    parser.add_argument("--snapshot", metavar="FILE",
+                        help="Binary snapshot of the parsed feed, loaded instead of the txt files if it is "
+                             "newer than them, otherwise written after parsing")
+    parser.add_argument("--patterns", action="store_true",
+                        help="Write each connected trip as a reference to its stop pattern plus time offsets, "
+                             "with the patterns written once to patterns.json")
+    parser.add_argument("--departures", action="store_true",
+                        help="Also write stop_routes and stop_departures, the routes serving each stop and "
+                             "its departures in time order")
+    parser.add_argument("--trip-times", action="store_true",
+                        help="Add each trip's first departure, last arrival, duration and the dwell and run "
+                             "times between its stops in seconds to connected")
+    parser.add_argument("--metrics", metavar="FILE",
+                        help="Write the time, CPU time, memory and rows/s of each stage to FILE as json")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="Record peak Python memory of each stage in the metrics, slows the run down")
+    parser.add_argument("--profile", metavar="FILE", help="Profile the run with cProfile and save the stats to FILE")
+    parser.add_argument("--merge", metavar="FOLDER", action="append", default=[],
+                        help="Merge the GTFS feed in FOLDER into the input folder's, prefixing IDs with the name of "
+                             "the folder they came from and keeping stops the feeds share once. Can be repeated")
+    parser.add_argument("--timetable", action="store_true",
+                        help="Also write timetable.npz, connection (CSA) and route (RAPTOR) arrays for journey "
+                             "planners to load with src.routing.Timetable.load")
+    parser.add_argument("--stop-index", action="store_true",
+                        help="Write a spatial index of the stops to stops_index.json for nearest stop lookups")
+    return parser.parse_args(args)
+
+
+def open_snapshot(path: str, input_folder: str, files: List[str]) -> Optional[Snapshot]:
+    """Open a snapshot of the input folder if it exists and is newer than every GTFS file.
+
+    Arguments:
+        path:           Snapshot file.
+        input_folder:   Folder containing the GTFS txt files.
+        files:          Names of the files in the input folder.
+
+    Returns:
+        Snapshot or None if there is no up to date snapshot.
+    """
+    if not os.path.exists(path):
+        return None
+    gtfs_files = [os.path.join(input_folder, x) for x in files if x in FILE_TO_OBJECT_MAPPINGS]
+    if any(os.path.getmtime(x) > os.path.getmtime(path) for x in gtfs_files):
+        logging.info(f"Snapshot {path} is older than the GTFS files, not using it")
+        return None
+    return Snapshot(path)
+
+
+def merge_feeds(folders: List[str], metrics: Metrics) -> Feed:
+    """Merge the GTFS feeds of several folders into one, IDs are prefixed with the name of
+    the folder they came from.
+
+    Arguments:
+        folders:    Folders containing the GTFS txt files.
+        metrics:    Metrics to record the parse and merge stages in.
+
+    Returns:
+        Merged feed.
+    """
+    merger = FeedMerger()
+    for folder in folders:
+        prefix = os.path.basename(os.path.normpath(folder))
+        with metrics.stage("merge", feed=prefix):
+            merger.add(prefix, Feed(folder, metrics=metrics))
+    return merger.feed()
+
+
+def convert(options: argparse.Namespace, metrics: Metrics):
+    """Convert the GTFS files of the input folder, recording each stage in metrics.
+
+    Arguments:
+        options:    Parsed command line arguments.
+        metrics:    Metrics to record stages in.
+    """
+    output_folder: str = options.output_folder
+    extension = ".ndjson" if options.ndjson else ".json"
+
+    def serialise(name: str, records):
+        with metrics.stage("serialise", file=name + extension) as stage:
+            stage.rows = write_records(os.path.join(output_folder, name + extension), records, options.ndjson)
+
+    snapshot = None
+    if options.merge:
+        if options.stream or options.snapshot:
+            logging.warning("Merged feeds are loaded in full, ignoring --stream and --snapshot")
+        feed = merge_feeds([options.input_folder] + options.merge, metrics)
+    else:
+        files = get_folder_files(options.input_folder)
+        snapshot = open_snapshot(options.snapshot, options.input_folder, files) if options.snapshot else None
+        loaders = {}
+        if snapshot is not None:
+            loaders = {FILE_TO_PARAMETER_NAME[k]: partial(snapshot.load, FILE_TO_PARAMETER_NAME[k])
+                       for k in FILE_TO_OBJECT_MAPPINGS if k in files}
+            if "stop_times" in loaders:
+                loaders["stop_times"] = snapshot.stop_time_columns
+        feed = Feed(options.input_folder, columnar=options.columnar, processes=options.processes, loaders=loaders,
+                    metrics=metrics)
+    # Stop times are read straight from file when streaming, unless they are already in memory
+    stream = options.stream and snapshot is None and not options.merge
     for k in FILE_TO_OBJECT_MAPPINGS:
-        if k in files:
-            obj_type = FILE_TO_OBJECT_MAPPINGS[k]
-            loaded_obj = load_gtfs_from_file(os.path.join(args[1], k), obj_type)
-            output_file = os.path.join(output_folder,  k.replace(".txt", ".json"))
-            parameters[FILE_TO_PARAMETER_NAME[k]] = loaded_obj
-            with open(output_file, 'w') as f:
-                json.dump([x.__dict__ for x in loaded_obj], f)
-    connections = connect_route_stops(routes=parameters["routes"], stop_times=parameters["stop_times"],
-                        trips=parameters["trips"])
-    with open(os.path.join(output_folder,"connected.json"), 'w') as f:
-        json.dump(connections, f)
+        name = FILE_TO_PARAMETER_NAME[k]
+        if name not in feed:
+            continue
+        if stream and name == "stop_times":
+            # Parsing happens as the records are written
+            serialise(name, (to_dict(x) for x in feed.iter(name)))
+            continue
+        serialise(name, (to_dict(x) for x in feed[name]))
+    if options.snapshot and snapshot is None and not options.merge:
+        if stream:
+            logging.warning("Stop times are not loaded when streaming, not writing a snapshot")
+        else:
+            with metrics.stage("snapshot"):
+                write_snapshot(options.snapshot, feed.loaded)
+    if stream:
+        # Joined lazily, so the join is timed as part of serialising connected
+        connections = stream_route_stops(routes=feed["routes"], trips=feed["trips"],
+                                         stop_times_file=feed.path("stop_times.txt"))
+    else:
+        with metrics.stage("join", rows=len(feed["stop_times"])):
+            connections = connect_route_stops(routes=feed["routes"], stop_times=feed["stop_times"],
+                                trips=feed["trips"])
+    if options.trip_times:
+        if stream:
+            connections = attach_trip_times(connections)
+        else:
+            with metrics.stage("trip_times", rows=len(connections)):
+                connections = list(attach_trip_times(connections, TripTimes.from_stop_times(feed["stop_times"])))
+    compressor = PatternCompressor() if options.patterns else None
+    if compressor is not None:
+        connections = map(compressor.trip, connections)
+    serialise("connected", connections)
+    if compressor is not None:
+        serialise("patterns", compressor.pattern_list())
+    if options.departures:
+        with metrics.stage("departures"):
+            stop_routes, departures = build_stop_indexes(feed.iter("stop_times"), feed["trips"], feed["routes"])
+        serialise("stop_routes", stop_routes)
+        serialise("stop_departures", departures)
+    if options.timetable:
+        with metrics.stage("timetable", rows=len(feed["stop_times"])):
+            timetable = Timetable.build(feed["trips"], feed["stop_times"], feed.get("calendar", []))
+            timetable.save(os.path.join(output_folder, "timetable.npz"))
+    if options.stop_index:
+        stops = feed.get("stops", [])
+        with metrics.stage("stop_index", rows=len(stops)):
+            with open(os.path.join(output_folder, "stops_index.json"), 'w') as f:
+                json.dump(StopIndex(stops).to_dict(), f)
+    if snapshot is not None:
+        # Columns are views over the snapshot, drop them so it can be unmapped straight away
+        feed.clear()
+        snapshot.close()
+
+
+def main(args):
+    options = parse_args(args[1:])
+    metrics = Metrics(options.trace_memory)
+    with profiled(options.profile):
+        convert(options, metrics)
+    if options.metrics:
+        metrics.write(options.metrics)
 
 
 if __name__ == "__main__":
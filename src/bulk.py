@@ -0,0 +1,211 @@
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+import bson
+from pymongo import collection as mongo_collection
+
+DEFAULT_BATCH_SIZE = 1000
+DEFAULT_MAX_IN_FLIGHT = 2
+DEFAULT_SIZE_SAMPLE = 100  # Every this many items is encoded to estimate the bytes sent
+
+
+class BulkWriteStats:
+    """Summary of a bulk write.
+
+    Attributes:
+        inserted_ids:   IDs of inserted documents, in the order the documents were given.
+        upserted_ids:   IDs of documents created by upserts, in the order of the operations.
+        modified:       Number of existing documents modified by operations.
+        deleted:        Number of documents deleted by operations.
+        documents:      Number of documents or operations sent.
+        bytes:          Size of the documents sent as BSON, estimated from a sample of them.
+        batches:        Number of batches sent.
+        seconds:        Time taken from first batch to last acknowledgement.
+    """
+    inserted_ids: List
+    upserted_ids: List
+    modified: int
+    deleted: int
+    documents: int
+    bytes: int
+    batches: int
+    seconds: float
+
+    def __init__(self) -> None:
+        """Constructor"""
+        self.inserted_ids = []
+        self.upserted_ids = []
+        self.modified = 0
+        self.deleted = 0
+        self.documents = 0
+        self.bytes = 0
+        self.batches = 0
+        self.seconds = 0.0
+
+    @property
+    def docs_per_second(self) -> float:
+        return self.documents / self.seconds if self.seconds > 0 else 0.0
+
+    @property
+    def bytes_per_second(self) -> float:
+        return self.bytes / self.seconds if self.seconds > 0 else 0.0
+
+
+class BulkWriter:
+    """Inserts documents from an iterable in unordered batches. Only max_in_flight batches
+    are waiting on the database at once, the iterable is not read any further until one of
+    them is acknowledged, so memory is bounded by batch_size * max_in_flight documents.
+
+    Attributes:
+        collection:     Collection to insert into.
+        batch_size:     Number of documents sent per insert_many call.
+        max_in_flight:  Number of batches that can be waiting on the database at once.
+        size_sample:    Only every size_sample-th item is encoded for the byte statistics,
+                        1 sizes every item and 0 none.
+    """
+    collection: mongo_collection.Collection
+    batch_size: int
+    max_in_flight: int
+    size_sample: int
+
+    def __init__(self, collection: mongo_collection.Collection, batch_size: int = DEFAULT_BATCH_SIZE,
+                 max_in_flight: int = DEFAULT_MAX_IN_FLIGHT, size_sample: int = DEFAULT_SIZE_SAMPLE) -> None:
+        """Constructor"""
+        if batch_size < 1 or max_in_flight < 1:
+            raise ValueError("Batch size and max in flight must be at least 1")
+        self.collection = collection
+        self.batch_size = batch_size
+        self.max_in_flight = max_in_flight
+        self.size_sample = size_sample
+
+    def _insert_batch(self, batch: List[Dict]) -> Any:
+        return self.collection.insert_many(batch, ordered=False)
+
+    def _bulk_write_batch(self, batch: List) -> Any:
+        return self.collection.bulk_write(batch, ordered=False)
+
+    def _run(self, items: Iterable, send: Callable[[List], Any], size: Optional[Callable[[Any], int]],
+             stats: BulkWriteStats, progress: Optional[Callable[[int], None]] = None) -> List[Any]:
+        """Send items in batches keeping at most max_in_flight batches waiting. No batch is
+        sent once any batch has failed.
+
+        Arguments:
+            items:      Items to send, can be a generator.
+            send:       Sends a batch and returns the database's result.
+            size:       Size in bytes of an item, None to leave the byte statistics out.
+            stats:      Statistics to add counts to.
+            progress:   Optional, called with the number of leading items acknowledged whenever
+                        it grows. Batches finish out of order, so it only counts items before
+                        the first batch still waiting or failed.
+
+        Throws:
+            Exception:  First error raised by a batch, after waiting for batches already sent.
+        Returns:
+            Result of each batch in the order they were sent.
+        """
+        slots = threading.BoundedSemaphore(self.max_in_flight)
+        failed = threading.Event()
+        futures: List[Future] = []
+        sizes: List[int] = []
+        acknowledged = [0, 0]  # Batches and items acknowledged without a gap
+        start = time.perf_counter()
+
+        def report() -> None:
+            batches, count = acknowledged
+            while batches < len(futures) and futures[batches].done() and futures[batches].exception() is None:
+                count += sizes[batches]
+                batches += 1
+            if count > acknowledged[1] and progress is not None:
+                progress(count)
+            acknowledged[:] = [batches, count]
+
+        def finished(future: Future) -> None:
+            # Flagged before the slot is freed so a submit waiting on the slot sees it
+            if future.exception() is not None:
+                failed.set()
+            slots.release()
+
+        def submit(batch: List) -> bool:
+            slots.acquire()
+            if failed.is_set():
+                slots.release()
+                return False
+            future = executor.submit(send, batch)
+            future.add_done_callback(finished)
+            futures.append(future)
+            sizes.append(len(batch))
+            stats.batches += 1
+            stats.documents += len(batch)
+            return True
+
+        sample = self.size_sample if size is not None else 0
+        sampled, sampled_bytes = 0, 0
+        with ThreadPoolExecutor(max_workers=self.max_in_flight) as executor:
+            batch: List = []
+            for index, item in enumerate(items):
+                if sample > 0 and index % sample == 0:
+                    sampled += 1
+                    sampled_bytes += size(item)
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    if not submit(batch):
+                        break
+                    batch = []
+                    report()
+            else:
+                if len(batch) > 0:
+                    submit(batch)
+        report()
+        if sampled > 0:
+            stats.bytes = round(sampled_bytes * stats.documents / sampled)
+        results = [x.result() for x in futures]
+        stats.seconds = time.perf_counter() - start
+        return results
+
+    def write(self, documents: Iterable[Dict], progress: Optional[Callable[[int], None]] = None) -> BulkWriteStats:
+        """Insert all documents.
+
+        Arguments:
+            documents:  Documents to insert, can be a generator.
+            progress:   Optional, called with the number of leading documents the database has
+                        acknowledged as it grows, for resuming a write that fails part way.
+
+        Throws:
+            Exception:  First error raised by a batch, after waiting for batches already sent.
+        Returns:
+            Statistics of the write including the inserted IDs.
+        """
+        stats = BulkWriteStats()
+        for result in self._run(documents, self._insert_batch, lambda x: len(bson.encode(x)), stats, progress):
+            stats.inserted_ids.extend(result.inserted_ids)
+        logging.info(f"Inserted {stats.documents} documents in {stats.batches} batches, "
+                     f"{stats.docs_per_second:.0f} docs/s {stats.bytes_per_second / 1e6:.2f} MB/s")
+        return stats
+
+    def write_operations(self, operations: Iterable, size: Optional[Callable[[Any], int]] = None,
+                         progress: Optional[Callable[[int], None]] = None) -> BulkWriteStats:
+        """Send write operations such as ReplaceOne or DeleteMany with unordered bulk writes.
+
+        Arguments:
+            operations: pymongo write operations, can be a generator.
+            size:       Optional, size in bytes of an operation for throughput figures, sampled
+                        like the documents of write.
+            progress:   Optional, called with the number of leading operations acknowledged as
+                        it grows, as for write.
+
+        Throws:
+            Exception:  First error raised by a batch, after waiting for batches already sent.
+        Returns:
+            Statistics of the write including upserted IDs.
+        """
+        stats = BulkWriteStats()
+        for result in self._run(operations, self._bulk_write_batch, size, stats, progress):
+            stats.upserted_ids.extend(result.upserted_ids[x] for x in sorted(result.upserted_ids))
+            stats.modified += result.modified_count
+            stats.deleted += result.deleted_count
+        logging.info(f"Sent {stats.documents} operations in {stats.batches} batches, "
+                     f"{stats.docs_per_second:.0f} ops/s {stats.bytes_per_second / 1e6:.2f} MB/s")
+        return stats
@@ -0,0 +1,101 @@
+import json
+import os
+import tempfile
+import threading
+from typing import Dict, Optional
+
+INDEX_FILE = "index.json"
+
+
+class CacheEntry:
+    """What is known about the last download of a url.
+
+    Attributes:
+        sha256:         SHA-256 hex digest of the downloaded content.
+        etag:           ETag header the server sent with it, blank if none.
+        last_modified:  Last-Modified header the server sent with it, blank if none.
+    """
+    sha256: str
+    etag: str
+    last_modified: str
+
+    def __init__(self, sha256: str = "", etag: str = "", last_modified: str = "") -> None:
+        """Constructor"""
+        self.sha256 = sha256
+        self.etag = etag
+        self.last_modified = last_modified
+
+
+class DownloadCache:
+    """Persistent on disk cache of downloads keyed by url. An index file maps each url to
+    the SHA-256 digest and HTTP validators of its most recent download, so change
+    detection survives restarts. The content itself is not kept, an unchanged url is
+    never read again.
+
+    Attributes:
+        directory:  Directory holding the index.
+        entries:    Mapping of url to its cache entry.
+    """
+    directory: str
+    entries: Dict[str, CacheEntry]
+
+    def __init__(self, directory: str) -> None:
+        """Constructor, loads the index if the directory already has one."""
+        self.directory = directory
+        self.entries = {}
+        self._lock = threading.RLock()  # Downloads running in threads share the index
+        os.makedirs(directory, exist_ok=True)
+        index_path = os.path.join(directory, INDEX_FILE)
+        if os.path.exists(index_path):
+            with open(index_path, 'r', encoding="utf-8") as f:
+                for url, entry in json.load(f).items():
+                    self.entries[url] = CacheEntry(**entry)
+
+    def get(self, url: str) -> Optional[CacheEntry]:
+        return self.entries.get(url)
+
+    def conditional_headers(self, url: str) -> Dict[str, str]:
+        """Headers asking the server to only send content if it changed since the cached download.
+
+        Arguments:
+            url:    Url about to be requested.
+
+        Returns:
+            If-None-Match and If-Modified-Since headers, empty if nothing is cached.
+        """
+        entry = self.get(url)
+        headers = {}
+        if entry is None:
+            return headers
+        if entry.etag:
+            headers["If-None-Match"] = entry.etag
+        if entry.last_modified:
+            headers["If-Modified-Since"] = entry.last_modified
+        return headers
+
+    def put_entry(self, url: str, entry: CacheEntry) -> CacheEntry:
+        """Record the digest and validators of a url's latest download and save the index.
+
+        Arguments:
+            url:    Url the entry is for.
+            entry:  Entry to record.
+
+        Returns:
+            The entry given.
+        """
+        with self._lock:
+            self.entries[url] = entry
+            self.save()
+        return entry
+
+    def save(self) -> None:
+        """Write the index to disk."""
+        with self._lock:
+            index = {url: entry.__dict__ for url, entry in self.entries.items()}
+            self._write_atomic(os.path.join(self.directory, INDEX_FILE), json.dumps(index).encode("utf-8"))
+
+    def _write_atomic(self, path: str, content: bytes) -> None:
+        handle, temp_path = tempfile.mkstemp(dir=self.directory)
+        with os.fdopen(handle, 'wb') as f:
+            f.write(content)
+        os.replace(temp_path, path)
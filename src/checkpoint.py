@@ -0,0 +1,77 @@
+import json
+import logging
+import os
+import tempfile
+from typing import Dict, Optional
+
+
+class CheckpointStore:
+    """Progress of loading each feed, kept in a json file so a load that fails part way
+    resumes where it stopped when run again rather than starting over. For each feed it
+    holds the stages completed and, while documents are being inserted, how many leading
+    documents the database has acknowledged. A feed's state is cleared once it is loaded.
+
+    Attributes:
+        path:   File the state is saved to, None to only keep it in memory.
+        feeds:  Mapping of feed to {"stages": [completed stage names], "offset": documents acknowledged,
+                "details": {stage: what a later run needs to know about it}}.
+    """
+    path: Optional[str]
+    feeds: Dict[str, Dict]
+
+    def __init__(self, path: Optional[str]) -> None:
+        """Constructor, loads the file if it exists."""
+        self.path = path
+        self.feeds = {}
+        if path is not None and os.path.exists(path):
+            with open(path, 'r', encoding="utf-8") as f:
+                self.feeds = json.load(f)
+
+    def done(self, feed: str, stage: str) -> bool:
+        """Whether a stage of a feed completed in an earlier run."""
+        return stage in self.feeds.get(feed, {}).get("stages", [])
+
+    def complete(self, feed: str, stage: str, details: Optional[Dict] = None):
+        """Record a stage of a feed as completed and save the file.
+
+        Arguments:
+            feed:       Feed the stage belongs to.
+            stage:      Name of the stage.
+            details:    Optional, json serialisable facts about the stage for a later run.
+        """
+        state = self.feeds.setdefault(feed, {"stages": []})
+        if stage not in state["stages"]:
+            state["stages"].append(stage)
+        if details is not None:
+            state.setdefault("details", {})[stage] = details
+        self._save()
+
+    def details(self, feed: str, stage: str) -> Optional[Dict]:
+        """Details recorded when a stage of a feed completed, None if there were none."""
+        return self.feeds.get(feed, {}).get("details", {}).get(stage)
+
+    def offset(self, feed: str) -> Optional[int]:
+        """Number of leading documents of a feed the database acknowledged before the last
+        insert stopped, None if no insert of the feed was started."""
+        return self.feeds.get(feed, {}).get("offset")
+
+    def set_offset(self, feed: str, offset: int):
+        """Record how many leading documents of a feed the database has acknowledged and save the file."""
+        self.feeds.setdefault(feed, {"stages": []})["offset"] = offset
+        self._save()
+
+    def clear(self, feed: str):
+        """Forget a feed's progress once it is completely loaded and save the file."""
+        if self.feeds.pop(feed, None) is not None:
+            logging.debug(f"Cleared checkpoint of {feed}")
+            self._save()
+
+    def _save(self):
+        # Written to a temporary file and moved over the old one so a crash never leaves half a file
+        if self.path is None:
+            return
+        directory = os.path.dirname(os.path.abspath(self.path))
+        handle, temp_path = tempfile.mkstemp(dir=directory)
+        with os.fdopen(handle, 'w', encoding="utf-8") as f:
+            json.dump(self.feeds, f)
+        os.replace(temp_path, self.path)
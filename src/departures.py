@@ -0,0 +1,123 @@
+import logging
+from operator import itemgetter
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from pymongo import ASCENDING
+from pymongo import database
+from .bulk import DEFAULT_BATCH_SIZE
+from .fingerprint import FEED_FIELD
+from .gtfs import MISSING_TIME, Route, StopTime, Trip, parse_gtfs_time, to_dict
+from .staging import StagedCollection
+
+STOP_ROUTES_COLLECTION = "stop_routes"
+DEPARTURES_COLLECTION = "stop_departures"
+NO_PICKUP = "1"  # GTFS pickup_type of stops passengers cannot board at
+
+
+def build_stop_indexes(stop_times: Iterable[StopTime], trips: List[Trip],
+                       routes: List[Route]) -> Tuple[List[Dict], Iterator[Dict]]:
+    """Build the stop centric views of a feed, which routes serve each stop and the
+    departures from each stop. Stop times are only read once so they can be streamed
+    straight from file. Departures have to be sorted so they are all kept, but as a
+    tuple of the few fields that differ from their trip's, their documents are only
+    built as they are read from the iterator returned.
+
+    A stop time is a departure unless it is the last stop of its trip, has no departure
+    time or does not allow pickups. Stop times without a stop_sequence are never taken
+    as the last stop of their trip.
+
+    Parameters:
+        stop_times: Stop times, a list, columns or an iterator.
+        trips:      List of trips.
+        routes:     List of routes.
+
+    Returns:
+        Stop to routes documents {"stop_id": stop_id, "routes": [route, ...]} sorted by stop
+        and route, and an iterator of departure documents sorted by stop then departure time.
+    """
+    trips_by_id = {x.trip_id: x for x in trips}
+    routes_by_id = {x.route_id: x for x in routes}
+    route_ids: Dict[str, set] = {}
+    # (stop_id, departure_seconds, trip_id, stop_sequence, departure_time, stop_headsign)
+    departures: List[Tuple] = []
+    last_stop: Dict[str, int] = {}
+    for stop_time in stop_times:
+        trip = trips_by_id.get(stop_time.trip_id)
+        if trip is None:
+            logging.warning(f"Trip id {stop_time.trip_id} not present in trips file")
+            continue
+        route_ids.setdefault(stop_time.stop_id, set()).add(trip.route_id)
+        sequence = _sequence(stop_time.stop_sequence)
+        if sequence is not None and sequence > last_stop.get(trip.trip_id, sequence - 1):
+            last_stop[trip.trip_id] = sequence
+        seconds = parse_gtfs_time(stop_time.departure_time)
+        if seconds == MISSING_TIME or stop_time.pickup_type == NO_PICKUP:
+            continue
+        departures.append((stop_time.stop_id, seconds, trip.trip_id, sequence, stop_time.departure_time,
+                           stop_time.stop_headsign or None))
+    departures = [x for x in departures if x[3] is None or x[3] != last_stop[x[2]]]
+    departures.sort(key=itemgetter(0, 1, 2))
+
+    stop_routes = []
+    for stop_id in sorted(route_ids):
+        served = [to_dict(routes_by_id[x]) if x in routes_by_id else {"route_id": x} for x in sorted(route_ids[stop_id])]
+        stop_routes.append({"stop_id": stop_id, "routes": served})
+    return stop_routes, _departure_documents(departures, trips_by_id)
+
+
+def _sequence(value) -> Optional[int]:
+    """A stop_sequence as a number, None when it is blank."""
+    if value is None or str(value).strip() == "":
+        return None
+    return int(value)
+
+
+def _departure_documents(departures: List[Tuple], trips_by_id: Dict[str, Trip]) -> Iterator[Dict]:
+    """Departure documents from the tuples kept by build_stop_indexes, in their order."""
+    for stop_id, seconds, trip_id, sequence, departure_time, headsign in departures:
+        trip = trips_by_id[trip_id]
+        yield {"stop_id": stop_id, "departure_time": departure_time, "departure_seconds": seconds,
+               "trip_id": trip_id, "route_id": trip.route_id, "service_id": trip.service_id,
+               "stop_sequence": sequence, "headsign": headsign or trip.trip_headsign}
+
+
+def insert_stop_indexes(mongo_db: database.Database, stop_routes: Iterable[Dict], departures: Iterable[Dict],
+                        feed: str, batch_size: int = DEFAULT_BATCH_SIZE):
+    """Replace a feed's stop to routes and departure documents and make sure the collections
+    are indexed for looking them up by stop, departures in time order. Each collection is
+    loaded beside the live one with the other feeds' documents carried over and swapped in
+    whole, so readers never see a feed without its documents.
+
+    Parameters:
+        mongo_db:       Mongo database.
+        stop_routes:    Stop to routes documents from build_stop_indexes.
+        departures:     Departure documents from build_stop_indexes.
+        feed:           Name of the feed the documents are tagged with.
+        batch_size:     Optional, number of documents to send to the database at a time.
+
+    Throws:
+        StagingError:   When a staged collection is missing documents or has too few compared to
+                        the live one, which is then left as it was.
+    Returns:
+        Number of stop to routes and departure documents inserted.
+    """
+    counts = []
+    for name, documents, keys in ((STOP_ROUTES_COLLECTION, stop_routes, [("stop_id", ASCENDING)]),
+                                  (DEPARTURES_COLLECTION, departures,
+                                   [("stop_id", ASCENDING), ("departure_seconds", ASCENDING)])):
+        staged = StagedCollection(mongo_db, name, batch_size)
+        try:
+            staged.carry_over({FEED_FIELD: {"$ne": feed}})
+            count = staged.write({FEED_FIELD: feed} | x for x in documents).documents
+            logging.info(f"Inserted {count} documents to {staged.staging_name}")
+            if staged.expected > 0:
+                staged.swap([keys])
+            else:
+                # Nothing to swap in, the feed was all the collection held
+                staged.abort()
+                mongo_db[name].delete_many({FEED_FIELD: feed})
+        except Exception:
+            staged.abort()
+            raise
+        counts.append(count)
+    return tuple(counts)
@@ -1,28 +1,106 @@
-import io
+import hashlib
 import logging
-from typing import Dict
+import tempfile
+from typing import BinaryIO, Dict, Optional, Tuple, Union
 import os
 import requests
 import zipfile
+from .cache import CacheEntry, DownloadCache
+
+NOT_MODIFIED = 304
+CHUNK_SIZE = 1 << 20  # Bytes read from the response at a time
+DEFAULT_TIMEOUT = (10, 60)  # Seconds to connect and to wait between bytes of the response
+
+
+class DownloadError(Exception):
+    """Raised when a url answers with an error status.
+
+    Attributes:
+        url:            Url requested.
+        status_code:    HTTP status of the response.
+    """
+    url: str
+    status_code: int
+
+    def __init__(self, url: str, status_code: int) -> None:
+        super().__init__(f"Got invalid response {status_code} from url {url}")
+        self.url = url
+        self.status_code = status_code
+
+
+def stream_to_file(resp: requests.Response, destination: BinaryIO) -> str:
+    """Write the body of a streamed response to a file chunk by chunk, hashing it on the way.
+
+    Arguments:
+        resp:           Response requested with stream=True.
+        destination:    Binary file to write the body to.
+
+    Returns:
+        SHA-256 hex digest of the body.
+    """
+    digest = hashlib.sha256()
+    for chunk in resp.iter_content(chunk_size=CHUNK_SIZE):
+        digest.update(chunk)
+        destination.write(chunk)
+    destination.flush()
+    return digest.hexdigest()
+
 
 class DownloadService:
     """The purpose of this service is to allow for conditional download of certain files.
     It will store list of urls it has previously visited.
 
+    A changed download is only remembered once commit is called for its url, after the
+    caller has used it, so a download whose upload fails counts as changed next time.
+
     Attributes:
-        url_to_hash:    Dictionary mapping url to its most recent hashed content.
+        url_to_hash:    Dictionary mapping url to the SHA-256 of its most recent committed content.
+        pending:        Mapping of url to the SHA-256 and validators of a changed download not yet
+                        committed.
+        cache:          Optional, on disk cache so previous downloads are remembered across
+                        restarts and unchanged urls are requested conditionally.
+        session:        Optional, session to make requests with so connections are reused.
+        timeout:        Seconds to wait to connect and between bytes of a response.
     """
-    url_to_hash: Dict[str, int]
+    url_to_hash: Dict[str, str]
+    pending: Dict[str, CacheEntry]
+    cache: Optional[DownloadCache]
+    session: Optional[requests.Session]
+    timeout: Union[float, Tuple[float, float]]
 
-    def __init__(self) -> None:
+    def __init__(self, cache: Optional[DownloadCache] = None, session: Optional[requests.Session] = None,
+                 timeout: Union[float, Tuple[float, float]] = DEFAULT_TIMEOUT) -> None:
         self.url_to_hash = {}
+        self.pending = {}
+        self.cache = cache
+        self.session = session
+        self.timeout = timeout
 
     def clear_dict(self):
         self.url_to_hash.clear()
+        self.pending.clear()
+
+    def commit(self, url: str, entry: Optional[CacheEntry] = None):
+        """Remember a changed download as the latest content of its url, once it has been
+        used. Nothing happens if the url has no download waiting to be committed.
+
+        Arguments:
+            url:    Url downloaded.
+            entry:  Optional, SHA-256 and validators to commit instead of the pending ones,
+                    for a download made by an earlier run.
+        """
+        pending = self.pending.pop(url, None)
+        entry = entry if entry is not None else pending
+        if entry is None:
+            return
+        self.url_to_hash[url] = entry.sha256
+        if self.cache is not None:
+            self.cache.put_entry(url, entry)
 
     @staticmethod
     def download_GTFS_zip(zip_url: str):
-        """Download a GTFS zip file at the specified url.
+        """Download a GTFS zip file at the specified url. The zip is written to
+        a temporary file rather than held in memory.
 
         Arguments:
             zip_url:    Url where the zipped folder is.
@@ -33,7 +111,9 @@ class DownloadService:
         if not resp.ok:
             logging.error(f"Got invalid response {resp.status_code} from url {zip_url}")
             return None
-        return zipfile.ZipFile(io.BytesIO(resp.content))
+        temp_file = tempfile.TemporaryFile()
+        stream_to_file(resp, temp_file)
+        return zipfile.ZipFile(temp_file)
 
     @staticmethod
     def get_GTFS_files(zip_url: str, directory: str = ".\\GTFS") -> bool:
@@ -57,35 +137,102 @@ class DownloadService:
         zip_file.close()
         return True
 
+    def fetch_if_diff(self, zip_url: str, destination: BinaryIO, force: bool = False) -> bool:
+        """Stream the content of a url into a file but only if it is different to
+        a previous download. The content is hashed as it is written then compared
+        to a previous hash if it exists. The new hash and validators are kept in
+        pending until commit is called for the url.
+        With a cache the request is conditional, so an unchanged url answers with
+        304 Not Modified and no content is downloaded at all.
+
+        Arguments:
+            zip_url:        Url where the zipped folder is.
+            destination:    Binary file to write the content to.
+            force:          Optional, download and report the content as changed even if it
+                            is the same as before, for content that has to be used again.
+
+        Returns:
+            True if the content differs and was written to destination otherwise False
+
+        Throws:
+            DownloadError:  If the response returns a not OK result.
+        """
+        headers = self.cache.conditional_headers(zip_url) if self.cache is not None and not force else {}
+        resp = (self.session or requests).get(zip_url, stream=True, headers=headers, timeout=self.timeout)
+        if resp.status_code == NOT_MODIFIED:
+            logging.info(f"Server reports no changes to {zip_url} not redownloading it")
+            return False
+        if not resp.ok:
+            error = DownloadError(zip_url, resp.status_code)
+            logging.error(str(error))
+            raise error
+        original: Optional[str] = self.url_to_hash.get(zip_url)
+        if original is None and self.cache is not None and self.cache.get(zip_url) is not None:
+            original = self.cache.get(zip_url).sha256
+        new_hash = stream_to_file(resp, destination)
+        entry = CacheEntry(new_hash, resp.headers.get("ETag") or "", resp.headers.get("Last-Modified") or "")
+        if new_hash == original and not force:
+            # Content that was already used, only the validators can be newer
+            self.commit(zip_url, entry)
+            logging.info("No changes to content not redownloading it")
+            return False
+        self.pending[zip_url] = entry
+        destination.seek(0)
+        return True
+
     def get_if_diff(self, zip_url: str):
         """Get the Zip file from a given url but only if it is different to
         a previous download. It will get content from url, hash the content
         then compare it to a previous hash if it exists. If it has no previous hash
         or the hashes differ then it returns a zipfile.
+        The content is streamed to a temporary file rather than held in memory.
 
         Arguments:
             zip_url:    Url where the zipped folder is.
 
         Returns:
-            Zipfile if it differs otherwise None value
+            Zipfile if it differs otherwise None value, commit the url once it is used
         
         Throws:
             Exception:  If the response returns a not OK result. 
         """
-        resp = requests.get(zip_url, stream=True)
-        if not resp.ok:
-            error_str = f"Got invalid response {resp.status_code} from url {zip_url}"
-            logging.error(error_str)
-            raise Exception(error_str)
-        original: int = None
-        if zip_url in self.url_to_hash:
-            original = self.url_to_hash[zip_url]
-        new_hash = hash(resp.content)
-        if new_hash == original:
-            logging.info("No changes to content not redownloading it")
-            return None
-        self.url_to_hash[zip_url] = new_hash
-        return zipfile.ZipFile(io.BytesIO(resp.content))
+        temp_file = tempfile.TemporaryFile()
+        try:
+            if not self.fetch_if_diff(zip_url, temp_file):
+                temp_file.close()
+                return None
+            return zipfile.ZipFile(temp_file)
+        except Exception:
+            temp_file.close()
+            raise
+
+    def download_if_diff(self, zip_url: str, path: str, force: bool = False) -> bool:
+        """Download the zip file from a given url to a path but only if it is
+        different to a previous download.
+
+        Arguments:
+            zip_url:    Url where the zipped folder is.
+            path:       Path to save the zip file to.
+            force:      Optional, save it even if it is unchanged, see fetch_if_diff.
+
+        Returns:
+            True if it differs and was saved to path otherwise False, commit the url once
+            the zip is used
+
+        Throws:
+            Exception:  If the response returns a not OK result.
+        """
+        directory = os.path.dirname(os.path.abspath(path))
+        temp_file = tempfile.NamedTemporaryFile("w+b", dir=directory, delete=False)
+        try:
+            with temp_file:
+                changed = self.fetch_if_diff(zip_url, temp_file, force)
+            if changed:
+                os.replace(temp_file.name, path)
+            return changed
+        finally:
+            if os.path.exists(temp_file.name):
+                os.remove(temp_file.name)
 
     def extract_if_diff(self, zip_url: str, directory: str = os.path.join(os.curdir, "GTFS")) -> bool:
         """Download and extract the GTFS files from a zip file at the
@@ -105,4 +252,5 @@ class DownloadService:
         zip_file.extractall(directory)
         logging.debug("Finished extracting zip file")
         zip_file.close()
-        return True
\ No newline at end of file
+        self.commit(zip_url)
+        return True
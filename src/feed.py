@@ -0,0 +1,130 @@
+import os
+import tempfile
+import zipfile
+from typing import Any, Callable, Dict, Iterator, List, Optional, Union
+
+from .gtfs import FILE_TO_OBJECT_MAPPINGS, FILE_TO_PARAMETER_NAME, StopTimeColumns, iter_gtfs_from_file, \
+    load_gtfs_from_file, load_stop_times_columns
+from .metrics import Metrics
+from .parallel import load_gtfs_parallel
+
+PARAMETER_NAME_TO_FILE = {v: k for k, v in FILE_TO_PARAMETER_NAME.items()}
+
+
+def load_stop_times_parallel(source: Union[str, zipfile.ZipFile], processes: int) -> StopTimeColumns:
+    """Parse stop_times.txt with a pool of processes. Workers need to seek into the file,
+    so when reading from a zip only that member is extracted to a temporary directory.
+
+    Parameters:
+        source:     Directory the GTFS files were extracted into or the GTFS zip file itself
+        processes:  Number of processes to parse with
+
+    Returns:
+        Stop times as typed columns
+    """
+    if not isinstance(source, zipfile.ZipFile):
+        return load_gtfs_parallel(os.path.join(source, "stop_times.txt"), StopTimeColumns, processes)
+    with tempfile.TemporaryDirectory() as directory:
+        return load_gtfs_parallel(source.extract("stop_times.txt", directory), StopTimeColumns, processes)
+
+
+class Feed:
+    """GTFS feed whose files are only parsed the first time they are used, so a job that
+    needs stops and routes never reads stop_times.txt. Files are looked up by the same
+    names FILE_TO_PARAMETER_NAME gives, i.e. feed["stop_times"].
+
+    Attributes:
+        source:     Directory holding the GTFS files or the GTFS zip file itself, None if
+                    every file comes from loaders.
+        columns:    Mapping of name to the only fields to convert when loading it.
+        columnar:   Load stop times into typed columns to save memory.
+        processes:  Parse stop times into typed columns with this many processes.
+        loaders:    Mapping of name to a function loading it, used instead of parsing the file.
+        metrics:    Records a parse stage for every file loaded.
+    """
+    source: Optional[Union[str, zipfile.ZipFile]]
+    columns: Dict[str, List[str]]
+    columnar: bool
+    processes: Optional[int]
+    loaders: Dict[str, Callable[[], Any]]
+    metrics: Metrics
+
+    def __init__(self, source: Optional[Union[str, zipfile.ZipFile]], columns: Optional[Dict[str, List[str]]] = None,
+                 columnar: bool = False, processes: Optional[int] = None,
+                 loaders: Optional[Dict[str, Callable[[], Any]]] = None, metrics: Optional[Metrics] = None) -> None:
+        """Constructor, nothing is read until a file is used."""
+        self.source = source
+        self.columns = columns or {}
+        self.columnar = columnar
+        self.processes = processes
+        self.loaders = loaders or {}
+        self.metrics = metrics if metrics is not None else Metrics()
+        self._loaded: Dict[str, Any] = {}
+        self._files: Optional[List[str]] = None
+
+    @property
+    def zip_file(self) -> Optional[zipfile.ZipFile]:
+        return self.source if isinstance(self.source, zipfile.ZipFile) else None
+
+    @property
+    def files(self) -> List[str]:
+        """Names of the files in the feed."""
+        if self.source is None:
+            return []
+        if self._files is None:
+            self._files = self.zip_file.namelist() if self.zip_file is not None else sorted(os.listdir(self.source))
+        return self._files
+
+    def path(self, filename: str) -> str:
+        """Path of a file to open, the member name if reading from a zip."""
+        return filename if self.zip_file is not None else os.path.join(self.source, filename)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.loaders or PARAMETER_NAME_TO_FILE.get(name) in self.files
+
+    def __getitem__(self, name: str) -> Any:
+        """Records of a file, parsed and kept on first use.
+
+        Throws:
+            KeyError:   When the feed has no such file.
+        """
+        if name not in self._loaded:
+            if name not in self:
+                raise KeyError(f"Feed has no {PARAMETER_NAME_TO_FILE.get(name, name)}")
+            self._loaded[name] = self._load(name)
+        return self._loaded[name]
+
+    def get(self, name: str, default: Any = None) -> Any:
+        return self[name] if name in self else default
+
+    def _load(self, name: str) -> Any:
+        filename = PARAMETER_NAME_TO_FILE.get(name, name)
+        with self.metrics.stage("parse", file=filename) as stage:
+            if name in self.loaders:
+                loaded = self.loaders[name]()
+            elif self.processes and name == "stop_times":
+                loaded = load_stop_times_parallel(self.source, self.processes)
+            elif self.columnar and name == "stop_times":
+                loaded = load_stop_times_columns(self.path(filename), self.zip_file)
+            else:
+                loaded = load_gtfs_from_file(self.path(filename), FILE_TO_OBJECT_MAPPINGS[filename], self.zip_file,
+                                             self.columns.get(name))
+            stage.rows = len(loaded)
+        return loaded
+
+    def iter(self, name: str) -> Iterator[Any]:
+        """Records of a file one at a time, read straight from the file unless already loaded."""
+        if name in self._loaded or name in self.loaders:
+            return iter(self[name])
+        filename = PARAMETER_NAME_TO_FILE[name]
+        return iter_gtfs_from_file(self.path(filename), FILE_TO_OBJECT_MAPPINGS[filename], self.zip_file,
+                                   self.columns.get(name))
+
+    @property
+    def loaded(self) -> Dict[str, Any]:
+        """Mapping of name to records of the files loaded so far."""
+        return dict(self._loaded)
+
+    def clear(self):
+        """Drop every loaded file."""
+        self._loaded.clear()
@@ -0,0 +1,148 @@
+import asyncio
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from .download import DownloadError, DownloadService
+
+DEFAULT_CONCURRENCY = 8  # Downloads running at once across every host
+DEFAULT_PER_HOST = 2  # Downloads running at once from a single host
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 0.5  # Seconds before the first retry, doubled for each one after
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class FetchResult:
+    """Outcome of fetching one url.
+
+    Attributes:
+        url:        Url fetched.
+        path:       Path the content was saved to.
+        changed:    Whether the content differed from the previous download and was saved.
+        seconds:    Wall clock time taken including retries.
+        attempts:   Number of requests made.
+        bytes:      Size of the saved content, 0 if unchanged.
+        error:      Message of the error that stopped the download, None if it succeeded.
+    """
+    url: str
+    path: str
+    changed: bool
+    seconds: float
+    attempts: int
+    bytes: int
+    error: Optional[str]
+
+    def __init__(self, url: str, path: str) -> None:
+        self.url = url
+        self.path = path
+        self.changed = False
+        self.seconds = 0.0
+        self.attempts = 0
+        self.bytes = 0
+        self.error = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def is_retryable(err: Exception) -> bool:
+    """Whether a failed download is worth trying again, connection problems, timeouts and
+    statuses a server returns when it is briefly unavailable."""
+    if isinstance(err, DownloadError):
+        return err.status_code in RETRY_STATUSES
+    return isinstance(err, (requests.ConnectionError, requests.Timeout))
+
+
+def pooled_session(pool_size: int) -> requests.Session:
+    """Session keeping up to pool_size connections open per host so they are reused."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+class AsyncFetcher:
+    """Downloads many urls at once with asyncio. Each download goes through the download
+    service, so content streams to disk, is compared with the previous download and uses
+    its cache, on a thread of a shared pool while the event loop schedules them, limits how
+    many run against each host and retries failures with exponential backoff. Changed
+    downloads are only remembered once committed through the download service.
+
+    Attributes:
+        download_service:   Service the downloads go through, given a pooled session if it has none.
+        max_concurrency:    Most downloads running at once.
+        per_host:           Most downloads running at once against a single host.
+        retries:            Times a failed download is retried if the error is retryable.
+        backoff:            Seconds to wait before the first retry, doubled for each one after.
+    """
+    download_service: DownloadService
+    max_concurrency: int
+    per_host: int
+    retries: int
+    backoff: float
+
+    def __init__(self, download_service: Optional[DownloadService] = None, max_concurrency: int = DEFAULT_CONCURRENCY,
+                 per_host: int = DEFAULT_PER_HOST, retries: int = DEFAULT_RETRIES,
+                 backoff: float = DEFAULT_BACKOFF) -> None:
+        self.download_service = download_service if download_service is not None else DownloadService()
+        if self.download_service.session is None:
+            self.download_service.session = pooled_session(max_concurrency)
+        self.max_concurrency = max_concurrency
+        self.per_host = per_host
+        self.retries = retries
+        self.backoff = backoff
+
+    async def _fetch(self, url: str, path: str, executor: ThreadPoolExecutor,
+                     host_limits: Dict[str, asyncio.Semaphore]) -> FetchResult:
+        result = FetchResult(url, path)
+        limit = host_limits.setdefault(urlsplit(url).netloc, asyncio.Semaphore(self.per_host))
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        while True:
+            result.attempts += 1
+            try:
+                # Only hold the host's slot while downloading, not while backing off
+                async with limit:
+                    result.changed = await loop.run_in_executor(executor, self.download_service.download_if_diff,
+                                                                url, path)
+                result.error = None
+                break
+            except Exception as err:
+                result.error = str(err)
+                if result.attempts > self.retries or not is_retryable(err):
+                    logging.error(f"Failed to download {url} after {result.attempts} attempts: {err}")
+                    break
+                delay = self.backoff * 2 ** (result.attempts - 1)
+                logging.warning(f"Retrying {url} in {delay:.1f}s after: {err}")
+                await asyncio.sleep(delay)
+        result.seconds = time.perf_counter() - start
+        if result.changed:
+            result.bytes = os.path.getsize(path)
+        logging.info(f"Fetched {url} in {result.seconds:.2f}s, {result.bytes} bytes, "
+                     f"{'changed' if result.changed else 'unchanged'}")
+        return result
+
+    async def fetch_all(self, targets: List[Tuple[str, str]]) -> List[FetchResult]:
+        """Download every url to its path at once. A failed download does not stop the others.
+
+        Arguments:
+            targets:    Url and path to save it to for each download.
+
+        Returns:
+            Result of each download in the order given.
+        """
+        host_limits: Dict[str, asyncio.Semaphore] = {}
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            return list(await asyncio.gather(*[self._fetch(url, path, executor, host_limits)
+                                               for url, path in targets]))
+
+    def run(self, targets: List[Tuple[str, str]]) -> List[FetchResult]:
+        """fetch_all from synchronous code, runs its own event loop."""
+        return asyncio.run(self.fetch_all(targets))
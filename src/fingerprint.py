@@ -0,0 +1,123 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import bson
+from pymongo import DeleteMany, ReplaceOne
+from pymongo import collection as mongo_collection
+from .bulk import BulkWriter, BulkWriteStats, DEFAULT_BATCH_SIZE
+
+FEED_FIELD = "feed"  # Field of uploaded documents naming the feed they came from
+
+
+def fingerprint(document: Dict) -> str:
+    """Content fingerprint of a connected trip document. It covers everything that is
+    written, so any change to the trip, its stop times, route or calendar changes it.
+
+    Arguments:
+        document:   Connected trip document.
+
+    Returns:
+        SHA-256 hex digest of the document's canonical json.
+    """
+    content = json.dumps(document, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+class FingerprintStore:
+    """Fingerprints of the trips uploaded from each feed, kept in a json file between runs.
+
+    Attributes:
+        path:   File the fingerprints are saved to.
+        feeds:  Mapping of feed to a mapping of trip_id to fingerprint.
+    """
+    path: str
+    feeds: Dict[str, Dict[str, str]]
+
+    def __init__(self, path: str) -> None:
+        """Constructor, loads the file if it exists."""
+        self.path = path
+        self.feeds = {}
+        self._lock = threading.Lock()  # Feeds synced from threads share the file
+        if os.path.exists(path):
+            with open(path, 'r', encoding="utf-8") as f:
+                self.feeds = json.load(f)
+
+    def get(self, feed: str) -> Dict[str, str]:
+        return self.feeds.get(feed, {})
+
+    def update(self, feed: str, fingerprints: Dict[str, str]) -> None:
+        """Replace the fingerprints of a feed and save the file."""
+        with self._lock:
+            self.feeds[feed] = fingerprints
+            directory = os.path.dirname(os.path.abspath(self.path))
+            handle, temp_path = tempfile.mkstemp(dir=directory)
+            with os.fdopen(handle, 'w', encoding="utf-8") as f:
+                json.dump(self.feeds, f)
+            os.replace(temp_path, self.path)
+
+
+def diff_documents(documents: Iterable[Dict], previous: Dict[str, str],
+                   fingerprints: Dict[str, str]) -> Iterator[Dict]:
+    """Yield only the documents whose trip is new or changed since the previous fingerprints.
+
+    Arguments:
+        documents:      Connected trip documents, each with a trip_id.
+        previous:       Mapping of trip_id to fingerprint from the last upload.
+        fingerprints:   Filled with the trip_id to fingerprint of every document given.
+
+    Returns:
+        Iterator of new or changed documents.
+    """
+    for document in documents:
+        trip_id = document["trip_id"]
+        value = fingerprint(document)
+        fingerprints[trip_id] = value
+        if previous.get(trip_id) != value:
+            yield document
+
+
+def sync_documents(collection: mongo_collection.Collection, documents: Iterable[Dict], feed: str,
+                   store: FingerprintStore, batch_size: int = DEFAULT_BATCH_SIZE) -> BulkWriteStats:
+    """Bring the documents of a feed in a collection up to date with only the writes
+    needed. New or changed trips are upserted, trips no longer in the feed are deleted
+    and unchanged trips are not touched. Fingerprints are saved once the writes succeed.
+
+    Arguments:
+        collection:     Collection holding the feed's documents.
+        documents:      Connected trip documents of the feed, can be a generator.
+        feed:           Name of the feed, stored in each document to tell feeds apart.
+        store:          Fingerprints of the previous upload.
+        batch_size:     Optional, number of operations to send at a time.
+
+    Returns:
+        Statistics of the writes.
+    """
+    previous = store.get(feed)
+    fingerprints: Dict[str, str] = {}
+    # The writer sizes each operation as soon as it is yielded, from the document it replaces
+    current: List[Optional[Dict]] = [None]
+
+    def operations() -> Iterator:
+        for document in diff_documents(documents, previous, fingerprints):
+            document[FEED_FIELD] = feed
+            current[0] = document
+            yield ReplaceOne({FEED_FIELD: feed, "trip_id": document["trip_id"]}, document, upsert=True)
+        current[0] = None
+        vanished: List[str] = [x for x in previous if x not in fingerprints]
+        for start in range(0, len(vanished), batch_size):
+            yield DeleteMany({FEED_FIELD: feed, "trip_id": {"$in": vanished[start:start + batch_size]}})
+
+    def size(_) -> int:
+        return len(bson.encode(current[0])) if current[0] is not None else 0
+
+    stats = BulkWriter(collection, batch_size).write_operations(operations(), size)
+    store.update(feed, fingerprints)
+    logging.info(f"Synced {feed}: {len(stats.upserted_ids)} new, {stats.modified} changed, "
+                 f"{stats.deleted} deleted, {len(fingerprints) - stats.modified - len(stats.upserted_ids)} unchanged")
+    return stats
+
@@ -1,6 +1,11 @@
 import csv
+import io
 import logging
-from typing import List, TypeVar
+import math
+import sys
+import zipfile
+from array import array
+from typing import Any, Callable, Dict, Iterator, List, Optional, TextIO, Tuple, TypeVar, Union
 
 T = TypeVar('T')
 
@@ -19,8 +24,160 @@ TRIP_HEADERS = ["route_id", "service_id", "trip_id",
 AGENCY_HEADERS = ["agency_id", "agency_name", "agency_url",
                   "agency_timezone", "agency_lang", "agency_phone"]
 
+MISSING_TIME = -1  # Stored in place of blank arrival/departure times
+MISSING_SEQUENCE = -1  # Stored in place of a blank stop_sequence, given back as None
 
-class Stop:
+
+def to_int(value: str) -> Optional[int]:
+    """Convert a csv field to an int, None if it is blank."""
+    value = value.strip()
+    return int(value) if value != "" else None
+
+
+def to_float(value: str) -> Optional[float]:
+    """Convert a csv field to a float, None if it is blank."""
+    value = value.strip()
+    return float(value) if value != "" else None
+
+
+# Converter used for csv fields based on the type they are annotated with, strings are
+# interned since IDs and codes repeat on many rows
+CONVERTERS: Dict[Any, Callable[[str], Any]] = {str: sys.intern, int: to_int, float: to_float}
+
+
+class GTFSRecord:
+    """Base of the GTFS record classes. Records use __slots__ so only the declared fields
+    are stored, and each field is converted from csv to the type it is annotated with.
+
+    Attributes:
+        FIELDS: Mapping of field name to the converter for its csv value, in csv header order.
+    """
+    __slots__ = ()
+    FIELDS: Dict[str, Callable[[str], Any]] = {}
+
+    def __init_subclass__(cls, **kwargs) -> None:
+        super().__init_subclass__(**kwargs)
+        cls.FIELDS = {name: CONVERTERS.get(field_type, sys.intern)
+                      for name, field_type in cls.__annotations__.items() if name != "FIELDS"}
+
+    @classmethod
+    def from_row(cls, row: Dict[str, str]):
+        """Build a record from a csv row, ignoring columns that are not fields.
+
+        Arguments:
+            row:    Mapping of header to value as given by csv.DictReader.
+
+        Throws:
+            ValueError: When a numeric field can not be converted.
+        Returns:
+            Record with converted fields, fields missing from the row keep their defaults.
+        """
+        inst = cls()
+        for name, convert in cls.FIELDS.items():
+            value = row.get(name)
+            if value is not None:
+                setattr(inst, name, convert(value))
+        return inst
+
+    @classmethod
+    def from_values(cls, values: List[Optional[str]], projection: "Projection"):
+        """Build a record from a csv row read as a list, converting only the projected fields.
+
+        Arguments:
+            values:     Row values in header order, None for values missing from a short row.
+            projection: Fields to fill in as given by project_header.
+
+        Throws:
+            ValueError: When a numeric field can not be converted.
+        Returns:
+            Record with converted fields, the rest keep their defaults.
+        """
+        inst = cls()
+        for index, name, convert in projection:
+            value = values[index]
+            if value is not None:
+                setattr(inst, name, convert(value))
+        return inst
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Fields of the record as a dictionary, used when serialising."""
+        return {name: getattr(self, name) for name in self.FIELDS}
+
+
+Projection = List[Tuple[int, str, Callable[[str], Any]]]  # Column index, field name and converter
+
+
+def project_header(obj_type: Any, header: List[str], columns: Optional[List[str]] = None) -> Projection:
+    """Work out which csv columns to read for an object type.
+
+    Arguments:
+        obj_type:   GTFSRecord subclass, or any type with a constructor that takes no parameters.
+        header:     Header row of the csv file.
+        columns:    Optional, only read these fields, every field if not given.
+
+    Throws:
+        ValueError: When a column is not a field of a GTFSRecord type.
+    Returns:
+        Column index, field name and converter of each field to read. Fields missing from the
+        header are left out.
+    """
+    if isinstance(obj_type, type) and issubclass(obj_type, GTFSRecord):
+        fields = obj_type.FIELDS
+        unknown = [x for x in columns or [] if x not in fields]
+        if len(unknown) > 0:
+            raise ValueError(f"{obj_type.__name__} has no fields {unknown}")
+    else:
+        fields = {x: str for x in header}
+    wanted = set(columns) if columns is not None else fields
+    return [(index, name, fields[name]) for index, name in enumerate(header) if name in wanted and name in fields]
+
+
+def _read_rows(csvfile: TextIO, obj_type: Any, columns: Optional[List[str]]) -> Iterator[Any]:
+    """Objects for each row of an open csv file, converting only the projected columns.
+    Rows are read as lists by the DictReader's underlying reader so no dictionary is built per row."""
+    reader = csv.DictReader(csvfile)
+    header = reader.fieldnames or []
+    projection = project_header(obj_type, header, columns)
+    is_record = isinstance(obj_type, type) and issubclass(obj_type, GTFSRecord)
+    width = len(header)
+    for values in reader.reader:
+        if len(values) == 0:
+            continue
+        if len(values) < width:
+            values = values + [None] * (width - len(values))
+        if is_record:
+            yield obj_type.from_values(values, projection)
+        else:
+            inst = obj_type()
+            inst.__dict__.update((name, values[index]) for index, name, _ in projection if values[index] is not None)
+            yield inst
+
+
+def to_dict(obj) -> Dict[str, Any]:
+    """Serialise a loaded object, GTFSRecord's through to_dict and anything else through its __dict__."""
+    if isinstance(obj, GTFSRecord):
+        return obj.to_dict()
+    return obj.__dict__
+
+
+def from_row(obj_type: T, row: Dict[str, str]) -> T:
+    """Build an object of a given type from a csv row.
+
+    Arguments:
+        obj_type:   GTFSRecord subclass, or any type with a constructor that takes no parameters.
+        row:        Mapping of header to value as given by csv.DictReader.
+
+    Returns:
+        Object with the row's fields.
+    """
+    if isinstance(obj_type, type) and issubclass(obj_type, GTFSRecord):
+        return obj_type.from_row(row)
+    inst: T = obj_type()
+    inst.__dict__.update(row)
+    return inst
+
+
+class Stop(GTFSRecord):
     """Class representing GTFS stop
 
     Attributes:
@@ -29,6 +186,7 @@ class Stop:
         stop_lat:   Latitude of the stop.
         stop_lon:   Longitude of the stop.
     """
+    __slots__ = ("stop_id", "stop_name", "stop_lat", "stop_lon")
     stop_id: str
     stop_name: str
     stop_lat: float
@@ -36,8 +194,8 @@ class Stop:
 
     def __init__(self, stop_id: str = "",
                  stop_name: str = "",
-                 stop_lat: float = "",
-                 stop_lon: float = "") -> None:
+                 stop_lat: float = None,
+                 stop_lon: float = None) -> None:
         """Constructor"""
         self.stop_id = stop_id
         self.stop_name = stop_name
@@ -45,7 +203,7 @@ class Stop:
         self.stop_lon = stop_lon
 
 
-class Route:
+class Route(GTFSRecord):
     """Route, doesn't contain list of stops.
 
     Attributes:
@@ -55,6 +213,7 @@ class Route:
         route_long_name:    Route's long name.
         route_type:         Route type.
     """
+    __slots__ = ("route_id", "agency_id", "route_short_name", "route_long_name", "route_type")
     route_id: str
     agency_id: str
     route_short_name: str
@@ -75,7 +234,7 @@ class Route:
         self.route_type = route_type
 
 
-class StopTime:
+class StopTime(GTFSRecord):
     """Class representing time a particular trip arrives at a stop.
 
     Attributes:
@@ -89,6 +248,8 @@ class StopTime:
         drop_off_type:          Drop off type.
         shape_dist_traveled:    Shape distance travelled.
     """
+    __slots__ = ("trip_id", "arrival_time", "departure_time", "stop_id", "stop_sequence",
+                 "stop_headsign", "pickup_type", "drop_off_type", "shape_dist_traveled")
     trip_id: str
     arrival_time: str
     departure_time: str
@@ -120,7 +281,7 @@ class StopTime:
         self.shape_dist_traveled = shape_dist_traveled
 
 
-class Trip:
+class Trip(GTFSRecord):
     """Trip class, keeps track of related route, service, direction and shapes
 
     Attributes:
@@ -131,6 +292,7 @@ class Trip:
         trip_headsign:  Trip head sign
         direction_id:   ID of the direction of the trip
     """
+    __slots__ = ("route_id", "service_id", "trip_id", "shape_id", "trip_headsign", "direction_id")
     route_id: str
     service_id: str
     trip_id: str
@@ -153,7 +315,7 @@ class Trip:
         self.direction_id = direction_id
 
 
-class Agency:
+class Agency(GTFSRecord):
     """Class representing the agency which operates a service.
 
     Attributes:
@@ -164,6 +326,7 @@ class Agency:
         agency_lang:        Agency language.
         agency_phone:       Agency phone number.
     """
+    __slots__ = ("agency_id", "agency_name", "agency_url", "agency_timezone", "agency_lang", "agency_phone")
     agency_id: str
     agency_name: str
     agency_url: str
@@ -186,8 +349,10 @@ class Agency:
         self.agency_phone = agency_phone
 
 
-class Calendar:
+class Calendar(GTFSRecord):
     """Class representing the calendar for services"""
+    __slots__ = ("service_id", "monday", "tuesday", "wednesday", "thursday", "friday", "saturday",
+                 "sunday", "start_date", "end_date")
     service_id: str
     monday: str
     tuesday: str
@@ -222,12 +387,227 @@ class Calendar:
         self.end_date = end_date
 
 
-def load_gtfs_from_file(filename: str, obj_type: T) -> List[T]:
+def parse_gtfs_time(value: str) -> int:
+    """Convert a GTFS time of the form HH:MM:SS into seconds since midnight.
+    Hours can go past 23 for trips that run after midnight.
+
+    Arguments:
+        value:  Time string, can be blank for stops without a set time.
+
+    Throws:
+        ValueError: When the time is not in the HH:MM:SS format.
+    Returns:
+        Seconds since midnight or MISSING_TIME if value is blank.
+    """
+    value = value.strip()
+    if value == "":
+        return MISSING_TIME
+    hours, minutes, seconds = value.split(":")
+    return int(hours) * 3600 + int(minutes) * 60 + int(seconds)
+
+
+def format_gtfs_time(seconds: int) -> str:
+    """Convert seconds since midnight back into a GTFS HH:MM:SS time.
+
+    Arguments:
+        seconds:    Seconds since midnight or MISSING_TIME.
+
+    Returns:
+        Time string, blank if seconds is MISSING_TIME.
+    """
+    if seconds == MISSING_TIME:
+        return ""
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+
+class StopTimeColumns:
+    """Column oriented store of stop times. Each field of stop_times.txt is held in
+    its own column so a row costs a few machine words instead of a full object.
+    Indexing or iterating gives StopTime objects built on demand, so it can be used
+    anywhere a list of StopTime is expected.
+
+    Attributes:
+        trip_id:                Interned trip IDs.
+        arrival_time:           Arrival times in seconds since midnight.
+        departure_time:         Departure times in seconds since midnight.
+        stop_id:                Interned stop IDs.
+        stop_sequence:          Stop sequences, MISSING_SEQUENCE when not given.
+        stop_headsign:          Interned stop headsigns.
+        pickup_type:            Interned pickup types.
+        drop_off_type:          Interned drop off types.
+        shape_dist_traveled:    Shape distance travelled, NaN when not given.
+    """
+    trip_id: List[str]
+    arrival_time: array
+    departure_time: array
+    stop_id: List[str]
+    stop_sequence: array
+    stop_headsign: List[str]
+    pickup_type: List[str]
+    drop_off_type: List[str]
+    shape_dist_traveled: array
+
+    def __init__(self) -> None:
+        """Constructor"""
+        self.trip_id = []
+        self.arrival_time = array('l')
+        self.departure_time = array('l')
+        self.stop_id = []
+        self.stop_sequence = array('l')
+        self.stop_headsign = []
+        self.pickup_type = []
+        self.drop_off_type = []
+        self.shape_dist_traveled = array('d')
+
+    def append(self, row: Dict[str, str]) -> None:
+        """Add a row of stop_times.txt converting each field to its column type.
+
+        Arguments:
+            row:    Mapping of header to value as given by csv.DictReader.
+        """
+        self.trip_id.append(sys.intern(row.get("trip_id", "")))
+        self.arrival_time.append(parse_gtfs_time(row.get("arrival_time", "")))
+        self.departure_time.append(parse_gtfs_time(row.get("departure_time", "")))
+        self.stop_id.append(sys.intern(row.get("stop_id", "")))
+        sequence = row.get("stop_sequence")
+        self.stop_sequence.append(MISSING_SEQUENCE if sequence is None or str(sequence).strip() == "" else int(sequence))
+        self.stop_headsign.append(sys.intern(row.get("stop_headsign", "")))
+        self.pickup_type.append(sys.intern(row.get("pickup_type", "")))
+        self.drop_off_type.append(sys.intern(row.get("drop_off_type", "")))
+        distance = row.get("shape_dist_traveled")
+        self.shape_dist_traveled.append(math.nan if distance is None or distance == "" else float(distance))
+
+    def extend(self, other: "StopTimeColumns") -> None:
+        """Add every row of other after the rows already held, interning its strings again
+        since they may have come from another process.
+
+        Arguments:
+            other:  Columns to add.
+        """
+        for name in ["trip_id", "stop_id", "stop_headsign", "pickup_type", "drop_off_type"]:
+            getattr(self, name).extend(map(sys.intern, getattr(other, name)))
+        for name in ["arrival_time", "departure_time", "stop_sequence", "shape_dist_traveled"]:
+            getattr(self, name).extend(getattr(other, name))
+
+    def get(self, index: int) -> StopTime:
+        """Build the StopTime at a given row.
+
+        Arguments:
+            index:  Row number.
+
+        Returns:
+            StopTime with times formatted as HH:MM:SS and a None distance and sequence if not given.
+        """
+        distance = self.shape_dist_traveled[index]
+        sequence = self.stop_sequence[index]
+        return StopTime(trip_id=self.trip_id[index],
+                        arrival_time=format_gtfs_time(self.arrival_time[index]),
+                        departure_time=format_gtfs_time(self.departure_time[index]),
+                        stop_id=self.stop_id[index],
+                        stop_sequence=None if sequence == MISSING_SEQUENCE else sequence,
+                        stop_headsign=self.stop_headsign[index],
+                        pickup_type=self.pickup_type[index],
+                        drop_off_type=self.drop_off_type[index],
+                        shape_dist_traveled=None if math.isnan(distance) else distance)
+
+    def row_dict(self, index: int) -> Dict[str, Any]:
+        """The row at a given index as the dictionary to_dict gives for its StopTime,
+        built straight from the columns without the StopTime."""
+        distance = self.shape_dist_traveled[index]
+        sequence = self.stop_sequence[index]
+        return {"trip_id": self.trip_id[index],
+                "arrival_time": format_gtfs_time(self.arrival_time[index]),
+                "departure_time": format_gtfs_time(self.departure_time[index]),
+                "stop_id": self.stop_id[index],
+                "stop_sequence": None if sequence == MISSING_SEQUENCE else sequence,
+                "stop_headsign": self.stop_headsign[index],
+                "pickup_type": self.pickup_type[index],
+                "drop_off_type": self.drop_off_type[index],
+                "shape_dist_traveled": None if math.isnan(distance) else distance}
+
+    def group_rows(self) -> Dict[str, array]:
+        """Row numbers of each trip's stop times in file order, a compact array per trip
+        rather than a StopTime per row.
+
+        Returns:
+            Mapping of trip_id to the indices of its rows.
+        """
+        rows: Dict[str, array] = {}
+        for index, trip_id in enumerate(self.trip_id):
+            trip_rows = rows.get(trip_id)
+            if trip_rows is None:
+                trip_rows = rows[trip_id] = array('l')
+            trip_rows.append(index)
+        return rows
+
+    def __len__(self) -> int:
+        return len(self.trip_id)
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[StopTime, List[StopTime]]:
+        if isinstance(index, slice):
+            return [self.get(i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError("StopTimeColumns index out of range")
+        return self.get(index)
+
+    def __iter__(self) -> Iterator[StopTime]:
+        for i in range(len(self)):
+            yield self.get(i)
+
+
+def open_gtfs_file(filename: str, zip_file: Optional[zipfile.ZipFile] = None) -> TextIO:
+    """Open a GTFS file for reading, either from disk or as a member of a zip file.
+    Zip members are decompressed as they are read rather than extracted first.
+
+    Parameters:
+        filename:   Name of the file, or of the member if a zip file is given.
+        zip_file:   Optional, zip file to read the member from.
+
+    Returns:
+        Text file handle.
+    """
+    if zip_file is not None:
+        return io.TextIOWrapper(zip_file.open(filename), encoding="utf-8-sig", newline="")
+    return open(filename, 'r', encoding="utf-8-sig")
+
+
+def load_stop_times_columns(filename: str, zip_file: Optional[zipfile.ZipFile] = None) -> StopTimeColumns:
+    """Loads stop_times.txt into typed columns rather than a list of StopTime objects.
+
+    Parameters:
+        filename:   Name of the stop times file should be csv format.
+        zip_file:   Optional, zip file to read filename from instead of disk.
+
+    Throws:
+        Exception:  When it encounters an error parsing csv file it logs it then throws exception.
+        ValueError: When incorrect parameters are given.
+    Returns:
+        StopTimeColumns holding every row of the file.
+    """
+    if filename is None or filename == "":
+        raise ValueError("Filename must not be blank")
+    try:
+        columns = StopTimeColumns()
+        with open_gtfs_file(filename, zip_file) as csvfile:
+            for row in csv.DictReader(csvfile):
+                columns.append(row)
+        return columns
+    except Exception as err:
+        logging.error(f"Encountered error when loading from file {err}")
+        raise err
+
+
+def load_gtfs_from_file(filename: str, obj_type: T, zip_file: Optional[zipfile.ZipFile] = None,
+                        columns: Optional[List[str]] = None) -> List[T]:
     """Loads the GTFS data from a file into a list of a particular object type i.e. Stop
 
     Parameters:
         filename:   Name of the file should be csv format.
         obj_type:   Type of object should have constructor that takes no parameters.
+        zip_file:   Optional, zip file to read filename from instead of disk.
+        columns:    Optional, only convert these fields, the rest keep their defaults.
 
     Throws:
         Exception:  When it encounters an error parsing csv file it logs it then throws exception.
@@ -240,18 +620,43 @@ def load_gtfs_from_file(filename: str, obj_type: T) -> List[T]:
     if obj_type is None:
         raise ValueError("Must give a non None value for object type")
     try:
-        results: List[T] = []
-        with open(filename, 'r', encoding="utf-8-sig") as csvfile:
-            for row in csv.DictReader(csvfile):
-                inst: T = obj_type()
-                inst.__dict__.update(row)
-                results.append(inst)
+        with open_gtfs_file(filename, zip_file) as csvfile:
+            results: List[T] = list(_read_rows(csvfile, obj_type, columns))
         return results
     except Exception as err:
         logging.error(f"Encountered error when loading from file {err}")
         raise err
 
 
+def iter_gtfs_from_file(filename: str, obj_type: T, zip_file: Optional[zipfile.ZipFile] = None,
+                        columns: Optional[List[str]] = None) -> Iterator[T]:
+    """Lazily load the GTFS data from a file one object at a time, same as
+    load_gtfs_from_file but without holding the whole file in memory.
+
+    Parameters:
+        filename:   Name of the file should be csv format.
+        obj_type:   Type of object should have constructor that takes no parameters.
+        zip_file:   Optional, zip file to read filename from instead of disk.
+        columns:    Optional, only convert these fields, the rest keep their defaults.
+
+    Throws:
+        Exception:  When it encounters an error parsing csv file it logs it then throws exception.
+        ValueError: When incorrect parameters are given.
+    Returns:
+        Iterator of objects in file order.
+    """
+    if filename is None or filename == "":
+        raise ValueError("Filename must not be blank")
+    if obj_type is None:
+        raise ValueError("Must give a non None value for object type")
+    try:
+        with open_gtfs_file(filename, zip_file) as csvfile:
+            yield from _read_rows(csvfile, obj_type, columns)
+    except Exception as err:
+        logging.error(f"Encountered error when loading from file {err}")
+        raise err
+
+
 FILE_TO_OBJECT_MAPPINGS = {
     "calendar.txt": Calendar,
     "stops.txt": Stop,
@@ -0,0 +1,64 @@
+import logging
+from typing import List, Tuple
+
+from pymongo import ASCENDING
+from pymongo import collection as mongo_collection
+from .fingerprint import FEED_FIELD
+
+IndexKeys = List[Tuple[str, int]]  # Fields of an index in order with their direction
+
+# Indexes of the trip documents in the routes collection. stops.stop_id indexes every stop
+# of a trip (a multikey index) so trips calling at a stop are found without a scan
+ROUTE_INDEXES: List[IndexKeys] = [
+    [("route_id", ASCENDING)],
+    [("route_short_name", ASCENDING)],
+    [("stops.stop_id", ASCENDING)],
+    [("service_id", ASCENDING)],
+    [("start_date", ASCENDING), ("end_date", ASCENDING)],
+    [(FEED_FIELD, ASCENDING), ("trip_id", ASCENDING)],
+]
+# Indexes of the calendars kept in their own collection when trips reference them
+CALENDAR_INDEXES: List[IndexKeys] = [
+    [(FEED_FIELD, ASCENDING), ("service_id", ASCENDING)],
+    [("start_date", ASCENDING), ("end_date", ASCENDING)],
+]
+
+
+def route_indexes(embed_calendar: bool = True, patterns: bool = False) -> List[IndexKeys]:
+    """ROUTE_INDEXES without the ones on fields the trip documents don't have.
+
+    Parameters:
+        embed_calendar: Whether trips hold a copy of their calendar's start_date and end_date.
+        patterns:       Whether trips reference a stop pattern by pattern_id instead of listing
+                        their stops, pattern_id is indexed in place of stops.stop_id.
+
+    Returns:
+        Keys of each index the routes collection should have.
+    """
+    indexes = []
+    for keys in ROUTE_INDEXES:
+        fields = [field for field, _ in keys]
+        if not embed_calendar and "start_date" in fields:
+            continue
+        if patterns and fields == ["stops.stop_id"]:
+            keys = [("pattern_id", ASCENDING)]
+        indexes.append(keys)
+    return indexes
+
+
+def create_indexes(collection: mongo_collection.Collection, indexes: List[IndexKeys]) -> int:
+    """Make sure a collection has the given indexes. Creating an index that already exists
+    does nothing, so this is called after every load rather than before it, so a first load
+    into an empty collection does not have to update the indexes for every document.
+
+    Parameters:
+        collection: Collection to index.
+        indexes:    Keys of each index.
+
+    Returns:
+        Number of indexes asked for.
+    """
+    logging.info(f"Creating {len(indexes)} indexes on {collection.name}")
+    for keys in indexes:
+        collection.create_index(keys)
+    return len(indexes)
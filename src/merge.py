@@ -0,0 +1,174 @@
+import logging
+import math
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from .feed import Feed
+from .gtfs import Stop
+from .spatial import EARTH_RADIUS, haversine
+
+NAMESPACE_SEPARATOR = ":"
+MERGE_DISTANCE = 25.0  # Metres, stops with the same name closer than this are the same stop
+# ID fields of each file, namespaced with the feed they came from so IDs can't collide across feeds
+ID_FIELDS = {
+    "agency": ["agency_id"],
+    "routes": ["route_id", "agency_id"],
+    "trips": ["route_id", "service_id", "trip_id", "shape_id"],
+    "calendar": ["service_id"],
+    "stops": ["stop_id"],
+    "stop_times": ["trip_id", "stop_id"],
+}
+MERGED_FILES = ["agency", "calendar", "stops", "routes", "trips", "stop_times"]
+
+
+def namespace(prefix: str, value: Optional[str]) -> Optional[str]:
+    """ID namespaced with the feed it came from, blank and missing IDs stay as they are."""
+    return f"{prefix}{NAMESPACE_SEPARATOR}{value}" if value else value
+
+
+def normalise_name(name: Optional[str]) -> str:
+    """Stop name in a form that matches across feeds, lower case with punctuation and
+    repeated spaces removed."""
+    return re.sub(r"[^0-9a-z]+", " ", (name or "").lower()).strip()
+
+
+class StopDeduplicator:
+    """Finds stops that several feeds share. Stops are hashed into buckets by their grid
+    cell and normalised name, so a new stop is only compared with the stops of the same
+    name in its own and the neighbouring cells rather than with every stop seen. Stops
+    of the same feed are never merged, feeds often give each side of a road its own stop
+    under the same name.
+
+    Attributes:
+        distance:   Most metres apart two stops with the same name can be to count as one.
+        stops:      Stops kept, the first of each group of shared stops.
+        ids:        Mapping of the ID of every stop added to the ID of the stop kept for it.
+        buckets:    Mapping of (cell x, cell y, normalised name) to indices of kept stops.
+    """
+    distance: float
+    stops: List[Stop]
+    ids: Dict[str, str]
+    buckets: Dict[Tuple[int, int, str], List[int]]
+
+    def __init__(self, distance: float = MERGE_DISTANCE, origin_lat: float = 53.4) -> None:
+        """Constructor
+
+        Arguments:
+            distance:   Optional, most metres apart stops can be to be merged.
+            origin_lat: Optional, latitude the cells are sized for, defaults to the middle of Ireland.
+        """
+        self.distance = distance
+        self.stops = []
+        self.ids = {}
+        self.buckets = {}
+        self._sources: List[str] = []
+        # Cells are at least distance wide so matches are always in a neighbouring cell
+        self._lat_size = math.degrees(distance / EARTH_RADIUS)
+        self._lon_size = self._lat_size / max(math.cos(math.radians(origin_lat)), 0.01)
+
+    def _cell(self, stop: Stop) -> Tuple[int, int]:
+        return math.floor(stop.stop_lon / self._lon_size), math.floor(stop.stop_lat / self._lat_size)
+
+    def add(self, stop: Stop, source: str) -> str:
+        """Add a stop, keeping it unless a stop of another feed with the same name is
+        already within distance.
+
+        Arguments:
+            stop:   Stop to add, its ID must be unique across feeds.
+            source: Feed the stop belongs to.
+
+        Returns:
+            ID of the stop kept for it.
+        """
+        if stop.stop_lat is None or stop.stop_lon is None:
+            return self._keep(stop, source)
+        name = normalise_name(stop.stop_name)
+        x, y = self._cell(stop)
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                for i in self.buckets.get((x + dx, y + dy, name), []):
+                    kept = self.stops[i]
+                    if self._sources[i] != source and \
+                            haversine(stop.stop_lat, stop.stop_lon, kept.stop_lat, kept.stop_lon) <= self.distance:
+                        self.ids[stop.stop_id] = kept.stop_id
+                        return kept.stop_id
+        self.buckets.setdefault((x, y, name), []).append(len(self.stops))
+        return self._keep(stop, source)
+
+    def _keep(self, stop: Stop, source: str) -> str:
+        self.stops.append(stop)
+        self._sources.append(source)
+        self.ids[stop.stop_id] = stop.stop_id
+        return stop.stop_id
+
+    @property
+    def duplicates(self) -> int:
+        """Number of stops added that were merged into another."""
+        return len(self.ids) - len(self.stops)
+
+
+class FeedMerger:
+    """Combines several parsed feeds into one. Every ID is namespaced with the prefix of
+    the feed it came from, e.g. "dublinbus:1234", and stops shared between feeds are kept
+    once with stop times moved onto the kept stop. Records are renamed in place rather
+    than copied, so the feeds added should not be used on their own afterwards.
+
+    Attributes:
+        stops:      Deduplicates the stops of every feed.
+        records:    Mapping of file name, as in FILE_TO_PARAMETER_NAME, to the merged records.
+        prefixes:   Prefixes of the feeds added so far.
+    """
+    stops: StopDeduplicator
+    records: Dict[str, List[Any]]
+    prefixes: List[str]
+
+    def __init__(self, distance: float = MERGE_DISTANCE) -> None:
+        """Constructor
+
+        Arguments:
+            distance:   Optional, most metres apart stops with the same name can be to be merged.
+        """
+        self.stops = StopDeduplicator(distance)
+        self.records = {name: [] for name in MERGED_FILES if name != "stops"}
+        self.prefixes = []
+
+    def add(self, prefix: str, feed: Feed):
+        """Namespace a feed's records and merge them in.
+
+        Arguments:
+            prefix: Prefix for the feed's IDs, must be different for every feed.
+            feed:   Feed to merge, loaded as records rather than columns.
+
+        Throws:
+            ValueError: When the prefix has already been used.
+        """
+        if prefix in self.prefixes:
+            raise ValueError(f"Feed prefix {prefix} is already in use")
+        self.prefixes.append(prefix)
+        # IDs repeat on many rows, share one namespaced string per ID instead of one per row
+        renamed: Dict[str, str] = {}
+        for name in MERGED_FILES:
+            records = feed.get(name, [])
+            for record in records:
+                for field in ID_FIELDS[name]:
+                    value = getattr(record, field)
+                    if value not in renamed:
+                        renamed[value] = namespace(prefix, value)
+                    setattr(record, field, renamed[value])
+            if name == "stops":
+                for stop in records:
+                    self.stops.add(stop, prefix)
+                continue
+            if name == "stop_times":
+                ids = self.stops.ids
+                for stop_time in records:
+                    stop_time.stop_id = ids.get(stop_time.stop_id, stop_time.stop_id)
+            self.records[name].extend(records)
+        # The feed's own copies are no longer needed, only the merged lists hold the records
+        feed.clear()
+        logging.info(f"Merged feed {prefix}, {self.stops.duplicates} shared stops found so far")
+
+    def feed(self) -> Feed:
+        """Merged records as a Feed, to build documents from like any other feed."""
+        loaded = dict(self.records, stops=self.stops.stops)
+        return Feed(None, loaders={name: (lambda records=records: records) for name, records in loaded.items()})
@@ -0,0 +1,155 @@
+import cProfile
+import json
+import logging
+import os
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+try:
+    import resource
+except ImportError:  # Not available on Windows, peak RSS is left out there
+    resource = None
+
+
+def peak_rss() -> Optional[int]:
+    """Peak resident set size of this process in bytes, None if it can't be read."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class StageMetrics:
+    """Measurements of one pipeline stage.
+
+    Attributes:
+        name:               Name of the stage.
+        labels:             Extra details of the stage, such as the feed it worked on.
+        seconds:            Wall clock time taken.
+        cpu_seconds:        CPU time used by this process.
+        rows:               Number of rows the stage handled, None if not counted.
+        rss_growth:         How much the peak resident set size grew in bytes, None if unknown.
+        traced_peak_bytes:  Peak memory allocated by Python during the stage, None unless tracing.
+    """
+    name: str
+    labels: Dict[str, str]
+    seconds: float
+    cpu_seconds: float
+    rows: Optional[int]
+    rss_growth: Optional[int]
+    traced_peak_bytes: Optional[int]
+
+    def __init__(self, name: str, labels: Optional[Dict[str, str]] = None) -> None:
+        self.name = name
+        self.labels = labels or {}
+        self.seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.rows = None
+        self.rss_growth = None
+        self.traced_peak_bytes = None
+
+    @property
+    def rows_per_second(self) -> Optional[float]:
+        if self.rows is None or self.seconds <= 0:
+            return None
+        return self.rows / self.seconds
+
+    def to_dict(self) -> Dict:
+        return {"name": self.name, "labels": self.labels, "seconds": self.seconds, "cpu_seconds": self.cpu_seconds,
+                "rows": self.rows, "rows_per_second": self.rows_per_second, "rss_growth": self.rss_growth,
+                "traced_peak_bytes": self.traced_peak_bytes}
+
+
+class Metrics:
+    """Collects StageMetrics for a run. Timing is cheap enough to leave on, memory
+    tracing with tracemalloc slows Python down a lot so it is only on when asked for.
+    Stages should not be nested when tracing, an inner stage resets the traced peak.
+
+    Attributes:
+        stages:         Measured stages in the order they finished.
+        trace_memory:   Whether stages record their peak traced memory.
+    """
+    stages: List[StageMetrics]
+    trace_memory: bool
+
+    def __init__(self, trace_memory: bool = False) -> None:
+        self.stages = []
+        self.trace_memory = trace_memory
+        self._started = time.time()
+
+    @contextmanager
+    def stage(self, name: str, rows: Optional[int] = None, **labels: str) -> Iterator[StageMetrics]:
+        """Measure the code run inside the with block as a stage.
+
+        Arguments:
+            name:   Name of the stage.
+            rows:   Optional, number of rows handled, can also be set on the yielded
+                    StageMetrics once known.
+            labels: Extra details to record with the stage.
+
+        Returns:
+            StageMetrics filled in when the block exits, even if it raises.
+        """
+        metrics = StageMetrics(name, labels)
+        metrics.rows = rows
+        rss_before = peak_rss()
+        tracing = self.trace_memory and not tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.start()
+        elif self.trace_memory:
+            tracemalloc.reset_peak()
+        traced_before = tracemalloc.get_traced_memory()[0] if self.trace_memory else 0
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield metrics
+        finally:
+            metrics.seconds = time.perf_counter() - wall
+            metrics.cpu_seconds = time.process_time() - cpu
+            if self.trace_memory:
+                metrics.traced_peak_bytes = tracemalloc.get_traced_memory()[1] - traced_before
+            if tracing:
+                tracemalloc.stop()
+            rss_after = peak_rss()
+            if rss_before is not None and rss_after is not None:
+                metrics.rss_growth = rss_after - rss_before
+            self.stages.append(metrics)
+            rate = f", {metrics.rows_per_second:.0f} rows/s" if metrics.rows_per_second is not None else ""
+            logging.info(f"{name} took {metrics.seconds:.3f}s ({metrics.cpu_seconds:.3f}s CPU){rate}")
+
+    def to_dict(self) -> Dict:
+        """Metrics of the run as a json serialisable dictionary."""
+        return {"started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self._started)),
+                "seconds": time.time() - self._started, "peak_rss": peak_rss(),
+                "stages": [x.to_dict() for x in self.stages]}
+
+    def write(self, path: str):
+        """Write the metrics of the run to a json file."""
+        with open(path, 'w', encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+
+@contextmanager
+def profiled(path: Optional[str]) -> Iterator[Optional[cProfile.Profile]]:
+    """Run the with block under cProfile and save the stats to a file, read them with pstats.
+
+    Arguments:
+        path:   File to save the stats to, nothing is profiled if None.
+
+    Returns:
+        Profiler in use or None.
+    """
+    if path is None:
+        yield None
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
+        logging.info(f"Profile written to {os.path.abspath(path)}")
@@ -0,0 +1,126 @@
+import csv
+import io
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple, TypeVar, Union
+from .gtfs import StopTimeColumns, from_row
+
+T = TypeVar('T')
+
+BLOCK_SIZE = 1 << 24  # Bytes read at a time when looking for record boundaries
+CHUNKS_PER_PROCESS = 4  # More chunks than processes evens out uneven chunks
+
+
+def record_boundaries(filename: str, count: int) -> List[int]:
+    """Split a csv file into roughly equal byte ranges that each start at the beginning of
+    a record. Newlines inside quoted fields are skipped by tracking whether an odd or even
+    number of quotes came before them, so quoted fields are never split.
+
+    Arguments:
+        filename:   Name of the csv file.
+        count:      Number of ranges wanted.
+
+    Returns:
+        Increasing byte offsets, the first is the end of the header and the last is the
+        file size, each consecutive pair is a range of whole records.
+    """
+    size = os.path.getsize(filename)
+    # Offset 0 finds the end of the header, the rest are evenly spaced
+    targets = iter([0] + [size * i // count for i in range(1, count)])
+    target = next(targets)
+    boundaries: List[int] = []
+    with open(filename, 'rb') as f:
+        quotes = 0  # Quotes seen before the current block
+        position = 0  # Offset of the current block
+        for block in iter(lambda: f.read(BLOCK_SIZE), b""):
+            while target is not None and target < position + len(block):
+                newline = block.find(b"\n", target - position)
+                while newline != -1 and (quotes + block.count(b'"', 0, newline)) % 2 == 1:
+                    newline = block.find(b"\n", newline + 1)
+                if newline == -1:
+                    # No record ends in the rest of this block, carry on in the next one
+                    target = position + len(block)
+                    break
+                boundaries.append(position + newline + 1)
+                target = next(targets, None)
+                while target is not None and target < boundaries[-1]:
+                    target = next(targets, None)
+            quotes += block.count(b'"')
+            position += len(block)
+    if len(boundaries) == 0:
+        boundaries.append(size)
+    if boundaries[-1] != size:
+        boundaries.append(size)
+    return boundaries
+
+
+def _read_header(filename: str, end: int) -> List[str]:
+    with open(filename, 'rb') as f:
+        text = f.read(end).decode("utf-8-sig")
+    return next(csv.reader(io.StringIO(text)), [])
+
+
+def parse_range(filename: str, start: int, end: int, header: List[str],
+                obj_type: T) -> Union[StopTimeColumns, List[T]]:
+    """Parse the records in a byte range of a csv file.
+
+    Arguments:
+        filename:   Name of the csv file.
+        start:      Offset of the first record.
+        end:        Offset just past the last record.
+        header:     Column names from the file's header.
+        obj_type:   Type of object to load or StopTimeColumns for typed stop time columns.
+
+    Returns:
+        StopTimeColumns or list of objects for the records in the range.
+    """
+    with open(filename, 'rb') as f:
+        f.seek(start)
+        text = f.read(end - start).decode("utf-8")
+    # Blank lines are skipped, as DictReader does when loading on one thread
+    rows = (dict(zip(header, x)) for x in csv.reader(io.StringIO(text, newline="")) if x)
+    if obj_type is StopTimeColumns:
+        columns = StopTimeColumns()
+        for row in rows:
+            columns.append(row)
+        return columns
+    return [from_row(obj_type, row) for row in rows]
+
+
+def load_gtfs_parallel(filename: str, obj_type: T, processes: Optional[int] = None,
+                       chunks_per_process: int = CHUNKS_PER_PROCESS) -> Union[StopTimeColumns, List[T]]:
+    """Load a GTFS file with a pool of processes, each parsing a range of whole records.
+    Results are merged in file order so the output is the same as loading on one thread.
+
+    Parameters:
+        filename:           Name of the file should be csv format.
+        obj_type:           Type of object to load or StopTimeColumns for typed stop time columns.
+        processes:          Optional, number of processes, defaults to cpu count.
+        chunks_per_process: Optional, number of ranges to split the file into per process.
+
+    Throws:
+        Exception:  When it encounters an error parsing csv file it logs it then throws exception.
+        ValueError: When incorrect parameters are given.
+    Returns:
+        StopTimeColumns or list of objects.
+    """
+    if filename is None or filename == "":
+        raise ValueError("Filename must not be blank")
+    if obj_type is None:
+        raise ValueError("Must give a non None value for object type")
+    processes = processes or os.cpu_count() or 1
+    try:
+        boundaries = record_boundaries(filename, processes * chunks_per_process)
+        header = _read_header(filename, boundaries[0])
+        ranges: List[Tuple[int, int]] = [(boundaries[i], boundaries[i + 1]) for i in range(len(boundaries) - 1)]
+        logging.debug(f"Parsing {filename} in {len(ranges)} chunks with {processes} processes")
+        result = StopTimeColumns() if obj_type is StopTimeColumns else []
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            futures = [pool.submit(parse_range, filename, start, end, header, obj_type) for start, end in ranges]
+            for future in futures:
+                result.extend(future.result())
+        return result
+    except Exception as err:
+        logging.error(f"Encountered error when loading from file {err}")
+        raise err
@@ -0,0 +1,111 @@
+import hashlib
+import json
+import logging
+from typing import Dict, List
+
+from pymongo import ASCENDING
+from pymongo import database
+from .bulk import BulkWriter, DEFAULT_BATCH_SIZE
+from .fingerprint import FEED_FIELD
+from .gtfs import MISSING_TIME, format_gtfs_time, parse_gtfs_time
+
+PATTERNS_COLLECTION = "patterns"
+TIME_FIELDS = ("arrival_time", "departure_time")
+PATTERN_ID_LENGTH = 16  # Hex digits of the pattern content hash kept in its ID
+
+
+class PatternCompressor:
+    """Replace the stop list of connected trips with a reference to a shared pattern.
+    Trips on a route mostly visit the same stops in the same order and only differ in
+    their times, so the stops are kept once per pattern and each trip holds its start
+    time and the offsets of its arrivals and departures from it.
+
+    Pattern IDs are the route ID and a hash of the pattern's stops, so the same pattern
+    gets the same ID every run.
+
+    Attributes:
+        patterns:   Mapping of pattern ID to pattern document
+                    {"pattern_id": pattern_id, "route_id": route_id, "stops": [stop, ...]}.
+    """
+    patterns: Dict[str, Dict]
+
+    def __init__(self) -> None:
+        self.patterns = {}
+
+    def trip(self, connection: Dict) -> Dict:
+        """Compress a connected trip, registering its pattern if it is new.
+
+        Arguments:
+            connection: Document from connect_route_stops or stream_route_stops, other fields
+                        such as the calendar are kept as they are.
+
+        Returns:
+            The document with "stops" replaced by "pattern_id", "start_time",
+            "arrival_offsets" and "departure_offsets". Missing times have a None offset.
+        """
+        stops = connection["stops"]
+        pattern_stops = [{k: v for k, v in x.items() if k not in TIME_FIELDS and k != "trip_id"} for x in stops]
+        content = json.dumps([connection.get("route_id"), pattern_stops], sort_keys=True, default=str)
+        pattern_id = f"{connection.get('route_id')}:{hashlib.sha1(content.encode('utf-8')).hexdigest()[:PATTERN_ID_LENGTH]}"
+        if pattern_id not in self.patterns:
+            self.patterns[pattern_id] = {"pattern_id": pattern_id, "route_id": connection.get("route_id"),
+                                         "stops": pattern_stops}
+
+        arrivals = [parse_gtfs_time(x["arrival_time"]) for x in stops]
+        departures = [parse_gtfs_time(x["departure_time"]) for x in stops]
+        start = next((x for x in departures + arrivals if x != MISSING_TIME), 0)
+        result = {k: v for k, v in connection.items() if k != "stops"}
+        result["pattern_id"] = pattern_id
+        result["start_time"] = format_gtfs_time(start)
+        result["arrival_offsets"] = [None if x == MISSING_TIME else x - start for x in arrivals]
+        result["departure_offsets"] = [None if x == MISSING_TIME else x - start for x in departures]
+        return result
+
+    def pattern_list(self) -> List[Dict]:
+        """Patterns in the order they were first seen."""
+        return list(self.patterns.values())
+
+
+def expand_trip(trip: Dict, pattern: Dict) -> Dict:
+    """Undo PatternCompressor.trip, rebuilding the full stop list of a compressed trip.
+
+    Arguments:
+        trip:       Compressed trip document.
+        pattern:    Pattern document the trip references.
+
+    Returns:
+        Connected trip document with times formatted as HH:MM:SS.
+    """
+    start = parse_gtfs_time(trip["start_time"])
+    stops = []
+    for stop, arrival, departure in zip(pattern["stops"], trip["arrival_offsets"], trip["departure_offsets"]):
+        times = {"trip_id": trip["trip_id"],
+                 "arrival_time": format_gtfs_time(MISSING_TIME if arrival is None else start + arrival),
+                 "departure_time": format_gtfs_time(MISSING_TIME if departure is None else start + departure)}
+        stops.append(times | stop)
+    result = {k: v for k, v in trip.items()
+              if k not in ("pattern_id", "start_time", "arrival_offsets", "departure_offsets")}
+    result["stops"] = stops
+    return result
+
+
+def insert_patterns(mongo_db: database.Database, patterns: List[Dict], feed: str,
+                    batch_size: int = DEFAULT_BATCH_SIZE) -> int:
+    """Replace a feed's patterns in the database and index them by pattern ID.
+
+    Parameters:
+        mongo_db:       Mongo database.
+        patterns:       Pattern documents from PatternCompressor.
+        feed:           Name of the feed the documents are tagged with.
+        batch_size:     Optional, number of documents to send to the database at a time.
+
+    Returns:
+        Number of patterns inserted.
+    """
+    pattern_collection = mongo_db[PATTERNS_COLLECTION]
+    pattern_collection.delete_many({FEED_FIELD: feed})
+    logging.info(f"Inserting {len(patterns)} trip patterns")
+    if len(patterns) > 0:
+        BulkWriter(pattern_collection, batch_size).write({FEED_FIELD: feed} | x for x in patterns)
+    pattern_collection.create_index([(FEED_FIELD, ASCENDING), ("pattern_id", ASCENDING)])
+    return len(patterns)
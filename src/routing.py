@@ -0,0 +1,379 @@
+import logging
+from datetime import date
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from .gtfs import MISSING_TIME, Calendar, StopTimeColumns, Trip
+from .services import ServiceIndex
+from .times import column_array, parse_times, sequence_array
+
+UNREACHED = np.iinfo(np.int32).max  # Arrival time of stops that can't be reached
+DEFAULT_MAX_TRANSFERS = 5  # Most times a RAPTOR journey changes vehicle
+
+# Arrays making up a timetable, in the order they are saved
+ARRAYS = [
+    "stop_ids", "trip_ids", "trip_services", "service_ids", "service_masks", "service_ranges",
+    "connection_dep_stop", "connection_arr_stop", "connection_dep_time", "connection_arr_time", "connection_trip",
+    "route_stop_offsets", "route_stops", "route_trip_offsets", "route_trips", "route_time_offsets",
+    "route_arrivals", "route_departures", "stop_route_offsets", "stop_routes", "stop_route_positions",
+]
+
+
+def _offsets(counts: np.ndarray) -> np.ndarray:
+    """Start of each group in a flat array from the size of each group, plus the end."""
+    offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    return offsets
+
+
+class Timetable:
+    """Timetable laid out for journey planning, every array is numpy so it saves to and
+    loads from a single binary file without any parsing. Stops and trips are referred to
+    by their index in stop_ids and trip_ids. Times are seconds since midnight.
+
+    Service arrays, so queries for a date only ride the trips running that day:
+        trip_services:          Index in service_ids of each trip's service, -1 if it has no calendar.
+        service_masks:          Weekday bitmask of each service, bit 0 is Monday.
+        service_ranges:         First and last date of each service as ordinals, row per service.
+
+    Connection scan (CSA) arrays, one entry per hop between consecutive stops of a trip,
+    sorted by departure time:
+        connection_dep_stop, connection_arr_stop, connection_dep_time, connection_arr_time,
+        connection_trip
+
+    RAPTOR arrays. Trips visiting the same stops in the same order, without overtaking each
+    other, make up a route. route_*_offsets give where each route's entries start:
+        route_stops:            Stops of each route in order.
+        route_trips:            Trips of each route by departure time.
+        route_arrivals:         Arrival of each trip of a route at each of its stops, row per
+        route_departures:       trip in route_trips order, starting at route_time_offsets.
+        stop_routes:            Routes serving each stop, starting at stop_route_offsets, with
+        stop_route_positions:   the position of the stop in the route.
+
+    Stops of a trip without a time are left out, so a trip only connects its timed stops.
+    Footpaths between stops are not modelled, a journey only changes vehicle at a stop.
+    """
+    stop_ids: np.ndarray
+    trip_ids: np.ndarray
+    trip_services: np.ndarray
+    service_ids: np.ndarray
+    service_masks: np.ndarray
+    service_ranges: np.ndarray
+    connection_dep_stop: np.ndarray
+    connection_arr_stop: np.ndarray
+    connection_dep_time: np.ndarray
+    connection_arr_time: np.ndarray
+    connection_trip: np.ndarray
+    route_stop_offsets: np.ndarray
+    route_stops: np.ndarray
+    route_trip_offsets: np.ndarray
+    route_trips: np.ndarray
+    route_time_offsets: np.ndarray
+    route_arrivals: np.ndarray
+    route_departures: np.ndarray
+    stop_route_offsets: np.ndarray
+    stop_routes: np.ndarray
+    stop_route_positions: np.ndarray
+
+    def __init__(self, arrays: Dict[str, np.ndarray]) -> None:
+        """Constructor, use build or load to make one.
+
+        Arguments:
+            arrays: Mapping of every name in ARRAYS to its array.
+        """
+        for name in ARRAYS:
+            setattr(self, name, arrays[name])
+        self._stop_index = {x: i for i, x in enumerate(self.stop_ids.tolist())}
+        self._lists: Optional[Tuple[List[int], ...]] = None
+
+    @classmethod
+    def build(cls, trips: Sequence[Trip], stop_times, calendars: Optional[Iterable[Calendar]] = None) -> "Timetable":
+        """Build the timetable of a feed.
+
+        Arguments:
+            trips:      Trips of the feed, stop times of unknown trips are left out.
+            stop_times: Stop times as StopTime objects or StopTimeColumns.
+            calendars:  Optional, calendars of the feed's services. Without them no trip runs
+                        on any date, only queries without one can be answered.
+
+        Returns:
+            Timetable of the feed.
+        """
+        if isinstance(stop_times, StopTimeColumns):
+            trip_column, stop_column = stop_times.trip_id, stop_times.stop_id
+            sequence = sequence_array(stop_times.stop_sequence)
+            arrivals = column_array(stop_times.arrival_time).astype(np.int64)
+            departures = column_array(stop_times.departure_time).astype(np.int64)
+        else:
+            trip_column, stop_column = [x.trip_id for x in stop_times], [x.stop_id for x in stop_times]
+            sequence = sequence_array([x.stop_sequence for x in stop_times])
+            arrivals = parse_times(x.arrival_time for x in stop_times)
+            departures = parse_times(x.departure_time for x in stop_times)
+        trip_ids = np.asarray([x.trip_id for x in trips], dtype=str)
+        trip_lookup = {x: i for i, x in enumerate(trip_ids.tolist())}
+        trip_codes = np.fromiter((trip_lookup.get(x, -1) for x in trip_column), dtype=np.int64,
+                                 count=len(trip_column))
+
+        # A stop with only one time given has it as both, stops with neither are left out
+        arrivals = np.where(arrivals == MISSING_TIME, departures, arrivals)
+        departures = np.where(departures == MISSING_TIME, arrivals, departures)
+        keep = (trip_codes >= 0) & (arrivals != MISSING_TIME)
+        if not keep.all():
+            logging.info(f"Leaving {len(keep) - int(keep.sum())} untimed stop times or of unknown trips out")
+        order = np.flatnonzero(keep)[np.lexsort((sequence[keep], trip_codes[keep]))]
+        stop_ids, stop_codes = np.unique(np.asarray(stop_column, dtype=str)[order], return_inverse=True)
+        trip_codes, stop_codes = trip_codes[order], stop_codes.reshape(-1)
+        arrivals, departures = arrivals[order], departures[order]
+
+        arrays: Dict[str, np.ndarray] = {"stop_ids": stop_ids, "trip_ids": trip_ids}
+        arrays.update(_services(trips, ServiceIndex(calendars or [])))
+        arrays.update(_connections(trip_codes, stop_codes, arrivals, departures))
+        arrays.update(_routes(trip_codes, stop_codes, arrivals, departures, len(stop_ids)))
+        return cls(arrays)
+
+    def save(self, path: str):
+        """Write every array to an uncompressed .npz file."""
+        np.savez(path, **{name: getattr(self, name) for name in ARRAYS})
+
+    @classmethod
+    def load(cls, path: str) -> "Timetable":
+        """Read a timetable written by save."""
+        with np.load(path) as data:
+            return cls({name: data[name] for name in ARRAYS})
+
+    def stop_index(self, stop_id: str) -> int:
+        """Index of a stop.
+
+        Throws:
+            KeyError:   When the timetable has no such stop.
+        """
+        return self._stop_index[stop_id]
+
+    def running(self, day: date) -> List[bool]:
+        """Whether each trip runs on a date, trips without a calendar never do."""
+        ordinal = day.toordinal()
+        running = ((self.service_masks >> day.weekday()) & 1).astype(bool) & \
+            (self.service_ranges[:, 0] <= ordinal) & (ordinal <= self.service_ranges[:, 1])
+        # Trips without a calendar have service -1, which picks the False on the end
+        return np.append(running, False)[self.trip_services].tolist()
+
+    def earliest_arrival(self, source: str, departure_time: int, target: Optional[str] = None,
+                         day: Optional[date] = None) -> Dict[str, int]:
+        """Earliest arrival at stops leaving a stop at a time, with the connection scan algorithm.
+        Connections are scanned once in departure order from the first leaving at departure_time.
+
+        Arguments:
+            source:         Stop ID to leave from.
+            departure_time: Seconds since midnight to leave at, or after.
+            target:         Optional, stop ID to get to, scanning stops once nothing left can
+                            arrive earlier.
+            day:            Optional, date of the journey, only trips running that day are
+                            ridden. Every trip is if not given.
+
+        Throws:
+            KeyError:   When either stop is not in the timetable.
+        Returns:
+            Mapping of stop ID to earliest arrival in seconds for every reachable stop, only the
+            target if given.
+        """
+        dep_stops, arr_stops, dep_times, arr_times, connection_trips = self._connection_lists()
+        arrival = [UNREACHED] * len(self.stop_ids)
+        on_trip = [False] * len(self.trip_ids)
+        running = self.running(day) if day is not None else None
+        arrival[self.stop_index(source)] = departure_time
+        target_index = self.stop_index(target) if target is not None else None
+        start = int(np.searchsorted(self.connection_dep_time, departure_time, side="left"))
+        for i in range(start, len(dep_times)):
+            if target_index is not None and dep_times[i] >= arrival[target_index]:
+                break
+            trip = connection_trips[i]
+            if running is not None and not running[trip]:
+                continue
+            if on_trip[trip] or arrival[dep_stops[i]] <= dep_times[i]:
+                on_trip[trip] = True
+                if arr_times[i] < arrival[arr_stops[i]]:
+                    arrival[arr_stops[i]] = arr_times[i]
+        return self._arrivals(arrival, target_index)
+
+    def raptor(self, source: str, departure_time: int, target: Optional[str] = None,
+               max_transfers: int = DEFAULT_MAX_TRANSFERS, day: Optional[date] = None) -> Dict[str, int]:
+        """Earliest arrival at stops leaving a stop at a time, with RAPTOR. Each round rides every
+        route serving a stop improved in the round before, so round k finds journeys with k - 1
+        transfers. Gives the same arrivals as earliest_arrival when transfers are not limited.
+
+        Arguments:
+            source:         Stop ID to leave from.
+            departure_time: Seconds since midnight to leave at, or after.
+            target:         Optional, stop ID to get to, arrivals later than the best there are pruned.
+            max_transfers:  Optional, most times the journey can change vehicle.
+            day:            Optional, date of the journey, only trips running that day are
+                            ridden. Every trip is if not given.
+
+        Throws:
+            KeyError:   When either stop is not in the timetable.
+        Returns:
+            Same as earliest_arrival.
+        """
+        best = [UNREACHED] * len(self.stop_ids)
+        source_index = self.stop_index(source)
+        target_index = self.stop_index(target) if target is not None else None
+        best[source_index] = departure_time
+        running = self.running(day) if day is not None else None
+        marked = {source_index}
+        for _ in range(max_transfers + 1):
+            previous = list(best)
+            # Earliest marked position on each route serving a marked stop
+            queue: Dict[int, int] = {}
+            for stop in marked:
+                start, end = self.stop_route_offsets[stop], self.stop_route_offsets[stop + 1]
+                for route, position in zip(self.stop_routes[start:end].tolist(),
+                                           self.stop_route_positions[start:end].tolist()):
+                    if position < queue.get(route, position + 1):
+                        queue[route] = position
+            marked = set()
+            for route, first in queue.items():
+                marked.update(self._scan_route(route, first, previous, best, target_index, running))
+            if len(marked) == 0:
+                break
+        return self._arrivals(best, target_index)
+
+    def _scan_route(self, route: int, first: int, previous: List[int], best: List[int],
+                    target_index: Optional[int], running: Optional[List[bool]] = None) -> List[int]:
+        """Ride a route from a position, catching the earliest running trip possible at each stop.
+
+        Returns:
+            Stops whose arrival improved.
+        """
+        stops = self.route_stops[self.route_stop_offsets[route]:self.route_stop_offsets[route + 1]].tolist()
+        trip_count = int(self.route_trip_offsets[route + 1] - self.route_trip_offsets[route])
+        width = len(stops)
+        base = int(self.route_time_offsets[route])
+        departures = self.route_departures[base:base + trip_count * width].reshape(trip_count, width)
+        route_trips = self.route_trips[self.route_trip_offsets[route]:self.route_trip_offsets[route + 1]].tolist()
+        arrivals = self.route_arrivals[base:base + trip_count * width].reshape(trip_count, width)
+        improved = []
+        trip = None
+        # Times of the trip being ridden, as lists since they are read one at a time
+        trip_arrivals: List[int] = []
+        trip_departures: List[int] = []
+        for position in range(first, width):
+            stop = stops[position]
+            if trip is not None:
+                arrival = trip_arrivals[position]
+                bound = best[target_index] if target_index is not None else UNREACHED
+                if arrival < best[stop] and arrival < bound:
+                    best[stop] = arrival
+                    improved.append(stop)
+            ready = previous[stop]
+            if ready == UNREACHED:
+                continue
+            # Trips of a route don't overtake, so departures at a stop are sorted. Only search
+            # when no trip is caught yet or the one before the current trip can be caught
+            if trip is None:
+                end = trip_count
+            elif trip > 0 and ready <= trip_departures[position] and departures[trip - 1, position] >= ready:
+                end = trip
+            else:
+                continue
+            earliest = int(np.searchsorted(departures[:end, position], ready, side="left"))
+            while running is not None and earliest < end and not running[route_trips[earliest]]:
+                earliest += 1
+            if earliest < end:
+                trip = earliest
+                trip_arrivals, trip_departures = arrivals[trip].tolist(), departures[trip].tolist()
+        return improved
+
+    def _connection_lists(self) -> Tuple[List[int], ...]:
+        """Connection arrays as lists, far quicker to index one element at a time."""
+        if self._lists is None:
+            self._lists = tuple(x.tolist() for x in (self.connection_dep_stop, self.connection_arr_stop,
+                                                      self.connection_dep_time, self.connection_arr_time,
+                                                      self.connection_trip))
+        return self._lists
+
+    def _arrivals(self, arrival: List[int], target_index: Optional[int]) -> Dict[str, int]:
+        if target_index is not None:
+            indices = [target_index] if arrival[target_index] < UNREACHED else []
+        else:
+            indices = [i for i, x in enumerate(arrival) if x < UNREACHED]
+        return {self.stop_ids[i].item(): int(arrival[i]) for i in indices}
+
+
+def _services(trips: Sequence[Trip], services: ServiceIndex) -> Dict[str, np.ndarray]:
+    """Service arrays from the trips and the index of the feed's calendars."""
+    service_ids = list(services.ranges)
+    lookup = {x: i for i, x in enumerate(service_ids)}
+    return {"trip_services": np.fromiter((lookup.get(x.service_id, -1) for x in trips), dtype=np.int32,
+                                         count=len(trips)),
+            "service_ids": np.asarray(service_ids, dtype=str),
+            "service_masks": np.asarray([services.masks[x] for x in service_ids], dtype=np.int8),
+            "service_ranges": np.asarray([[start.toordinal(), end.toordinal()] for start, end in
+                                          (services.ranges[x] for x in service_ids)], dtype=np.int32).reshape(-1, 2)}
+
+
+def _connections(trip_codes: np.ndarray, stop_codes: np.ndarray, arrivals: np.ndarray,
+                 departures: np.ndarray) -> Dict[str, np.ndarray]:
+    """Connection arrays from stop times sorted by trip and sequence."""
+    same_trip = trip_codes[1:] == trip_codes[:-1]
+    dep_time, arr_time = departures[:-1][same_trip], arrivals[1:][same_trip]
+    order = np.lexsort((arr_time, dep_time))
+    return {"connection_dep_stop": stop_codes[:-1][same_trip][order].astype(np.int32),
+            "connection_arr_stop": stop_codes[1:][same_trip][order].astype(np.int32),
+            "connection_dep_time": dep_time[order].astype(np.int32),
+            "connection_arr_time": arr_time[order].astype(np.int32),
+            "connection_trip": trip_codes[:-1][same_trip][order].astype(np.int32)}
+
+
+def _routes(trip_codes: np.ndarray, stop_codes: np.ndarray, arrivals: np.ndarray, departures: np.ndarray,
+            stop_count: int) -> Dict[str, np.ndarray]:
+    """RAPTOR route arrays from stop times sorted by trip and sequence."""
+    starts = np.flatnonzero(np.r_[True, trip_codes[1:] != trip_codes[:-1]]) if len(trip_codes) else np.empty(0, int)
+    ends = np.r_[starts[1:], len(trip_codes)].astype(np.int64)
+    # Group trips by their stop sequence, earliest departing first
+    patterns: Dict[Tuple[int, ...], List[int]] = {}
+    for i in np.argsort(departures[starts], kind="stable").tolist():
+        patterns.setdefault(tuple(stop_codes[starts[i]:ends[i]].tolist()), []).append(i)
+
+    route_stops, route_trips, route_arrivals, route_departures = [], [], [], []
+    stop_counts, trip_counts = [], []
+    for stops, trip_rows in patterns.items():
+        # Split the pattern into routes whose trips never overtake each other
+        routes: List[List[int]] = []
+        for i in trip_rows:
+            arrival, departure = arrivals[starts[i]:ends[i]], departures[starts[i]:ends[i]]
+            for route in routes:
+                last = route[-1]
+                if (arrival >= arrivals[starts[last]:ends[last]]).all() and \
+                        (departure >= departures[starts[last]:ends[last]]).all():
+                    route.append(i)
+                    break
+            else:
+                routes.append([i])
+        for route in routes:
+            stop_counts.append(len(stops))
+            trip_counts.append(len(route))
+            route_stops.append(np.asarray(stops, dtype=np.int32))
+            route_trips.append(trip_codes[starts[route]].astype(np.int32))
+            for i in route:
+                route_arrivals.append(arrivals[starts[i]:ends[i]])
+                route_departures.append(departures[starts[i]:ends[i]])
+
+    def concat(parts: List[np.ndarray], dtype) -> np.ndarray:
+        return np.concatenate(parts).astype(dtype) if parts else np.empty(0, dtype=dtype)
+
+    route_stops_flat = concat(route_stops, np.int32)
+    route_stop_offsets = _offsets(np.asarray(stop_counts, dtype=np.int64))
+    # Routes serving each stop and where the stop is on the route
+    route_of_entry = np.repeat(np.arange(len(stop_counts), dtype=np.int32), stop_counts)
+    position_of_entry = np.arange(len(route_stops_flat)) - np.repeat(route_stop_offsets[:-1], stop_counts)
+    by_stop = np.argsort(route_stops_flat, kind="stable")
+    return {"route_stop_offsets": route_stop_offsets, "route_stops": route_stops_flat,
+            "route_trip_offsets": _offsets(np.asarray(trip_counts, dtype=np.int64)),
+            "route_trips": concat(route_trips, np.int32),
+            "route_time_offsets": _offsets(np.asarray(stop_counts, dtype=np.int64) * np.asarray(trip_counts,
+                                                                                                 dtype=np.int64)),
+            "route_arrivals": concat(route_arrivals, np.int32),
+            "route_departures": concat(route_departures, np.int32),
+            "stop_route_offsets": _offsets(np.bincount(route_stops_flat, minlength=stop_count)),
+            "stop_routes": route_of_entry[by_stop],
+            "stop_route_positions": position_of_entry[by_stop].astype(np.int32)}
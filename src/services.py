@@ -0,0 +1,100 @@
+import logging
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from .gtfs import Calendar, to_dict
+
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+DATE_FORMAT = "%Y%m%d"  # Format of GTFS calendar dates
+
+
+def parse_gtfs_date(value: str) -> date:
+    """Convert a GTFS date of the form YYYYMMDD into a date."""
+    return datetime.strptime(str(value), DATE_FORMAT).date()
+
+
+def weekday_mask(calendar: Calendar) -> int:
+    """Bitmask of the days a service runs on, bit 0 is Monday and bit 6 is Sunday.
+
+    Arguments:
+        calendar:   Calendar of the service.
+
+    Returns:
+        Bitmask of running days.
+    """
+    mask = 0
+    for bit, day in enumerate(WEEKDAYS):
+        if str(getattr(calendar, day)).strip() == "1":
+            mask |= 1 << bit
+    return mask
+
+
+class ServiceIndex:
+    """Index over calendar.txt built once per feed. Looks up a service's calendar by
+    service_id and answers which services run on a given date from each service's
+    weekday bitmask and date range. A calendar with a malformed date is logged and still
+    looked up by service_id, but is never taken to run on any date.
+
+    Attributes:
+        calendars:  Mapping of service_id to its calendar.
+        masks:      Mapping of service_id to its weekday bitmask, only of calendars with valid dates.
+        ranges:     Mapping of service_id to its first and last date, only of calendars with valid dates.
+    """
+    calendars: Dict[str, Calendar]
+    masks: Dict[str, int]
+    ranges: Dict[str, Tuple[date, date]]
+
+    def __init__(self, calendars: Iterable[Calendar]) -> None:
+        """Constructor"""
+        self.calendars = {}
+        self.masks = {}
+        self.ranges = {}
+        self._by_weekday: List[List[str]] = [[] for _ in WEEKDAYS]
+        for calendar in calendars:
+            if calendar.service_id in self.calendars:
+                continue
+            self.calendars[calendar.service_id] = calendar
+            try:
+                dates = (parse_gtfs_date(calendar.start_date), parse_gtfs_date(calendar.end_date))
+            except ValueError as err:
+                logging.warning(f"Service {calendar.service_id} has an invalid date, it runs on no date: {err}")
+                continue
+            self.masks[calendar.service_id] = weekday_mask(calendar)
+            self.ranges[calendar.service_id] = dates
+            for bit in range(len(WEEKDAYS)):
+                if self.masks[calendar.service_id] & (1 << bit):
+                    self._by_weekday[bit].append(calendar.service_id)
+
+    def get(self, service_id: str) -> Optional[Calendar]:
+        return self.calendars.get(service_id)
+
+    def get_dict(self, service_id: str) -> Dict:
+        """Calendar of a service as a dictionary, empty if the service has no calendar."""
+        calendar = self.calendars.get(service_id)
+        return to_dict(calendar) if calendar is not None else {}
+
+    def runs_on(self, service_id: str, day: date) -> bool:
+        """Whether a service runs on a given date."""
+        if service_id not in self.masks:
+            return False
+        start, end = self.ranges[service_id]
+        return start <= day <= end and bool(self.masks[service_id] & (1 << day.weekday()))
+
+    def services_on(self, day: date) -> List[str]:
+        """IDs of the services that run on a given date."""
+        result = []
+        for service_id in self._by_weekday[day.weekday()]:
+            start, end = self.ranges[service_id]
+            if start <= day <= end:
+                result.append(service_id)
+        return result
+
+    def service_days(self, service_id: str) -> Iterator[date]:
+        """Every date a service runs on, in order."""
+        if service_id not in self.masks:
+            return
+        start, end = self.ranges[service_id]
+        day = start
+        while day <= end:
+            if self.masks[service_id] & (1 << day.weekday()):
+                yield day
+            day += timedelta(days=1)
@@ -0,0 +1,276 @@
+import logging
+import math
+import mmap
+import os
+import struct
+import sys
+from array import array
+from typing import Dict, List, Optional, Sequence, Tuple
+from .gtfs import FILE_TO_OBJECT_MAPPINGS, FILE_TO_PARAMETER_NAME, StopTimeColumns, to_dict
+
+MAGIC = b"GTFSSNP1"
+VERSION = 1
+HEADER = struct.Struct("<8sIIc")  # Magic, version, number of sections, byte order of arrays
+SECTION = struct.Struct("<32scQQ")  # Name, array typecode, offset, number of items
+ALIGNMENT = 8
+STRING_COLUMN = "S"  # Typecode marking a column of indices into the string table
+STRING_INDEX = "I"  # Array typecode string indices are stored as
+
+# Object type of each table, keyed by the same names as FILE_TO_PARAMETER_NAME
+TABLE_TYPES = {FILE_TO_PARAMETER_NAME[k]: v for k, v in FILE_TO_OBJECT_MAPPINGS.items()}
+
+# Typecodes of columns that are not strings, every other column goes in the string table
+NUMERIC_COLUMNS = {
+    "stops": {"stop_lat": "d", "stop_lon": "d"},
+    "stop_times": {"arrival_time": "i", "departure_time": "i", "stop_sequence": "i", "shape_dist_traveled": "d"},
+}
+
+
+def _columns(table: str) -> List[str]:
+    return list(TABLE_TYPES[table].__annotations__)
+
+
+def _typecode(table: str, column: str) -> str:
+    return NUMERIC_COLUMNS.get(table, {}).get(column, STRING_COLUMN)
+
+
+def _to_float(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return math.nan
+
+
+class _StringTable:
+    """Deduplicated strings, each stored once and referred to by index."""
+    def __init__(self) -> None:
+        self.indices: Dict[str, int] = {}
+        self.offsets = array('Q', [0])
+        self.data = bytearray()
+
+    def add(self, value) -> int:
+        value = "" if value is None else str(value)
+        if value not in self.indices:
+            self.indices[value] = len(self.indices)
+            self.data += value.encode("utf-8")
+            self.offsets.append(len(self.data))
+        return self.indices[value]
+
+
+def write_snapshot(path: str, feed: Dict[str, Sequence]) -> None:
+    """Write parsed GTFS data to a binary snapshot that can be reopened without parsing.
+    Numeric columns are stored as fixed width arrays, every other column as indices into
+    a shared string table. Stop times are stored grouped by trip in trips order along with
+    the offsets of each trip's stop times.
+
+    Parameters:
+        path:   File to write the snapshot to.
+        feed:   Mapping of table name as in FILE_TO_PARAMETER_NAME to its loaded objects,
+                stop_times can also be StopTimeColumns.
+
+    Throws:
+        ValueError: When trips are missing but stop times are given.
+    """
+    strings = _StringTable()
+    sections: List[Tuple[str, str, array]] = []
+    lengths = array('Q')
+    table_names = [x for x in TABLE_TYPES if x in feed and x != "stop_times"]
+    for table in table_names:
+        rows = feed[table]
+        lengths.append(len(rows))
+        for column in _columns(table):
+            typecode = _typecode(table, column)
+            if typecode == STRING_COLUMN:
+                values = array(STRING_INDEX, (strings.add(getattr(x, column, "")) for x in rows))
+            else:
+                values = array(typecode, (_to_float(getattr(x, column, "")) for x in rows))
+            sections.append((f"{table}.{column}", typecode, values))
+
+    if "stop_times" in feed:
+        if "trips" not in feed:
+            raise ValueError("Trips are needed to index stop times by trip")
+        stop_times = feed["stop_times"]
+        if not isinstance(stop_times, StopTimeColumns):
+            columns = StopTimeColumns()
+            for x in stop_times:
+                columns.append(to_dict(x))
+            stop_times = columns
+        trip_index = {x.trip_id: i for i, x in enumerate(feed["trips"])}
+        unknown = len(trip_index)
+        order = sorted(range(len(stop_times)), key=lambda i: trip_index.get(stop_times.trip_id[i], unknown))
+        trip_offsets = array('Q', [0] * (unknown + 1))
+        for i in order:
+            trip_offsets[trip_index.get(stop_times.trip_id[i], unknown)] += 1
+        total = 0
+        for i in range(unknown + 1):
+            trip_offsets[i], total = total, total + trip_offsets[i]
+        if total > trip_offsets[unknown]:
+            logging.warning(f"{total - trip_offsets[unknown]} stop times belong to unknown trips")
+        table_names.append("stop_times")
+        lengths.append(len(order))
+        for column in _columns("stop_times"):
+            typecode = _typecode("stop_times", column)
+            source = getattr(stop_times, column)
+            if typecode == STRING_COLUMN:
+                values = array(STRING_INDEX, (strings.add(source[i]) for i in order))
+            else:
+                values = array(typecode, (source[i] for i in order))
+            sections.append((f"stop_times.{column}", typecode, values))
+        sections.append(("stop_times.trip_offsets", "Q", trip_offsets))
+
+    sections.append(("tables.names", STRING_INDEX, array(STRING_INDEX, (strings.add(x) for x in table_names))))
+    sections.append(("tables.lengths", "Q", lengths))
+    sections.append(("strings.offsets", "Q", strings.offsets))
+    sections.append(("strings.data", "B", array('B', bytes(strings.data))))
+
+    offset = HEADER.size + SECTION.size * len(sections)
+    directory, payloads = [], []
+    for name, typecode, values in sections:
+        offset += -offset % ALIGNMENT
+        directory.append(SECTION.pack(name.encode("utf-8"), typecode.encode("ascii"), offset, len(values)))
+        payloads.append((offset, values.tobytes()))
+        offset += len(payloads[-1][1])
+
+    temp_path = path + ".tmp"
+    with open(temp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(sections), b"<" if sys.byteorder == "little" else b">"))
+        f.write(b"".join(directory))
+        for offset, payload in payloads:
+            f.write(b"\0" * (offset - f.tell()))
+            f.write(payload)
+    os.replace(temp_path, path)
+
+
+class StringColumn:
+    """Column of strings backed by string table indices in a snapshot. Strings are
+    decoded when first accessed and shared between every column that uses them."""
+    def __init__(self, snapshot: "Snapshot", indices: memoryview) -> None:
+        self.snapshot = snapshot
+        self.indices = indices
+
+    def __len__(self) -> int:
+        return len(self.indices)
+
+    def __getitem__(self, index: int) -> str:
+        return self.snapshot.string(self.indices[index])
+
+    def __iter__(self):
+        for i in self.indices:
+            yield self.snapshot.string(i)
+
+
+class Snapshot:
+    """Read only view of a snapshot written by write_snapshot. The file is memory mapped
+    and numeric columns are returned as memoryviews over the mapping, so nothing is read
+    until it is used. Call close, or use it as a context manager, when finished; if
+    columns are still held the file stays mapped until they are released.
+
+    Attributes:
+        path:       Snapshot file.
+        lengths:    Mapping of table name to its number of rows.
+    """
+    path: str
+    lengths: Dict[str, int]
+
+    def __init__(self, path: str) -> None:
+        """Constructor, maps the file and reads its section directory.
+
+        Throws:
+            ValueError: When the file is not a snapshot this version can read.
+        """
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mmap)
+        magic, version, count, byteorder = HEADER.unpack_from(self._mmap, 0)
+        native = b"<" if sys.byteorder == "little" else b">"
+        if magic != MAGIC or version != VERSION or byteorder != native:
+            self.close()
+            raise ValueError(f"{path} is not a readable snapshot")
+        self._sections: Dict[str, Tuple[str, int, int]] = {}
+        for i in range(count):
+            name, typecode, offset, length = SECTION.unpack_from(self._mmap, HEADER.size + i * SECTION.size)
+            self._sections[name.rstrip(b"\0").decode("utf-8")] = (typecode.decode("ascii"), offset, length)
+        self._string_offsets = self._array("strings.offsets")
+        self._string_data = self._array("strings.data")
+        self._strings: List[Optional[str]] = [None] * (len(self._string_offsets) - 1)
+        names = [self.string(x) for x in self._array("tables.names")]
+        self.lengths = dict(zip(names, self._array("tables.lengths")))
+
+    def _array(self, name: str) -> memoryview:
+        typecode, offset, length = self._sections[name]
+        typecode = STRING_INDEX if typecode == STRING_COLUMN else typecode
+        size = struct.calcsize(typecode)
+        return self._view[offset:offset + length * size].cast(typecode)
+
+    def string(self, index: int) -> str:
+        """String at an index of the string table."""
+        value = self._strings[index]
+        if value is None:
+            start, end = self._string_offsets[index], self._string_offsets[index + 1]
+            value = sys.intern(bytes(self._string_data[start:end]).decode("utf-8"))
+            self._strings[index] = value
+        return value
+
+    def column(self, table: str, column: str):
+        """A column of a table without copying it.
+
+        Parameters:
+            table:  Table name as in FILE_TO_PARAMETER_NAME.
+            column: Column name.
+
+        Throws:
+            KeyError:   When the snapshot has no such column.
+        Returns:
+            memoryview for numeric columns, StringColumn otherwise.
+        """
+        name = f"{table}.{column}"
+        if name not in self._sections:
+            raise KeyError(f"No column {name} in snapshot")
+        if self._sections[name][0] == STRING_COLUMN:
+            return StringColumn(self, self._array(name))
+        return self._array(name)
+
+    def trip_stop_times(self, trip_index: int) -> range:
+        """Rows of stop_times belonging to the trip at an index of the trips table."""
+        offsets = self._array("stop_times.trip_offsets")
+        return range(offsets[trip_index], offsets[trip_index + 1])
+
+    def load(self, table: str) -> List:
+        """Build objects for every row of a table, same as load_gtfs_from_file would give."""
+        obj_type = TABLE_TYPES[table]
+        columns = {x: self.column(table, x) for x in _columns(table)}
+        results = []
+        for i in range(self.lengths[table]):
+            inst = obj_type()
+            for name, values in columns.items():
+                value = values[i]
+                setattr(inst, name, None if isinstance(value, float) and math.isnan(value) else value)
+            results.append(inst)
+        return results
+
+    def stop_time_columns(self) -> StopTimeColumns:
+        """Stop times as StopTimeColumns whose columns are views over the snapshot."""
+        columns = StopTimeColumns()
+        for name in _columns("stop_times"):
+            setattr(columns, name, self.column("stop_times", name))
+        return columns
+
+    def feed(self) -> Dict[str, Sequence]:
+        """Every table in the snapshot keyed as in FILE_TO_PARAMETER_NAME, stop times as StopTimeColumns."""
+        return {x: self.stop_time_columns() if x == "stop_times" else self.load(x) for x in self.lengths}
+
+    def close(self) -> None:
+        self._string_offsets = self._string_data = None
+        try:
+            self._view.release()
+            self._mmap.close()
+        except BufferError:
+            # Columns are still held elsewhere, the mapping is freed once they are gone
+            logging.debug(f"Snapshot {self.path} still has columns in use, leaving it mapped")
+
+    def __enter__(self) -> "Snapshot":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
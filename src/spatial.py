@@ -0,0 +1,210 @@
+import heapq
+import math
+from typing import Dict, Iterable, List, Optional, Tuple
+from .gtfs import Stop
+
+EARTH_RADIUS = 6371008.8  # Mean earth radius in metres
+STOPS_PER_CELL = 2  # Average stops per occupied cell aimed for when the cell size is picked
+MIN_CELL_SIZE = 50.0  # Metres, stops closer than this are not worth splitting into separate cells
+PROJECTION_SLACK = 0.99  # Projected distances can be off from great circle ones by this ratio at the origin
+
+
+class StopIndex:
+    """Grid index over stops for nearest stop, radius and bounding box queries.
+    Coordinates are projected to metres with an equirectangular projection centred on
+    the stops and bucketed into square cells, so a query only looks at the cells around
+    it instead of every stop. Reported distances are great circle distances, the
+    projection is only used to pick which cells to look in. East west distances are
+    scaled by the origin's latitude, so they are stretched for points nearer a pole
+    and queries widen their search by how far the query and stops are from the origin.
+
+    Attributes:
+        stops:          Indexed stops, stops without coordinates are left out.
+        cell_size:      Length of a cell side in metres.
+        origin_lat:     Latitude the projection is centred on.
+        cells:          Mapping of cell to indices of the stops in it.
+    """
+    stops: List[Stop]
+    cell_size: float
+    origin_lat: float
+    cells: Dict[Tuple[int, int], List[int]]
+
+    def __init__(self, stops: Iterable[Stop], cell_size: Optional[float] = None,
+                 origin_lat: Optional[float] = None) -> None:
+        """Constructor
+
+        Arguments:
+            stops:      Stops to index.
+            cell_size:  Optional, length of a cell side in metres, picked from how dense the
+                        stops are if not given.
+            origin_lat: Optional, latitude to centre the projection on, defaults to the mean.
+        """
+        self.stops = [x for x in stops if x.stop_lat is not None and x.stop_lon is not None]
+        if origin_lat is None:
+            origin_lat = sum(x.stop_lat for x in self.stops) / len(self.stops) if self.stops else 0.0
+        self.origin_lat = origin_lat
+        self._set_projection()
+        self.cell_size = cell_size or self._pick_cell_size()
+        self.cells = {}
+        for i, point in enumerate(self._points):
+            self.cells.setdefault(self._cell(point), []).append(i)
+        self._set_bounds()
+
+    def _set_projection(self):
+        self._scale_x = math.cos(math.radians(self.origin_lat)) * math.radians(1) * EARTH_RADIUS
+        self._scale_y = math.radians(1) * EARTH_RADIUS
+        self._points = [self.project(x.stop_lat, x.stop_lon) for x in self.stops]
+        self._max_lat = max((abs(x.stop_lat) for x in self.stops), default=0.0)
+
+    def _set_bounds(self):
+        """Lowest and highest occupied cell on each axis."""
+        self._low = (min((x for x, _ in self.cells), default=0), min((y for _, y in self.cells), default=0))
+        self._high = (max((x for x, _ in self.cells), default=0), max((y for _, y in self.cells), default=0))
+
+    def _pick_cell_size(self) -> float:
+        """Cell size giving about STOPS_PER_CELL stops a cell if they were spread evenly over their bounds."""
+        if len(self._points) < 2:
+            return MIN_CELL_SIZE
+        width = max(x for x, _ in self._points) - min(x for x, _ in self._points)
+        height = max(y for _, y in self._points) - min(y for _, y in self._points)
+        area = max(width, MIN_CELL_SIZE) * max(height, MIN_CELL_SIZE)
+        return max(MIN_CELL_SIZE, math.sqrt(area * STOPS_PER_CELL / len(self._points)))
+
+    def project(self, lat: float, lon: float) -> Tuple[float, float]:
+        """Project a coordinate to metres east and north."""
+        return lon * self._scale_x, lat * self._scale_y
+
+    def _stretch(self, lat: float) -> float:
+        """Most a projected distance between a query at a latitude and any stop can be over
+        the great circle one, as the ratio of the origin's east west scale to the scale at
+        the latitude nearest a pole either can be at."""
+        furthest = math.cos(math.radians(min(max(abs(lat), self._max_lat), 89.9)))
+        return max(1.0, math.cos(math.radians(self.origin_lat)) / furthest) / PROJECTION_SLACK
+
+    def _cell(self, point: Tuple[float, float]) -> Tuple[int, int]:
+        return math.floor(point[0] / self.cell_size), math.floor(point[1] / self.cell_size)
+
+    def _distance(self, index: int, lat: float, lon: float) -> float:
+        stop = self.stops[index]
+        return haversine(lat, lon, stop.stop_lat, stop.stop_lon)
+
+    def _ring(self, centre: Tuple[int, int], radius: int) -> Iterable[Tuple[int, int]]:
+        """Cells exactly radius cells away from the centre cell, clipped to the occupied
+        cells so a query far from every stop stays cheap."""
+        cx, cy = centre
+        if radius == 0:
+            yield centre
+            return
+        low_x, high_x = max(cx - radius, self._low[0]), min(cx + radius, self._high[0])
+        low_y, high_y = max(cy - radius + 1, self._low[1]), min(cy + radius - 1, self._high[1])
+        for y in (cy - radius, cy + radius):
+            if self._low[1] <= y <= self._high[1]:
+                for x in range(low_x, high_x + 1):
+                    yield x, y
+        for x in (cx - radius, cx + radius):
+            if self._low[0] <= x <= self._high[0]:
+                for y in range(low_y, high_y + 1):
+                    yield x, y
+
+    def nearest(self, lat: float, lon: float, k: int = 1) -> List[Tuple[Stop, float]]:
+        """The k stops closest to a coordinate.
+
+        Arguments:
+            lat:    Latitude.
+            lon:    Longitude.
+            k:      Optional, number of stops wanted.
+
+        Returns:
+            Up to k stops with their distance in metres, closest first.
+        """
+        if k < 1 or len(self.stops) == 0:
+            return []
+        point = self.project(lat, lon)
+        centre = self._cell(point)
+        # Furthest ring that can hold a stop, stops the search if k is more than the stops
+        max_ring = max(centre[0] - self._low[0], self._high[0] - centre[0],
+                       centre[1] - self._low[1], self._high[1] - centre[1])
+        best: List[Tuple[float, int]] = []  # Max heap of negated distances
+        stretch = self._stretch(lat)
+        ring = 0
+        while ring <= max_ring:
+            for cell in self._ring(centre, ring):
+                for i in self.cells.get(cell, ()):
+                    distance = self._distance(i, lat, lon)
+                    if len(best) < k:
+                        heapq.heappush(best, (-distance, i))
+                    elif distance < -best[0][0]:
+                        heapq.heapreplace(best, (-distance, i))
+            # Anything in the next ring is at least this far away
+            if len(best) == k and -best[0][0] <= ring * self.cell_size / stretch:
+                break
+            ring += 1
+        return [(self.stops[i], -d) for d, i in sorted(best, reverse=True)]
+
+    def within_radius(self, lat: float, lon: float, radius: float) -> List[Tuple[Stop, float]]:
+        """Stops within a distance of a coordinate.
+
+        Arguments:
+            lat:    Latitude.
+            lon:    Longitude.
+            radius: Distance in metres.
+
+        Returns:
+            Stops with their distance in metres, closest first.
+        """
+        point = self.project(lat, lon)
+        reach = radius * self._stretch(lat)
+        low = self._cell((point[0] - reach, point[1] - reach))
+        high = self._cell((point[0] + reach, point[1] + reach))
+        results = []
+        for cx in range(low[0], high[0] + 1):
+            for cy in range(low[1], high[1] + 1):
+                for i in self.cells.get((cx, cy), ()):
+                    distance = self._distance(i, lat, lon)
+                    if distance <= radius:
+                        results.append((distance, i))
+        return [(self.stops[i], d) for d, i in sorted(results)]
+
+    def in_bbox(self, min_lat: float, min_lon: float, max_lat: float, max_lon: float) -> List[Stop]:
+        """Stops inside a bounding box, in index order."""
+        low = self._cell(self.project(min_lat, min_lon))
+        high = self._cell(self.project(max_lat, max_lon))
+        results = []
+        for cx in range(low[0], high[0] + 1):
+            for cy in range(low[1], high[1] + 1):
+                results.extend(i for i in self.cells.get((cx, cy), ())
+                               if min_lat <= self.stops[i].stop_lat <= max_lat
+                               and min_lon <= self.stops[i].stop_lon <= max_lon)
+        return [self.stops[i] for i in sorted(results)]
+
+    def to_dict(self) -> Dict:
+        """Index as a json serialisable dictionary, cells are kept so loading needs no rebuild."""
+        return {"cell_size": self.cell_size, "origin_lat": self.origin_lat,
+                "stops": [[x.stop_id, x.stop_name, x.stop_lat, x.stop_lon] for x in self.stops],
+                "cells": [[cx, cy, indices] for (cx, cy), indices in self.cells.items()]}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "StopIndex":
+        """Load an index written by to_dict."""
+        index = cls.__new__(cls)
+        index.stops = [Stop(*x) for x in data["stops"]]
+        index.cell_size = data["cell_size"]
+        index.origin_lat = data["origin_lat"]
+        index._set_projection()
+        index.cells = {(cx, cy): indices for cx, cy, indices in data["cells"]}
+        index._set_bounds()
+        return index
+
+
+def brute_force_nearest(stops: List[Stop], lat: float, lon: float, k: int = 1) -> List[Tuple[Stop, float]]:
+    """Linear scan for the k closest stops, the baseline StopIndex is checked and benchmarked against."""
+    return heapq.nsmallest(k, ((x, haversine(lat, lon, x.stop_lat, x.stop_lon)) for x in stops
+                               if x.stop_lat is not None and x.stop_lon is not None), key=lambda x: x[1])
+
+
+def haversine(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great circle distance in metres between two coordinates."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = math.sin((phi2 - phi1) / 2) ** 2 + \
+        math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS * math.asin(math.sqrt(a))
@@ -0,0 +1,101 @@
+import logging
+from typing import Dict, Iterable, List, Optional
+
+from pymongo import database
+from .bulk import BulkWriteStats, BulkWriter, DEFAULT_BATCH_SIZE
+from .indexes import IndexKeys, create_indexes
+
+STAGING_SUFFIX = "_staging"  # Added to the live collection's name for the collection loaded into
+MIN_SWAP_RATIO = 0.5  # Least documents a swap can leave as a fraction of the live collection's
+
+
+class StagingError(Exception):
+    """Raised when a staged collection fails validation and is not swapped in."""
+
+
+class StagedCollection:
+    """Loads the next version of a collection beside the live one and swaps it in with a
+    single rename once it is complete, so readers only ever see a whole version and the
+    previous one is dropped rather than deleted document by document.
+
+    Attributes:
+        mongo_db:       Mongo database.
+        live_name:      Name of the collection readers use.
+        staging_name:   Name of the collection the next version is loaded into.
+        batch_size:     Number of documents to send to the database at a time.
+        min_ratio:      Least documents the staged version must have as a fraction of the live
+                        one's for the swap to go ahead, guards against a broken feed emptying it.
+        expected:       Number of documents written so far.
+    """
+    mongo_db: database.Database
+    live_name: str
+    staging_name: str
+    batch_size: int
+    min_ratio: float
+    expected: int
+
+    def __init__(self, mongo_db: database.Database, live_name: str, batch_size: int = DEFAULT_BATCH_SIZE,
+                 min_ratio: float = MIN_SWAP_RATIO) -> None:
+        """Constructor, drops whatever a failed earlier load left in the staging collection."""
+        self.mongo_db = mongo_db
+        self.live_name = live_name
+        self.staging_name = live_name + STAGING_SUFFIX
+        self.batch_size = batch_size
+        self.min_ratio = min_ratio
+        self.expected = 0
+        self.mongo_db[self.staging_name].drop()
+
+    def write(self, documents: Iterable[Dict]) -> BulkWriteStats:
+        """Insert documents into the staging collection."""
+        stats = BulkWriter(self.mongo_db[self.staging_name], self.batch_size).write(documents)
+        self.expected += stats.documents
+        return stats
+
+    def carry_over(self, query: Dict) -> int:
+        """Copy the live documents matching a query into the staging collection, for parts
+        of the collection that have not changed since the live version was loaded.
+
+        Returns:
+            Number of documents copied.
+        """
+        return self.write(self.mongo_db[self.live_name].find(query)).documents
+
+    def discard(self, query: Dict):
+        """Delete the staged documents matching a query, left behind by a write that failed part way."""
+        self.mongo_db[self.staging_name].delete_many(query)
+
+    def swap(self, indexes: List[IndexKeys]) -> int:
+        """Index the staging collection, check it holds every document written and replace
+        the live collection with it.
+
+        Parameters:
+            indexes:    Keys of the indexes the live collection should have.
+
+        Throws:
+            StagingError:   When documents are missing or there are too few compared to the
+                            live collection. The staging collection is dropped and the live
+                            one left as it was.
+        Returns:
+            Number of documents in the new live collection.
+        """
+        staging = self.mongo_db[self.staging_name]
+        count = staging.count_documents({})
+        live_count = self.mongo_db[self.live_name].count_documents({})
+        problem: Optional[str] = None
+        if count != self.expected:
+            problem = f"{self.staging_name} has {count} documents but {self.expected} were written"
+        elif count == 0:
+            problem = f"Nothing was loaded into {self.staging_name}"
+        elif count < live_count * self.min_ratio:
+            problem = f"{self.staging_name} has {count} documents, too few to replace {live_count} in {self.live_name}"
+        if problem is not None:
+            self.abort()
+            raise StagingError(problem)
+        create_indexes(staging, indexes)
+        staging.rename(self.live_name, dropTarget=True)
+        logging.info(f"Swapped {self.staging_name} in for {self.live_name}, {count} documents replace {live_count}")
+        return count
+
+    def abort(self):
+        """Drop the staging collection, leaving the live one as it is."""
+        self.mongo_db[self.staging_name].drop()
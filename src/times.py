@@ -0,0 +1,226 @@
+from array import array
+from operator import attrgetter, itemgetter
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from .gtfs import MISSING_SEQUENCE, MISSING_TIME, StopTimeColumns, parse_gtfs_time
+
+ZERO = ord("0")
+COLON = ord(":") - ZERO
+MIN_TIME_WIDTH = 8  # Characters in HH:MM:SS, times are right aligned to at least this
+BLANK_SEQUENCE = np.iinfo(np.int64).max  # Sorts stops without a stop_sequence after the rest of their trip
+
+
+def parse_times(values: Iterable[str]) -> np.ndarray:
+    """Parse GTFS times of the form H:MM:SS or HH:MM:SS into seconds since midnight, all
+    at once. Times are right aligned with zeros so the digits of each part sit in the
+    same columns of a character matrix, then every part is converted in one go.
+
+    Arguments:
+        values: Time strings, blank for stops without a set time. Hours can go past 23.
+
+    Throws:
+        ValueError: When a time is not in the HH:MM:SS format.
+    Returns:
+        int64 array of seconds, MISSING_TIME where the time was blank.
+    """
+    text = np.char.strip(np.asarray(list(values) if not isinstance(values, np.ndarray) else values, dtype=str))
+    if text.size == 0:
+        return np.empty(0, dtype=np.int64)
+    lengths = np.char.str_len(text)
+    blank = lengths == 0
+    width = max(MIN_TIME_WIDTH, int(lengths.max()))
+    padded = np.char.rjust(text, width, "0")
+    # Unicode strings are 4 bytes a character, view them as a matrix of code points
+    digits = padded.view(np.uint32).reshape(-1, width).astype(np.int64) - ZERO
+    is_colon = np.zeros(width, dtype=bool)
+    is_colon[[-3, -6]] = True
+    valid = np.where(is_colon, digits == COLON, (digits >= 0) & (digits <= 9)).all(axis=1) | blank
+    if not valid.all():
+        raise ValueError(f"Invalid GTFS time {text[~valid][0]!r}, expected HH:MM:SS")
+    powers = 10 ** np.arange(width - 7, -1, -1, dtype=np.int64)
+    hours = digits[:, :width - 6] @ powers
+    seconds = hours * 3600 + (digits[:, -5] * 10 + digits[:, -4]) * 60 + digits[:, -2] * 10 + digits[:, -1]
+    seconds[blank] = MISSING_TIME
+    return seconds
+
+
+def column_array(column: Union[array, memoryview, Sequence[int]]) -> np.ndarray:
+    """View an integer column as a numpy array, without copying if it is an array.array
+    or a snapshot's memoryview."""
+    if len(column) == 0:
+        return np.empty(0, dtype=np.int64)
+    if isinstance(column, array):
+        return np.frombuffer(column, dtype=np.dtype(column.typecode))
+    if isinstance(column, memoryview):
+        return np.frombuffer(column, dtype=np.dtype(column.format))
+    return np.asarray(column, dtype=np.int64)
+
+
+class TripTimes:
+    """Derived times of every trip in a set of stop times, worked out with array
+    operations over all stop times rather than trip by trip.
+
+    All values are in seconds. Stops are ordered by stop_sequence within a trip, stops
+    without one come last in the order they were given.
+
+    Attributes:
+        trip_ids:           Trip IDs in sorted order, the order of the other arrays.
+        starts:             Index of each trip's first stop in the sorted stop arrays.
+        ends:               Index after each trip's last stop.
+        first_departure:    Departure from the first stop, its arrival if no departure is given.
+        last_arrival:       Arrival at the last stop, its departure if no arrival is given.
+        duration:           last_arrival - first_departure.
+        dwell:              Departure minus arrival at every stop, sorted by trip and sequence.
+        run:                Arrival at every stop but the first of its trip minus departure from
+                            the stop before, at the index of the later stop.
+    """
+    trip_ids: List[str]
+    starts: np.ndarray
+    ends: np.ndarray
+    first_departure: np.ndarray
+    last_arrival: np.ndarray
+    duration: np.ndarray
+    dwell: np.ndarray
+    run: np.ndarray
+
+    def __init__(self, trip_ids: Sequence[str], stop_sequence: Sequence[int],
+                 arrivals: np.ndarray, departures: np.ndarray) -> None:
+        """Constructor
+
+        Arguments:
+            trip_ids:       Trip ID of each stop time, in any order.
+            stop_sequence:  Stop sequence of each stop time, None if blank.
+            arrivals:       Arrival of each stop time in seconds, MISSING_TIME if not given.
+            departures:     Departure of each stop time in seconds, MISSING_TIME if not given.
+        """
+        unique, codes = np.unique(np.asarray(trip_ids, dtype=str), return_inverse=True)
+        codes = codes.reshape(-1)
+        order = np.lexsort((sequence_array(stop_sequence), codes))
+        codes = codes[order]
+        arrivals = np.asarray(arrivals, dtype=np.int64)[order]
+        departures = np.asarray(departures, dtype=np.int64)[order]
+        self.trip_ids = unique.tolist()
+        first = np.ones(len(codes), dtype=bool)
+        first[1:] = codes[1:] != codes[:-1]
+        self.starts = np.flatnonzero(first)
+        self.ends = np.append(self.starts[1:], len(codes))
+
+        has_arrival, has_departure = arrivals != MISSING_TIME, departures != MISSING_TIME
+        # A stop with only one time given has it as both its arrival and departure
+        departs = np.where(has_departure, departures, arrivals)
+        arrives = np.where(has_arrival, arrivals, departures)
+        self.first_departure = departs[self.starts]
+        self.last_arrival = arrives[self.ends - 1]
+        self.duration = np.where((self.first_departure != MISSING_TIME) & (self.last_arrival != MISSING_TIME),
+                                 self.last_arrival - self.first_departure, MISSING_TIME)
+        self.dwell = np.where(has_arrival & has_departure, departures - arrivals, MISSING_TIME)
+        self.run = np.full(len(codes), MISSING_TIME, dtype=np.int64)
+        if len(codes) > 1:
+            known = ~first[1:] & (arrives[1:] != MISSING_TIME) & (departs[:-1] != MISSING_TIME)
+            self.run[1:] = np.where(known, arrives[1:] - departs[:-1], MISSING_TIME)
+        self._index = {trip_id: i for i, trip_id in enumerate(self.trip_ids)}
+
+    @classmethod
+    def from_stop_times(cls, stop_times) -> "TripTimes":
+        """Derived times of stop times loaded as StopTime objects, StopTimeColumns or the
+        stop dictionaries of a connected trip."""
+        if isinstance(stop_times, StopTimeColumns):
+            return cls(stop_times.trip_id, stop_times.stop_sequence,
+                       column_array(stop_times.arrival_time), column_array(stop_times.departure_time))
+        if len(stop_times) > 0 and isinstance(stop_times[0], dict):
+            field = itemgetter
+        else:
+            field = attrgetter
+        return cls(list(map(field("trip_id"), stop_times)), list(map(field("stop_sequence"), stop_times)),
+                   parse_times(map(field("arrival_time"), stop_times)),
+                   parse_times(map(field("departure_time"), stop_times)))
+
+    def get(self, trip_id: str) -> Optional[Dict]:
+        """Derived times of a trip as document fields, missing values as None.
+
+        Returns:
+            {"first_departure", "last_arrival", "duration", "dwell_times", "run_times"} where
+            dwell_times has an entry per stop and run_times one per pair of consecutive stops.
+            None if the trip has no stop times.
+        """
+        i = self._index.get(trip_id)
+        if i is None:
+            return None
+        start, end = self.starts[i], self.ends[i]
+        return {"first_departure": _value(self.first_departure[i]), "last_arrival": _value(self.last_arrival[i]),
+                "duration": _value(self.duration[i]), "dwell_times": _values(self.dwell[start:end]),
+                "run_times": _values(self.run[start + 1:end])}
+
+
+def _value(seconds) -> Optional[int]:
+    return None if seconds == MISSING_TIME else int(seconds)
+
+
+def _values(seconds: np.ndarray) -> List[Optional[int]]:
+    return [None if x == MISSING_TIME else x for x in seconds.tolist()]
+
+
+def trip_times_of(stops: List[Dict]) -> Dict:
+    """Derived times of a single trip from its stop dictionaries, the same fields as
+    TripTimes.get. Worked out in plain Python since setting up arrays for one trip's
+    few dozen stops costs far more than the sums themselves.
+
+    Arguments:
+        stops:  Stops of the trip as in a connected trip document, in any order.
+
+    Returns:
+        {"first_departure", "last_arrival", "duration", "dwell_times", "run_times"}, empty
+        if the trip has no stops.
+    """
+    if len(stops) == 0:
+        return {}
+    ordered = sorted(stops, key=_sequence_key)
+    arrivals = [parse_gtfs_time(x["arrival_time"]) for x in ordered]
+    departures = [parse_gtfs_time(x["departure_time"]) for x in ordered]
+    # A stop with only one time given has it as both its arrival and departure
+    departs = [d if d != MISSING_TIME else a for a, d in zip(arrivals, departures)]
+    arrives = [a if a != MISSING_TIME else d for a, d in zip(arrivals, departures)]
+    first, last = departs[0], arrives[-1]
+    return {"first_departure": _known(first), "last_arrival": _known(last),
+            "duration": last - first if MISSING_TIME not in (first, last) else None,
+            "dwell_times": [d - a if MISSING_TIME not in (a, d) else None for a, d in zip(arrivals, departures)],
+            "run_times": [a - d if MISSING_TIME not in (a, d) else None for d, a in zip(departs, arrives[1:])]}
+
+
+def _sequence_key(stop: Dict) -> Tuple[bool, int]:
+    """Sort key of a stop by its stop_sequence, stops without one last."""
+    sequence = stop["stop_sequence"]
+    return sequence is None, sequence or 0
+
+
+def sequence_array(stop_sequence: Union[array, memoryview, Sequence[Optional[int]]]) -> np.ndarray:
+    """Stop sequences as a numpy array, BLANK_SEQUENCE where one is None or, in a column,
+    MISSING_SEQUENCE."""
+    if isinstance(stop_sequence, (array, memoryview)):
+        column = column_array(stop_sequence).astype(np.int64)
+        return np.where(column == MISSING_SEQUENCE, BLANK_SEQUENCE, column)
+    return column_array([BLANK_SEQUENCE if x is None else x for x in stop_sequence])
+
+
+def _known(seconds: int) -> Optional[int]:
+    return None if seconds == MISSING_TIME else seconds
+
+
+def attach_trip_times(connections: Iterable[Dict], trip_times: Optional[TripTimes] = None) -> Iterator[Dict]:
+    """Add the derived times of each connected trip to its document.
+
+    Arguments:
+        connections:    Documents from connect_route_stops or stream_route_stops.
+        trip_times:     Optional, derived times of every trip worked out up front. If not given
+                        each trip's times are worked out from its own stops with trip_times_of,
+                        for streamed joins.
+
+    Returns:
+        Iterator of the documents with the fields of TripTimes.get added.
+    """
+    for connection in connections:
+        if trip_times is None:
+            yield connection | trip_times_of(connection["stops"])
+        else:
+            yield connection | (trip_times.get(connection["trip_id"]) or {})
@@ -1,4 +1,10 @@
-from typing import Dict, List, TypeVar
+import heapq
+import itertools
+import pickle
+import tempfile
+import zipfile
+from operator import attrgetter
+from typing import Dict, Iterable, Iterator, List, Optional, TypeVar, Union
 from .gtfs import *
 
 T = TypeVar('T')
@@ -16,34 +22,41 @@ def group_by(field: str, obj_list: List[T]) -> Dict[str, List[T]]:
     """
     result: Dict[str, List[T]] = {}
     for obj in obj_list:
-        if field not in obj.__dict__:
+        if not hasattr(obj, field):
             logging.warning(f"Field {field} not found in obj {type(obj)}")
             continue
-        value: str = obj.__dict__[field]
+        value: str = getattr(obj, field)
         if value not in result:
             result[value] = []
         result[value].append(obj)
     return result
 
 
-def connect_route_stops(routes: List[Route], stop_times: List[StopTime],
+def connect_route_stops(routes: List[Route], stop_times: Union[List[StopTime], StopTimeColumns],
                         trips: List[Trip]):
-    """Connect trip stops to the route they are associated with.
+    """Connect trip stops to the route they are associated with. Stop times loaded as
+    columns are grouped by row number and each stop is built straight from the columns,
+    so no StopTime objects are made.
 
     Parameters:
         routes:         List of routes.
-        stop_times:     List of stop times.
+        stop_times:     List of stop times or StopTimeColumns.
         trips:          List of trips.
 
     Returns:
         List with mappings of route to a given  trip_stops
-        in format {"stops": trip_stops, "route": route, "service_id": service_id} .
+        in format {"trip_id": trip_id, "stops": trip_stops, "route": route, "service_id": service_id} .
     """
     results = []
     route_ids = group_by("route_id", routes)
-    times_by_trip_id = group_by("trip_id", stop_times)
+    if isinstance(stop_times, StopTimeColumns):
+        rows_by_trip_id = stop_times.group_rows()
+        stops_of = lambda trip_id: [stop_times.row_dict(x) for x in rows_by_trip_id[trip_id]]
+    else:
+        times_by_trip_id = group_by("trip_id", stop_times)
+        stops_of = lambda trip_id: [to_dict(x) for x in times_by_trip_id[trip_id]]
     for trip in trips:
-        trip_stops = [x.__dict__ for x in times_by_trip_id[trip.trip_id]]
+        trip_stops = stops_of(trip.trip_id)
         route_list = []
         
         # Check if route id exists in list of routes
@@ -51,8 +64,137 @@ def connect_route_stops(routes: List[Route], stop_times: List[StopTime],
             logging.warn(f"Route id {trip.route_id} not present in routes file")
             route_list.append({})
         else:
-            route_list = [x.__dict__ for x in route_ids[trip.route_id]]
+            route_list = [to_dict(x) for x in route_ids[trip.route_id]]
         if len(route_list) > 1:
             logging.warning(f"route list for trip {trip} is bigger than 1")
-        results.append({"stops": trip_stops, "service_id": trip.service_id } | route_list[0])
+        results.append({"trip_id": trip.trip_id, "stops": trip_stops, "service_id": trip.service_id } | route_list[0])
     return results
+
+
+def is_clustered_by(field: str, obj_iter: Iterable[T]) -> bool:
+    """Check that objects sharing a value for a field all appear next to each other.
+
+    Arguments:
+        field:      Field to check.
+        obj_iter:   Objects to check, only read once.
+
+    Returns:
+        True if no value reappears after a different value came between.
+    """
+    seen = set()
+    previous = None
+    for obj in obj_iter:
+        value = getattr(obj, field)
+        if value == previous:
+            continue
+        if value in seen:
+            return False
+        seen.add(value)
+        previous = value
+    return True
+
+
+def _dump_sorted_chunk(chunk: List[T], field: str, spill_dir: str) -> str:
+    """Sort a chunk by a field and write it out to a temporary file.
+
+    Arguments:
+        chunk:      Objects to sort, keeps original order for equal values.
+        field:      Field to sort by.
+        spill_dir:  Directory to write the file to.
+
+    Returns:
+        Path of the file the chunk was written to.
+    """
+    chunk.sort(key=attrgetter(field))
+    with tempfile.NamedTemporaryFile("wb", dir=spill_dir, delete=False) as f:
+        for obj in chunk:
+            pickle.dump(obj, f, pickle.HIGHEST_PROTOCOL)
+        return f.name
+
+
+def _read_chunk(filename: str) -> Iterator[T]:
+    with open(filename, "rb") as f:
+        while True:
+            try:
+                yield pickle.load(f)
+            except EOFError:
+                return
+
+
+def external_sort(field: str, obj_iter: Iterable[T], chunk_size: int = 500000) -> Iterator[T]:
+    """Sort objects by a field using temporary files, so only chunk_size objects
+    are held in memory at once. Objects with equal values keep their original order.
+
+    Arguments:
+        field:      Field to sort by.
+        obj_iter:   Objects to sort.
+        chunk_size: Optional, number of objects to sort in memory at a time.
+
+    Returns:
+        Iterator of the objects sorted by the field.
+    """
+    with tempfile.TemporaryDirectory() as spill_dir:
+        chunk_files: List[str] = []
+        chunk: List[T] = []
+        for obj in obj_iter:
+            chunk.append(obj)
+            if len(chunk) >= chunk_size:
+                chunk_files.append(_dump_sorted_chunk(chunk, field, spill_dir))
+                chunk = []
+        if len(chunk_files) == 0:
+            # Everything fit in a single chunk, no need to touch the disk
+            chunk.sort(key=attrgetter(field))
+            yield from chunk
+            return
+        if len(chunk) > 0:
+            chunk_files.append(_dump_sorted_chunk(chunk, field, spill_dir))
+        chunk = []
+        logging.debug(f"Merging {len(chunk_files)} sorted chunks")
+        # heapq.merge is stable across its inputs, so equal values keep file order
+        yield from heapq.merge(*[_read_chunk(x) for x in chunk_files], key=attrgetter(field))
+
+
+def stream_route_stops(routes: List[Route], trips: List[Trip], stop_times_file: str,
+                       clustered: Optional[bool] = None, chunk_size: int = 500000,
+                       zip_file: Optional[zipfile.ZipFile] = None) -> Iterator[Dict]:
+    """Connect trip stops to the route they are associated with, reading stop times
+    straight from file and yielding one connected trip at a time. Only the stop times
+    of the current trip are kept in memory.
+
+    Stop times are expected to be clustered by trip_id, which is how GTFS feeds are
+    normally written. If they are not then they are sorted on disk first.
+
+    Parameters:
+        routes:             List of routes.
+        trips:              List of trips.
+        stop_times_file:    Path of the stop_times.txt file.
+        clustered:          Optional, whether stop times are clustered by trip_id, checked if not given.
+        chunk_size:         Optional, number of stop times to sort in memory at a time if not clustered.
+        zip_file:           Optional, zip file to read stop_times_file from instead of disk.
+
+    Returns:
+        Iterator of the same mappings connect_route_stops returns, in stop times file order.
+        Trips without stop times are left out.
+    """
+    route_ids = group_by("route_id", routes)
+    trips_by_id = {trip.trip_id: trip for trip in trips}
+    if clustered is None:
+        clustered = is_clustered_by("trip_id", iter_gtfs_from_file(stop_times_file, StopTime, zip_file))
+    stop_times = iter_gtfs_from_file(stop_times_file, StopTime, zip_file)
+    if not clustered:
+        logging.info("Stop times are not clustered by trip, sorting them first")
+        stop_times = external_sort("trip_id", stop_times, chunk_size)
+    for trip_id, trip_times in itertools.groupby(stop_times, key=attrgetter("trip_id")):
+        if trip_id not in trips_by_id:
+            logging.warning(f"Trip id {trip_id} not present in trips file")
+            continue
+        trip = trips_by_id[trip_id]
+        trip_stops = [to_dict(x) for x in trip_times]
+        route_list = [{}]
+        if trip.route_id not in route_ids:
+            logging.warning(f"Route id {trip.route_id} not present in routes file")
+        else:
+            route_list = [to_dict(x) for x in route_ids[trip.route_id]]
+        if len(route_list) > 1:
+            logging.warning(f"route list for trip {trip} is bigger than 1")
+        yield {"trip_id": trip.trip_id, "stops": trip_stops, "service_id": trip.service_id} | route_list[0]
@@ -1,99 +1,691 @@
+import contextlib
 import os
-from pymongo import database
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import get_context
+import bson
+from itertools import islice
+from pymongo import ReplaceOne, database
+from pymongo import collection as mongo_collection
+from .bulk import BulkWriter, BulkWriteStats, DEFAULT_BATCH_SIZE
+from .checkpoint import CheckpointStore
+from .departures import build_stop_indexes, insert_stop_indexes
+from .cache import CacheEntry
 from .download import DownloadService
+from .fetch import AsyncFetcher
+from .feed import Feed
+from .indexes import CALENDAR_INDEXES, ROUTE_INDEXES, create_indexes, route_indexes
+from .fingerprint import FEED_FIELD, FingerprintStore, sync_documents
+from .merge import FeedMerger, MERGE_DISTANCE
+from .metrics import Metrics, StageMetrics
+from .patterns import PatternCompressor, insert_patterns
+from .services import ServiceIndex
+from .staging import StagedCollection, StagingError
+from .times import TripTimes, attach_trip_times
 from .gtfs import *
-from .translation import connect_route_stops, group_by
-from typing import List, Dict
+from .translation import connect_route_stops, group_by, stream_route_stops
+from typing import Iterable, List, Dict, Optional, Union
 
 COLLECTION_NAME = "routes"
+MERGED_COLLECTION = "merged_routes"
 SERVICE_CALENDAR = "service_calendar"
+ZIP_NAME = "gtfs.zip"  # Name the downloaded zip is saved under in a feed's directory
+DOCUMENTS_NAME = "documents.bson"  # Name worker processes write a feed's documents under in its directory
+ROUTE_DOCUMENT_COLUMNS = {"trips": ["route_id", "service_id", "trip_id"]}  # Fields route documents use
 
 def get_calendar_range(service_id: str, calendar_dates: Dict[str, List[Calendar]]):
     """Get the calendar range for a given service along
 
     Parameters:
         service_id:     Id of the service
-        calendar_dates: Dictionary mapping date to list of calendar objects
+        calendar_dates: Dictionary mapping service id to list of calendar objects
 
     Returns
         Calendar object as a dictionary or an empty
     """
-    for cal_date in calendar_dates:
-        calendar_obj = calendar_dates[cal_date][0]
-        if calendar_obj.service_id == service_id:
-            return calendar_obj.__dict__
-    return {}
+    if service_id not in calendar_dates:
+        return {}
+    return to_dict(calendar_dates[service_id][0])
 
 def download_and_insert(data_sets: List[Dict[str, str]], download_service: DownloadService,
-    mongo_db: database.Database, collection: str = COLLECTION_NAME):
-    """Take a list of GTFS zip urls and download, extract and merge GTFS data. Then upload the merged data
+    mongo_db: database.Database, collection: str = COLLECTION_NAME, columnar: bool = False,
+    stream: bool = False, fingerprints: Optional[FingerprintStore] = None, metrics: Optional[Metrics] = None,
+    fetcher: Optional[AsyncFetcher] = None, staging: bool = False, checkpoints: Optional[CheckpointStore] = None):
+    """Take a list of GTFS zip urls and download and upload the data of each feed on its own.
+    merge_and_insert combines the feeds into one instead. The collection is indexed once
+    every feed is loaded, so no feed is inserted into an indexed collection
 
     Parameters:
         data_sets:          Dictionary with name and url of GTFS data { name: string, url: string }
-        download_service:   Service used to download data if there is a difference
+        download_service:   Service used to download data if there is a difference, None to use the
+                            fetcher's
         mongo_db:           Database to upload to
         collection:         Optional, name of the collection to upload to
+        columnar:           Optional, load stop times into typed columns to save memory
+        stream:             Optional, join stop times trip by trip as they are read from file
+        fingerprints:       Optional, fingerprints of uploaded trips so only changed trips are written
+        metrics:            Optional, records the time taken by each stage of each feed
+        fetcher:            Optional, download every feed at once with this first, then insert them
+                            one after another. Feeds that fail to download are logged and left out.
+                            It must download through download_service, e.g.
+                            AsyncFetcher(download_service), so its cache and previous downloads are used
+        staging:            Optional, load every feed into a staging collection and swap it in for
+                            the live one once it is complete and indexed, so readers never see a
+                            partial load. Can't be used with fingerprints, a fetcher or checkpoints
+        checkpoints:        Optional, progress of each feed's load. A feed that fails keeps its
+                            downloaded zip and is resumed from its last completed stage and
+                            acknowledged batch when run again, its directory is only deleted
+                            once it is completely loaded
     
+    Throws:
+        ValueError:     When staging is combined with fingerprints, a fetcher or checkpoints, checkpoints
+                        with a fetcher, or the fetcher downloads through a different service than
+                        download_service.
+        StagingError:   When the staged collection fails validation, the live one is left as it was.
     Returns:
         Mapping of name of download to the list of new IDs in mongo database.
     """
+    if staging:
+        if fingerprints is not None or fetcher is not None or checkpoints is not None:
+            raise ValueError("Staging reloads every feed, it can't be combined with fingerprints, a fetcher "
+                             "or checkpoints")
+        return _stage_and_swap(data_sets, download_service, mongo_db, collection, columnar, stream, metrics)
+    if checkpoints is not None and fetcher is not None:
+        raise ValueError("Checkpoints resume a feed's own download, they can't be combined with a fetcher")
+    if fetcher is not None:
+        if download_service is not None and fetcher.download_service is not download_service:
+            raise ValueError("The fetcher downloads through a different service, pass AsyncFetcher(download_service) "
+                             "so its cache and previous downloads are used")
+        return _fetch_and_insert(data_sets, fetcher, mongo_db, collection, columnar, stream, fingerprints, metrics)
     results: Dict[str, str] = {}
     for info in data_sets:
         name, url = info["name"], info["url"]
         logging.info(f"Starting to download {name} GTFS dataset with url {url}")
 
-        # Downloading and extracting zip folder
+        # Downloading zip folder
         zip_dir = os.path.join(os.path.curdir, name)
-        result = insert_routes_to_db(url, zip_dir, download_service, mongo_db, collection)
-        results[name] = result
-
-        logging.debug("Deleting unneeded files")
-        # Deleting files and folder
-        for filename in os.listdir(zip_dir):
-            os.remove(os.path.join(zip_dir, filename))
-        os.rmdir(zip_dir)
+        try:
+            results[name] = insert_routes_to_db(url, zip_dir, download_service, mongo_db, collection, columnar, stream,
+                                                fingerprints=fingerprints, metrics=metrics, checkpoints=checkpoints,
+                                                indexes=False)
+        except Exception:
+            # Keep the download to resume from, without checkpoints a rerun starts over
+            if checkpoints is None:
+                remove_directory(zip_dir)
+            raise
+        remove_directory(zip_dir)
+    index_routes(mongo_db[collection], metrics, checkpoints)
     return results
 
 
-# Function to run loop of downloading zip and uploading translated object to mongodb
-def insert_routes_to_db(zip_url: str, directory: str, download_service: DownloadService, mongo_db: database.Database,
-    coll_name: str):
-    """Download and extract routes from a given url and then insert them into a Mongo database
+def index_routes(collection: mongo_collection.Collection, metrics: Optional[Metrics] = None,
+                 checkpoints: Optional[CheckpointStore] = None):
+    """Create ROUTE_INDEXES on a routes collection once every feed has been loaded into it.
 
     Parameters:
-        zip_url:            Url of the zip to download and extract
-        directory:          Directory to unzip into
+        collection:     Routes collection.
+        metrics:        Optional, records the time taken as the collection's indexes stage
+        checkpoints:    Optional, progress of the load, the indexes are recorded as a stage of
+                        the collection, cleared once they are built
+    """
+    metrics = metrics if metrics is not None else Metrics()
+    progress = checkpoints if checkpoints is not None else CheckpointStore(None)
+    if not progress.done(collection.name, "indexes"):
+        with metrics.stage("indexes", feed=collection.name):
+            create_indexes(collection, ROUTE_INDEXES)
+        progress.complete(collection.name, "indexes")
+    progress.clear(collection.name)
+
+
+def _fetch_and_insert(data_sets: List[Dict[str, str]], fetcher: AsyncFetcher, mongo_db: database.Database,
+                      collection: str, columnar: bool, stream: bool, fingerprints: Optional[FingerprintStore],
+                      metrics: Optional[Metrics]) -> Dict[str, List]:
+    """download_and_insert with every feed downloaded concurrently before any are inserted."""
+    metrics = metrics if metrics is not None else Metrics()
+    zip_dirs = [os.path.join(os.path.curdir, info["name"]) for info in data_sets]
+    for zip_dir in zip_dirs:
+        os.makedirs(zip_dir, exist_ok=True)
+    results: Dict[str, List] = {}
+    try:
+        logging.info(f"Downloading {len(data_sets)} GTFS datasets")
+        fetched = fetcher.run([(info["url"], os.path.join(zip_dir, ZIP_NAME))
+                               for info, zip_dir in zip(data_sets, zip_dirs)])
+        for info, result in zip(data_sets, fetched):
+            # Downloads overlapped so only their wall time means anything
+            stage = StageMetrics("download", {"feed": info["url"]})
+            stage.seconds = result.seconds
+            metrics.stages.append(stage)
+            if not result.ok:
+                logging.error(f"Failed to download {info['name']} GTFS dataset: {result.error}")
+                continue
+            if not result.changed:
+                logging.info(f"No difference in {info['name']} not inserting")
+                results[info["name"]] = []
+                continue
+            results[info["name"]] = insert_zip_to_db(result.path, info["url"], mongo_db, collection, columnar, stream,
+                                                     fingerprints=fingerprints, metrics=metrics, indexes=False)
+            fetcher.download_service.commit(info["url"])
+        index_routes(mongo_db[collection], metrics)
+    finally:
+        for zip_dir in zip_dirs:
+            remove_directory(zip_dir)
+    return results
+
+
+def _stage_and_swap(data_sets: List[Dict[str, str]], download_service: DownloadService, mongo_db: database.Database,
+                    collection: str, columnar: bool, stream: bool, metrics: Optional[Metrics]) -> Dict[str, List]:
+    """download_and_insert loading into a staging collection that replaces the live one at the
+    end. Documents are tagged with their feed, so feeds that are unchanged or fail to load
+    keep their documents from the live collection. A feed without tagged live documents,
+    such as one uploaded without staging, is always downloaded and loaded, as there is
+    nothing of it to carry over. Downloads are committed once the staged collection is
+    swapped in."""
+    metrics = metrics if metrics is not None else Metrics()
+    staged = StagedCollection(mongo_db, collection)
+    results: Dict[str, List] = {}
+    loaded: List[str] = []
+    try:
+        for info in data_sets:
+            name, url = info["name"], info["url"]
+            zip_dir = os.path.join(os.path.curdir, name)
+            zip_path = os.path.join(zip_dir, ZIP_NAME)
+            try:
+                os.makedirs(zip_dir, exist_ok=True)
+                force = mongo_db[collection].count_documents({FEED_FIELD: url}) == 0
+                if force:
+                    logging.info(f"No live documents tagged with {name}, loading it even if unchanged")
+                with metrics.stage("download", feed=url):
+                    changed = download_service.download_if_diff(url, zip_path, force=force)
+                if changed:
+                    with zipfile.ZipFile(zip_path) as zip_file:
+                        feed = Feed(zip_file, ROUTE_DOCUMENT_COLUMNS, columnar, metrics=metrics)
+                        documents = build_route_documents(feed, stream=stream)
+                        with metrics.stage("insert", feed=url) as stage:
+                            stats = staged.write({FEED_FIELD: url} | x for x in documents)
+                            stage.rows = stats.documents
+                    results[name] = stats.inserted_ids
+                    loaded.append(url)
+                    continue
+                logging.info(f"No difference in {name}, keeping its live documents")
+                results[name] = []
+            except Exception as err:
+                logging.error(f"Failed to load {name} GTFS dataset, keeping its live documents: {err}")
+                staged.discard({FEED_FIELD: url})
+            finally:
+                remove_directory(zip_dir)
+            staged.carry_over({FEED_FIELD: url})
+        with metrics.stage("indexes", feed=collection):
+            staged.swap(ROUTE_INDEXES)
+    except Exception:
+        staged.abort()
+        raise
+    for url in loaded:
+        download_service.commit(url)
+    return results
+
+
+def remove_directory(directory: str):
+    """Delete the files downloaded into a directory and then the directory itself.
+
+    Parameters:
+        directory:  Directory to delete, nothing happens if it does not exist
+    """
+    if not os.path.isdir(directory):
+        return
+    logging.debug("Deleting unneeded files")
+    for filename in os.listdir(directory):
+        os.remove(os.path.join(directory, filename))
+    os.rmdir(directory)
+
+
+def _insert_feed(info: Dict[str, str], download_service: DownloadService, mongo_db: database.Database,
+                 coll_name: str, process_pool: ProcessPoolExecutor, columnar: bool, stream: bool,
+                 fingerprints: Optional[FingerprintStore], metrics: Metrics):
+    """Download, parse and insert a single feed. Parsing and joining is handed to the
+    process pool, which writes the documents to a BSON file in the feed's directory, so
+    the calling thread only waits on I/O and reads the documents back as it inserts them.
+
+    Parameters:
+        info:               Name and url of the GTFS data
         download_service:   Service that downloads and extracts zip if there is a difference
         mongo_db:           Mongo database
         coll_name:          Name of the collection to add to
+        process_pool:       Pool to parse and join the feed in
+        columnar:           Load stop times into typed columns to save memory
+        stream:             Join stop times trip by trip as they are read from file
+        fingerprints:       Fingerprints of uploaded trips so only changed trips are written
+        metrics:            Records the download, build and insert of the feed
+
+    Returns:
+        List of IDs inserted into the database, only of new trips if using fingerprints
+    """
+    name, url = info["name"], info["url"]
+    zip_dir = os.path.abspath(os.path.join(os.path.curdir, name))
+    zip_path = os.path.join(zip_dir, ZIP_NAME)
+    documents_path = os.path.join(zip_dir, DOCUMENTS_NAME)
+    try:
+        logging.info(f"Starting to download {name} GTFS dataset with url {url}")
+        os.makedirs(zip_dir, exist_ok=True)
+        with metrics.stage("download", feed=url):
+            changed = download_service.download_if_diff(url, zip_path)
+        if not changed:
+            logging.info(f"No difference in {name} not inserting")
+            return []
+        with metrics.stage("build", feed=url) as stage:
+            stage.rows = process_pool.submit(dump_route_documents, zip_path, documents_path, columnar, stream).result()
+        if stage.rows == 0:
+            return []
+        logging.info(f"Inserting {stage.rows} documents from {name} to database")
+        collection = mongo_db[coll_name]
+        with open(documents_path, 'rb') as f, metrics.stage("insert", feed=url) as stage:
+            documents = bson.decode_file_iter(f)
+            if fingerprints is not None:
+                stats = sync_documents(collection, documents, url, fingerprints)
+                ids = stats.upserted_ids
+            else:
+                stats = BulkWriter(collection).write(documents)
+                ids = stats.inserted_ids
+            stage.rows = stats.documents
+        download_service.commit(url)
+        return ids
+    finally:
+        remove_directory(zip_dir)
+
+
+def download_and_insert_concurrent(data_sets: List[Dict[str, str]], download_service: DownloadService,
+    mongo_db: database.Database, collection: str = COLLECTION_NAME, max_workers: Optional[int] = None,
+    max_processes: Optional[int] = None, columnar: bool = False, stream: bool = False,
+    fingerprints: Optional[FingerprintStore] = None, metrics: Optional[Metrics] = None):
+    """Same as download_and_insert but works on several feeds at once. Each feed is downloaded
+    and inserted from a thread while parsing and joining happen in a process pool, so I/O
+    for one feed overlaps with CPU work for another. A feed that fails is logged and left
+    out of the result without stopping the others. The collection is indexed once every
+    feed is done, so no feed is inserted while an index is being built.
+
+    Worker processes are spawned rather than forked, forking while other threads hold
+    locks, such as logging's or the download session's, can deadlock the child.
+
+    Parameters:
+        data_sets:          Dictionary with name and url of GTFS data { name: string, url: string }
+        download_service:   Service used to download data if there is a difference
+        mongo_db:           Database to upload to
+        collection:         Optional, name of the collection to upload to
+        max_workers:        Optional, number of feeds to download and insert at once, defaults to processes
+        max_processes:      Optional, number of processes to parse feeds with, defaults to cpu count
+        columnar:           Optional, load stop times into typed columns to save memory
+        stream:             Optional, join stop times trip by trip as they are read from file
+        fingerprints:       Optional, fingerprints of uploaded trips so only changed trips are written
+        metrics:            Optional, records the download, build and insert of each feed. Parsing
+                            happens in the workers so it is timed as part of the build
 
     Returns:
-        List of IDs if its inserted into the database  
+        Mapping of name of download to the list of new IDs in mongo database.
     """
-    extracted = download_service.extract_if_diff(zip_url, directory)
-    if not extracted:
-        logging.info("No difference not extracting")
+    metrics = metrics if metrics is not None else Metrics()
+    max_processes = max_processes or os.cpu_count() or 1
+    max_workers = max_workers or max_processes
+    results: Dict[str, List] = {}
+    with ProcessPoolExecutor(max_workers=max_processes, mp_context=get_context("spawn")) as process_pool, \
+            ThreadPoolExecutor(max_workers=max_workers) as thread_pool:
+        futures = {info["name"]: thread_pool.submit(_insert_feed, info, download_service, mongo_db, collection,
+                                                    process_pool, columnar, stream, fingerprints, metrics)
+                   for info in data_sets}
+        for name, future in futures.items():
+            try:
+                results[name] = future.result()
+            except Exception as err:
+                logging.error(f"Failed to insert {name} GTFS dataset: {err}")
+    index_routes(mongo_db[collection], metrics)
+    return results
+
+
+def merge_and_insert(data_sets: List[Dict[str, str]], download_service: DownloadService,
+    mongo_db: database.Database, collection: str = MERGED_COLLECTION,
+    directory: str = os.path.join(os.curdir, "merged"), distance: float = MERGE_DISTANCE,
+    batch_size: int = DEFAULT_BATCH_SIZE, metrics: Optional[Metrics] = None) -> List:
+    """Download several GTFS feeds, merge them into one national feed and replace the
+    merged collection with its documents. IDs are prefixed with the feed they came from
+    and stops that feeds share are stored once. The documents are loaded into a staging
+    collection that is swapped in once complete, so readers never see a partial merge.
+
+    The zips are kept in directory between runs, the merged collection is only rebuilt when
+    at least one feed changed and then every feed is read from its zip. A feed that fails
+    to download is merged from its zip of an earlier run.
+
+    Parameters:
+        data_sets:          Dictionary with name and url of GTFS data { name: string, url: string },
+                            optionally with a prefix for the feed's IDs, the name otherwise
+        download_service:   Service used to download data if there is a difference
+        mongo_db:           Database to upload to
+        collection:         Optional, name of the collection to replace
+        directory:          Optional, directory the zips are downloaded to and kept in
+        distance:           Optional, most metres apart stops of different feeds with the same
+                            name can be to be stored as one
+        batch_size:         Optional, number of documents to send to the database at a time
+        metrics:            Optional, records the download and parse of each feed and the
+                            merge, join, calendar and insert stages
+
+    Throws:
+        StagingError:   When a feed has no zip at all or the merge fails validation, the
+                        merged collection is left as it was rather than lose an operator.
+    Returns:
+        List of IDs inserted, empty if no feed changed
+    """
+    metrics = metrics if metrics is not None else Metrics()
+    os.makedirs(directory, exist_ok=True)
+    zip_paths: Dict[str, str] = {}
+    missing: List[str] = []
+    changed = False
+    for info in data_sets:
+        zip_path = os.path.join(directory, f"{info['name']}.zip")
+        try:
+            with metrics.stage("download", feed=info["url"]):
+                changed = download_service.download_if_diff(info["url"], zip_path) or changed
+        except Exception as err:
+            logging.error(f"Failed to download {info['name']} GTFS dataset: {err}")
+        if os.path.exists(zip_path):
+            zip_paths[info.get("prefix", info["name"])] = zip_path
+        else:
+            missing.append(info["name"])
+    if len(missing) > 0:
+        raise StagingError(f"No download of {', '.join(missing)} GTFS datasets, not replacing {collection}")
+    if not changed:
+        logging.info("No difference not inserting")
         return []
-    parameters = {}
 
-    for k in FILE_TO_OBJECT_MAPPINGS:
-        obj_type = FILE_TO_OBJECT_MAPPINGS[k]
-        loaded_obj = load_gtfs_from_file(os.path.join(directory, k), obj_type)
-        parameters[FILE_TO_PARAMETER_NAME[k]] = loaded_obj
+    merger = FeedMerger(distance)
+    for prefix, zip_path in zip_paths.items():
+        with zipfile.ZipFile(zip_path) as zip_file:
+            feed = Feed(zip_file, metrics=metrics)
+            with metrics.stage("merge", feed=prefix):
+                merger.add(prefix, feed)
+    ride_with_calendar = build_route_documents(merger.feed(), metrics=metrics)
+    staged = StagedCollection(mongo_db, collection, batch_size)
+    try:
+        with metrics.stage("insert", feed=collection) as stage:
+            logging.info(f"Replacing {collection} with {len(ride_with_calendar)} merged trips")
+            stats = staged.write(ride_with_calendar)
+            stage.rows = stats.documents
+        with metrics.stage("indexes", feed=collection):
+            staged.swap(ROUTE_INDEXES)
+    except Exception:
+        staged.abort()
+        raise
+    for info in data_sets:
+        download_service.commit(info["url"])
+    return stats.inserted_ids
+
+
+def insert_service_calendars(mongo_db: database.Database, calendars: List[Calendar], feed: str,
+                             batch_size: int = DEFAULT_BATCH_SIZE) -> int:
+    """Replace a feed's calendars in the service_calendar collection, for trips that
+    reference their calendar rather than embedding it.
+
+    Parameters:
+        mongo_db:       Mongo database
+        calendars:      Calendars of the feed
+        feed:           Name of the feed the documents are tagged with
+        batch_size:     Optional, number of documents to send to the database at a time
+
+    Returns:
+        Number of calendars inserted
+    """
+    calendar_collection = mongo_db[SERVICE_CALENDAR]
+    calendar_collection.delete_many({FEED_FIELD: feed})
+    logging.info(f"Inserting {len(calendars)} service calendars")
+    if len(calendars) > 0:
+        BulkWriter(calendar_collection, batch_size).write({FEED_FIELD: feed} | to_dict(x) for x in calendars)
+    create_indexes(calendar_collection, CALENDAR_INDEXES)
+    return len(calendars)
+
+
+def build_route_documents(source: Union[str, zipfile.ZipFile, Feed], columnar: bool = False,
+                          stream: bool = False, processes: Optional[int] = None,
+                          metrics: Optional[Metrics] = None, trip_times: bool = False,
+                          embed_calendar: bool = True) -> Iterable[Dict]:
+    """Load the GTFS files of a feed, connect routes to their stops and attach the
+    calendar of the service each trip runs on. Only routes, trips, calendar and stop
+    times are read, and only the trip fields the documents use.
+
+    Parameters:
+        source:     Directory the GTFS files were extracted into, the GTFS zip file itself
+                    or a Feed, whose own settings are used instead of the options below
+        columnar:   Optional, load stop times into typed columns to save memory
+        stream:     Optional, join stop times trip by trip as they are read from file
+                    rather than loading them all first
+        processes:  Optional, parse stop times into typed columns with this many processes
+        metrics:    Optional, records the time taken parsing each file, joining and attaching
+                    calendars. Streamed joins are timed by whatever consumes the documents
+        trip_times: Optional, add each trip's first departure, last arrival, duration and
+                    the dwell and run times between its stops in seconds
+        embed_calendar: Optional, copy the calendar of each trip's service into it. If False
+                    trips only reference their calendar by service_id
+
+    Returns:
+        Documents ready to insert, a list or an iterator if streaming
+    """
+    if isinstance(source, Feed):
+        feed = source
+    else:
+        feed = Feed(source, ROUTE_DOCUMENT_COLUMNS, columnar, processes, metrics=metrics)
+    metrics = feed.metrics
+    services = ServiceIndex(feed["calendar"])
     logging.info("Joining routes and trips to their stops")
 
     # Connect routes to their stops and what days they are running on
-    connections = connect_route_stops(routes=parameters["routes"], stop_times=parameters["stop_times"],
-                                      trips=parameters["trips"])
-    calendar_dates = group_by("service_id", parameters["calendar"])
-    ride_with_calendar = list(map(lambda x:  get_calendar_range(
-        x["service_id"], calendar_dates) | x, connections))
-    
-    # Collection to store data under
-    collection = mongo_db[coll_name]
+    if stream:
+        connections = stream_route_stops(routes=feed["routes"], trips=feed["trips"],
+                                         stop_times_file=feed.path("stop_times.txt"), zip_file=feed.zip_file)
+    else:
+        routes, trips, stop_times = feed["routes"], feed["trips"], feed["stop_times"]
+        with metrics.stage("join", rows=len(stop_times)):
+            connections = connect_route_stops(routes=routes, stop_times=stop_times, trips=trips)
+    if trip_times:
+        if stream:
+            connections = attach_trip_times(connections)
+        else:
+            with metrics.stage("trip_times", rows=len(connections)):
+                connections = list(attach_trip_times(connections, TripTimes.from_stop_times(feed["stop_times"])))
+    if not embed_calendar:
+        return connections
+    ride_with_calendar = map(lambda x: services.get_dict(x["service_id"]) | x, connections)
+    if not stream:
+        with metrics.stage("calendar", rows=len(connections)):
+            ride_with_calendar = list(ride_with_calendar)
+    return ride_with_calendar
 
-    logging.info("Inserting data to database") 
-    result = collection.insert_many(ride_with_calendar)
-    return result.inserted_ids
 
+def dump_route_documents(path: str, output: str, columnar: bool = False, stream: bool = False) -> int:
+    """Write the documents of build_route_documents to a file of concatenated BSON, used
+    from worker processes so only the count is sent back rather than every document.
 
+    Parameters:
+        path:       GTFS zip file or directory path
+        output:     File to write the documents to, read them back with bson.decode_file_iter
+        columnar:   Optional, load stop times into typed columns to save memory
+        stream:     Optional, join stop times trip by trip as they are read from file
+
+    Returns:
+        Number of documents written
+    """
+    count = 0
+    with contextlib.ExitStack() as stack, open(output, 'wb') as f:
+        source = stack.enter_context(zipfile.ZipFile(path)) if zipfile.is_zipfile(path) else path
+        for document in build_route_documents(source, columnar, stream):
+            f.write(bson.encode(document))
+            count += 1
+    return count
+
+
+# Function to run loop of downloading zip and uploading translated object to mongodb
+def insert_routes_to_db(zip_url: str, directory: str, download_service: DownloadService, mongo_db: database.Database,
+    coll_name: str, columnar: bool = False, stream: bool = False, batch_size: int = DEFAULT_BATCH_SIZE,
+    fingerprints: Optional[FingerprintStore] = None, processes: Optional[int] = None, stop_indexes: bool = False,
+    patterns: bool = False, metrics: Optional[Metrics] = None, trip_times: bool = False,
+    calendar_reference: bool = False, checkpoints: Optional[CheckpointStore] = None, indexes: bool = True):
+    """Download routes from a given url and then insert them into a Mongo database.
+    GTFS files are read straight out of the downloaded zip rather than extracted.
+
+    Parameters:
+        zip_url:            Url of the zip to download
+        directory:          Directory to download the zip into
+        download_service:   Service that downloads and extracts zip if there is a difference
+        mongo_db:           Mongo database
+        coll_name:          Name of the collection to add to
+        columnar:           Optional, load stop times into typed columns to save memory
+        stream:             Optional, join stop times trip by trip as they are read from file
+                            rather than loading them all first
+        batch_size:         Optional, number of documents to send to the database at a time
+        fingerprints:       Optional, fingerprints of the trips uploaded last time. If given only
+                            new or changed trips are upserted and vanished trips deleted
+        processes:          Optional, parse stop times with this many processes
+        stop_indexes:       Optional, also replace the feed's stop to routes and stop departures
+                            collections used for departure boards
+        patterns:           Optional, write each trip as a reference to its stop pattern plus time
+                            offsets, with the patterns replaced in their own collection
+        metrics:            Optional, records the time taken by the download, each stage of
+                            building the documents and the insert
+        trip_times:         Optional, add each trip's duration, first departure, last arrival and
+                            the dwell and run times between its stops in seconds
+        calendar_reference: Optional, keep the feed's calendars once in the service_calendar
+                            collection rather than copying one into every trip, trips are
+                            tagged with the feed to look their calendar up by it and service_id
+        checkpoints:        Optional, progress of the feed's load. The zip is not downloaded again
+                            if an earlier run downloaded it into directory, see insert_zip_to_db
+        indexes:            Optional, index the collection once the feed is written. Loads of
+                            several feeds pass False and call index_routes once they are all in
+
+    Returns:
+        List of IDs if its inserted into the database, only of new trips if using fingerprints
+    """
+    metrics = metrics if metrics is not None else Metrics()
+    os.makedirs(directory, exist_ok=True)
+    zip_path = os.path.join(directory, ZIP_NAME)
+    download: Optional[CacheEntry] = None  # Validators of an earlier run's download, committed once loaded
+    if checkpoints is not None and checkpoints.done(zip_url, "download") and os.path.exists(zip_path):
+        logging.info(f"Resuming {zip_url} from the zip downloaded by an earlier run")
+        details = checkpoints.details(zip_url, "download")
+        download = CacheEntry(**details) if details is not None else None
+    else:
+        with metrics.stage("download", feed=zip_url):
+            changed = download_service.download_if_diff(zip_url, zip_path)
+        if not changed:
+            if checkpoints is not None and checkpoints.offset(zip_url) is not None:
+                logging.warning(f"The zip of {zip_url} is gone and unchanged, can't resume its partial load")
+            logging.info("No difference not inserting")
+            return []
+        if checkpoints is not None:
+            pending = download_service.pending.get(zip_url)
+            checkpoints.complete(zip_url, "download", pending.__dict__ if pending is not None else None)
+    ids = insert_zip_to_db(zip_path, zip_url, mongo_db, coll_name, columnar, stream, batch_size, fingerprints,
+                           processes, stop_indexes, patterns, metrics, trip_times, calendar_reference, checkpoints,
+                           indexes)
+    # Only now is the download remembered, a failed load is downloaded and loaded again next run
+    download_service.commit(zip_url, download)
+    return ids
+
+
+def insert_zip_to_db(zip_path: str, zip_url: str, mongo_db: database.Database, coll_name: str,
+    columnar: bool = False, stream: bool = False, batch_size: int = DEFAULT_BATCH_SIZE,
+    fingerprints: Optional[FingerprintStore] = None, processes: Optional[int] = None, stop_indexes: bool = False,
+    patterns: bool = False, metrics: Optional[Metrics] = None, trip_times: bool = False,
+    calendar_reference: bool = False, checkpoints: Optional[CheckpointStore] = None, indexes: bool = True):
+    """Insert the routes of a GTFS zip that has already been downloaded, takes the same
+    options as insert_routes_to_db. Indexes are created once the documents are written
+    unless indexes is False.
+
+    Parameters:
+        zip_path:       Path of the downloaded zip
+        zip_url:        Url the zip came from, documents are tagged with it as their feed
+        checkpoints:    Optional, progress of the feed's load. Stages completed by an earlier
+                        run are skipped and an insert that stopped part way carries on after
+                        the documents the database acknowledged. Documents are tagged with
+                        the feed so the batches in flight when it stopped can be replaced
+                        rather than inserted twice. The feed's progress is cleared once loaded
+
+    Returns:
+        List of IDs if its inserted into the database, only of new trips if using fingerprints.
+        Without fingerprints, IDs of trips inserted by earlier runs are left out
+    """
+    metrics = metrics if metrics is not None else Metrics()
+    # Without checkpoints progress is only kept for this run, so every stage runs
+    progress = checkpoints if checkpoints is not None else CheckpointStore(None)
+    ids: List = []
+    with zipfile.ZipFile(zip_path) as zip_file:
+        # Stop indexes need trip headsigns so trips are only projected without them
+        feed = Feed(zip_file, {} if stop_indexes else ROUTE_DOCUMENT_COLUMNS, columnar, processes, metrics=metrics)
+        compressor = PatternCompressor() if patterns else None
+        inserted = progress.done(zip_url, "insert")
+        if not inserted or (patterns and not progress.done(zip_url, "patterns")):
+            ride_with_calendar = build_route_documents(feed, stream=stream, trip_times=trip_times,
+                                                       embed_calendar=not calendar_reference)
+            if calendar_reference or checkpoints is not None:
+                ride_with_calendar = ({FEED_FIELD: zip_url} | x for x in ride_with_calendar)
+            if compressor is not None:
+                ride_with_calendar = map(compressor.trip, ride_with_calendar)
+
+        # Collection to store data under
+        collection = mongo_db[coll_name]
+
+        if not inserted:
+            with metrics.stage("insert", feed=zip_url) as stage:
+                if fingerprints is not None:
+                    # Syncing is idempotent so a rerun syncs the whole feed again
+                    logging.info("Syncing changed trips to database")
+                    stats = sync_documents(collection, ride_with_calendar, zip_url, fingerprints, batch_size)
+                    ids = stats.upserted_ids
+                elif checkpoints is not None:
+                    logging.info("Inserting data to database")
+                    stats = _resume_insert(collection, ride_with_calendar, zip_url, checkpoints, batch_size)
+                    ids = stats.upserted_ids + stats.inserted_ids
+                else:
+                    logging.info("Inserting data to database")
+                    stats = BulkWriter(collection, batch_size).write(ride_with_calendar)
+                    ids = stats.inserted_ids
+                stage.rows = stats.documents
+            progress.complete(zip_url, "insert")
+        elif compressor is not None and not progress.done(zip_url, "patterns"):
+            # The patterns are only known once every trip has been through the compressor
+            deque(ride_with_calendar, maxlen=0)
+        if indexes and not progress.done(zip_url, "indexes"):
+            with metrics.stage("indexes", feed=zip_url):
+                create_indexes(collection, route_indexes(not calendar_reference, patterns))
+            progress.complete(zip_url, "indexes")
+        if calendar_reference and not progress.done(zip_url, "calendars"):
+            insert_service_calendars(mongo_db, feed["calendar"], zip_url, batch_size)
+            progress.complete(zip_url, "calendars")
+        if compressor is not None and not progress.done(zip_url, "patterns"):
+            insert_patterns(mongo_db, compressor.pattern_list(), zip_url, batch_size)
+            progress.complete(zip_url, "patterns")
+        if stop_indexes and not progress.done(zip_url, "stop_indexes"):
+            logging.info("Building stop departure indexes")
+            stop_routes, departures = build_stop_indexes(feed.iter("stop_times"), feed["trips"], feed["routes"])
+            insert_stop_indexes(mongo_db, stop_routes, departures, zip_url, batch_size)
+            progress.complete(zip_url, "stop_indexes")
+    progress.clear(zip_url)
+    return ids
+
+
+def _resume_insert(collection: mongo_collection.Collection, documents: Iterable[Dict], feed: str,
+                   checkpoints: CheckpointStore, batch_size: int) -> BulkWriteStats:
+    """Insert a feed's documents, carrying on after the documents acknowledged by an
+    earlier run that stopped. Documents are built in the same order every run, so the
+    acknowledged ones are skipped. Any batch after them may have been written, in whole
+    or in part, before the earlier run stopped, so every remaining document is upserted
+    on the feed and trip_id rather than inserted.
+
+    Returns:
+        Statistics of the write, inserted_ids on a first run and upserted_ids of the
+        documents that were missing on a resumed one
+    """
+    writer = BulkWriter(collection, batch_size)
+    documents = iter(documents)
+    offset = checkpoints.offset(feed)
+    if offset is None:
+        checkpoints.set_offset(feed, 0)
+        return writer.write(documents, lambda count: checkpoints.set_offset(feed, count))
+    skipped = sum(1 for _ in islice(documents, offset))
+    logging.info(f"Resuming insert of {feed} after {skipped} acknowledged documents")
+    operations = (ReplaceOne({FEED_FIELD: feed, "trip_id": x["trip_id"]}, x, upsert=True) for x in documents)
+    return writer.write_operations(operations, progress=lambda count: checkpoints.set_offset(feed, skipped + count))
@@ -0,0 +1,100 @@
+import json
+from typing import Dict, Iterable, TextIO
+
+DEFAULT_BUFFER_SIZE = 1 << 16  # Characters held before writing to file
+
+
+class _BufferedWriter:
+    """Collects strings and writes them to a file once buffer_size characters are held.
+
+    Attributes:
+        file:           File to write to.
+        buffer_size:    Number of characters to hold before writing.
+    """
+    file: TextIO
+    buffer_size: int
+
+    def __init__(self, file: TextIO, buffer_size: int) -> None:
+        """Constructor"""
+        self.file = file
+        self.buffer_size = buffer_size
+        self._parts = []
+        self._size = 0
+
+    def write(self, text: str) -> None:
+        self._parts.append(text)
+        self._size += len(text)
+        if self._size >= self.buffer_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if len(self._parts) > 0:
+            self.file.write("".join(self._parts))
+        self._parts = []
+        self._size = 0
+
+
+def write_json_array(records: Iterable[Dict], file: TextIO, buffer_size: int = DEFAULT_BUFFER_SIZE) -> int:
+    """Write records as a JSON array one record at a time, so the full list never has to exist.
+
+    Arguments:
+        records:        Records to write, can be a generator.
+        file:           Open text file to write to.
+        buffer_size:    Optional, number of characters to hold before writing.
+
+    Returns:
+        Number of records written.
+    """
+    encoder = json.JSONEncoder()
+    writer = _BufferedWriter(file, buffer_size)
+    count = 0
+    writer.write("[")
+    for record in records:
+        if count > 0:
+            writer.write(", ")
+        writer.write(encoder.encode(record))
+        count += 1
+    writer.write("]")
+    writer.flush()
+    return count
+
+
+def write_ndjson(records: Iterable[Dict], file: TextIO, buffer_size: int = DEFAULT_BUFFER_SIZE) -> int:
+    """Write records as newline delimited JSON, one record per line.
+
+    Arguments:
+        records:        Records to write, can be a generator.
+        file:           Open text file to write to.
+        buffer_size:    Optional, number of characters to hold before writing.
+
+    Returns:
+        Number of records written.
+    """
+    encoder = json.JSONEncoder()
+    writer = _BufferedWriter(file, buffer_size)
+    count = 0
+    for record in records:
+        writer.write(encoder.encode(record))
+        writer.write("\n")
+        count += 1
+    writer.flush()
+    return count
+
+
+def write_records(filename: str, records: Iterable[Dict], ndjson: bool = False,
+                  buffer_size: int = DEFAULT_BUFFER_SIZE) -> int:
+    """Write records to a file as a JSON array or as newline delimited JSON.
+
+    Arguments:
+        filename:       Name of the file to write to.
+        records:        Records to write, can be a generator.
+        ndjson:         Optional, write newline delimited JSON instead of an array.
+        buffer_size:    Optional, number of characters to hold before writing.
+
+    Returns:
+        Number of records written.
+    """
+    with open(filename, 'w', encoding="utf-8") as f:
+        if ndjson:
+            return write_ndjson(records, f, buffer_size)
+        return write_json_array(records, f, buffer_size)
@@ -0,0 +1,33 @@
+import os
+import tempfile
+import unittest
+from benchmarks import run, synthetic
+from src import gtfs
+
+
+class Benchmarks_Tests(unittest.TestCase):
+    def test_generate_feed_deterministic(self):
+        scale = synthetic.SCALES["tiny"]
+        with tempfile.TemporaryDirectory() as first, tempfile.TemporaryDirectory() as second:
+            counts = synthetic.generate_feed(first, scale, seed=3)
+            synthetic.generate_feed(second, scale, seed=3)
+            for filename in counts:
+                with open(os.path.join(first, filename)) as a, open(os.path.join(second, filename)) as b:
+                    self.assertEqual(a.read(), b.read())
+            stop_times = gtfs.load_gtfs_from_file(os.path.join(first, "stop_times.txt"), gtfs.StopTime)
+        self.assertEqual(counts["stop_times.txt"], scale.routes * scale.trips * scale.stop_times)
+        self.assertEqual(len(stop_times), counts["stop_times.txt"])
+
+    def test_run(self):
+        results = run.run(synthetic.SCALES["tiny"], only="connect_route_stops")
+        self.assertEqual([x["name"] for x in results["results"]], ["connect_route_stops"])
+        self.assertGreater(results["results"][0]["peak_bytes"], 0)
+        self.assertEqual(run.compare(results, results), ["connect_route_stops: time x1.00, peak memory x1.00"])
+
+    def test_run_insert_routes(self):
+        results = run.run(synthetic.SCALES["tiny"], only="insert_routes_to_db")
+        self.assertEqual([x["name"] for x in results["results"]], ["insert_routes_to_db"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+import time
+import unittest
+from unittest.mock import Mock
+from src import bulk
+from . import utils
+
+
+def generate_documents(count):
+    for i in range(count):
+        yield {"index": i}
+
+
+class Bulk_Tests(unittest.TestCase):
+    def test_invalid_batch_size(self):
+        with self.assertRaises(ValueError):
+            bulk.BulkWriter(utils.FakeCollection(), batch_size=0)
+
+    def test_write_batches_unordered(self):
+        collection = utils.FakeCollection()
+        documents = list(generate_documents(10))
+        stats = bulk.BulkWriter(collection, batch_size=4).write(iter(documents))
+        self.assertEqual([x["count"] for x in collection.calls], [4, 4, 2])
+        self.assertFalse(any(x["ordered"] for x in collection.calls))
+        self.assertEqual(stats.documents, 10)
+        self.assertEqual(stats.batches, 3)
+        self.assertGreater(stats.bytes, 0)
+        self.assertEqual(stats.inserted_ids, [x["_id"] for x in documents])
+        self.assertEqual(sorted(x["index"] for x in collection.documents), list(range(10)))
+
+    def test_write_bounds_in_flight(self):
+        collection = utils.FakeCollection(delay=0.01)
+        bulk.BulkWriter(collection, batch_size=1, max_in_flight=3).write(generate_documents(12))
+        self.assertLessEqual(collection.max_in_flight, 3)
+        self.assertEqual(len(collection.documents), 12)
+
+    def test_write_raises_batch_error(self):
+        collection = utils.FakeCollection()
+        documents = [{"index": 1}, {"index": 2}]
+        collection.insert_many = Mock(side_effect=Exception("TEST"))
+        with self.assertRaises(Exception):
+            bulk.BulkWriter(collection, batch_size=1).write(documents)
+
+    def test_write_progress(self):
+        collection = utils.FakeCollection(delay=0.01)
+        acknowledged = []
+        bulk.BulkWriter(collection, batch_size=3).write(generate_documents(10), acknowledged.append)
+        self.assertEqual(acknowledged, sorted(acknowledged))
+        self.assertEqual(acknowledged[-1], 10)
+
+    def test_write_progress_stops_at_failure(self):
+        collection = utils.FakeCollection()
+        insert_many = collection.insert_many
+        calls = []
+
+        def fail_third(documents, ordered=True):
+            calls.append(len(documents))
+            if len(calls) == 3:
+                raise Exception("TEST")
+            return insert_many(documents, ordered)
+        collection.insert_many = fail_third
+        acknowledged = []
+        with self.assertRaises(Exception):
+            bulk.BulkWriter(collection, batch_size=2, max_in_flight=1).write(generate_documents(10), acknowledged.append)
+        self.assertEqual(acknowledged[-1], 4)
+
+    def test_write_stops_after_earlier_failure(self):
+        collection = utils.FakeCollection(delay=0.01)
+        insert_many = collection.insert_many
+        calls = []
+
+        def slow_failure(documents, ordered=True):
+            calls.append(len(documents))
+            if len(calls) == 1:
+                time.sleep(0.05)
+                raise Exception("TEST")
+            return insert_many(documents, ordered)
+        collection.insert_many = slow_failure
+        with self.assertRaises(Exception):
+            bulk.BulkWriter(collection, batch_size=10).write(generate_documents(1000))
+        self.assertLess(len(calls), 50, "Batches should stop once the slow first batch fails")
+
+    def test_write_size_sample(self):
+        documents = list(generate_documents(10))
+        exact = bulk.BulkWriter(utils.FakeCollection(), size_sample=1).write(iter(documents))
+        sampled = bulk.BulkWriter(utils.FakeCollection(), size_sample=5).write({"index": x["index"]} for x in documents)
+        self.assertEqual(sampled.bytes, exact.bytes)
+        self.assertEqual(bulk.BulkWriter(utils.FakeCollection(), size_sample=0).write(generate_documents(3)).bytes, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+import os
+import tempfile
+import unittest
+from src import cache, download
+from . import utils
+DIRECTORY = os.path.dirname(os.path.realpath(__file__))
+
+
+def load_zip_bytes():
+    with open(os.path.join(DIRECTORY, "resources", "valid.zip"), 'rb') as open_file:
+        return open_file.read()
+
+
+class Cache_Tests(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.cache_dir.cleanup()
+
+    def test_put_entry_persists(self):
+        first = cache.DownloadCache(self.cache_dir.name)
+        entry = first.put_entry("url", cache.CacheEntry("abc", '"tag"', "date"))
+        second = cache.DownloadCache(self.cache_dir.name)
+        self.assertEqual(second.get("url").sha256, entry.sha256)
+        self.assertEqual(second.conditional_headers("url"), {"If-None-Match": '"tag"', "If-Modified-Since": "date"})
+        self.assertEqual(second.conditional_headers("other"), {})
+
+    def test_content_not_stored(self):
+        with utils.LocalHTTPServer({"/feed.zip": load_zip_bytes()}) as server:
+            service = download.DownloadService(cache.DownloadCache(self.cache_dir.name))
+            service.get_if_diff(server.url("/feed.zip"))
+            service.get_if_diff(server.url("/feed.zip"))
+            service.commit(server.url("/feed.zip"))
+        self.assertEqual(os.listdir(self.cache_dir.name), [cache.INDEX_FILE])
+
+    def test_conditional_request_not_modified(self):
+        with utils.LocalHTTPServer({"/feed.zip": load_zip_bytes()}) as server:
+            service = download.DownloadService(cache.DownloadCache(self.cache_dir.name))
+            self.assertIsNotNone(service.get_if_diff(server.url("/feed.zip")))
+            service.commit(server.url("/feed.zip"))
+            sent = server.bytes_sent
+
+            # A new service, as after a restart, still knows the feed is unchanged
+            restarted = download.DownloadService(cache.DownloadCache(self.cache_dir.name))
+            self.assertIsNone(restarted.get_if_diff(server.url("/feed.zip")))
+            self.assertEqual(server.bytes_sent, sent)
+            self.assertIn("If-None-Match", server.requests[-1]["headers"])
+
+    def test_conditional_request_modified(self):
+        with utils.LocalHTTPServer({"/feed.zip": load_zip_bytes()}) as server:
+            service = download.DownloadService(cache.DownloadCache(self.cache_dir.name))
+            service.get_if_diff(server.url("/feed.zip"))
+            service.commit(server.url("/feed.zip"))
+            server.files["/feed.zip"] = load_zip_bytes() + b"\0"
+            self.assertIsNotNone(service.get_if_diff(server.url("/feed.zip")))
+
+    def test_uncommitted_download_not_cached(self):
+        with utils.LocalHTTPServer({"/feed.zip": load_zip_bytes()}) as server:
+            service = download.DownloadService(cache.DownloadCache(self.cache_dir.name))
+            self.assertIsNotNone(service.get_if_diff(server.url("/feed.zip")))
+            # The upload failed so nothing was committed, a restart downloads it again
+            restarted = download.DownloadService(cache.DownloadCache(self.cache_dir.name))
+            self.assertIsNotNone(restarted.get_if_diff(server.url("/feed.zip")))
+            self.assertNotIn("If-None-Match", server.requests[-1]["headers"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,46 @@
+import os
+import tempfile
+import unittest
+from src import checkpoint
+
+
+class Checkpoint_Tests(unittest.TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.work_dir.name, "checkpoints.json")
+
+    def tearDown(self):
+        self.work_dir.cleanup()
+
+    def test_progress_saved(self):
+        store = checkpoint.CheckpointStore(self.path)
+        self.assertFalse(store.done("a", "download"))
+        self.assertIsNone(store.offset("a"))
+        store.complete("a", "download")
+        store.complete("a", "download")
+        store.set_offset("a", 2000)
+        loaded = checkpoint.CheckpointStore(self.path)
+        self.assertTrue(loaded.done("a", "download"))
+        self.assertFalse(loaded.done("a", "insert"))
+        self.assertFalse(loaded.done("b", "download"))
+        self.assertEqual(loaded.offset("a"), 2000)
+        self.assertEqual(loaded.feeds["a"]["stages"], ["download"])
+
+    def test_clear(self):
+        store = checkpoint.CheckpointStore(self.path)
+        store.complete("a", "insert")
+        store.complete("b", "insert")
+        store.clear("a")
+        store.clear("c")
+        self.assertEqual(list(checkpoint.CheckpointStore(self.path).feeds), ["b"])
+        self.assertEqual(os.listdir(self.work_dir.name), ["checkpoints.json"])
+
+    def test_in_memory(self):
+        store = checkpoint.CheckpointStore(None)
+        store.complete("a", "insert")
+        self.assertTrue(store.done("a", "insert"))
+        self.assertEqual(os.listdir(self.work_dir.name), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
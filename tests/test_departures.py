@@ -0,0 +1,72 @@
+import os
+import unittest
+from src import departures, gtfs
+from tests import utils
+DIRECTORY = os.path.dirname(os.path.realpath(__file__))
+FEED = os.path.join(DIRECTORY, "resources", "feed")
+
+
+def load(filename, obj_type):
+    return gtfs.load_gtfs_from_file(os.path.join(FEED, filename), obj_type)
+
+
+class Departures_Tests(unittest.TestCase):
+    def setUp(self):
+        self.trips = load("trips.txt", gtfs.Trip)
+        self.routes = load("routes.txt", gtfs.Route)
+        self.stop_times = load("stop_times.txt", gtfs.StopTime)
+
+    def test_stop_routes(self):
+        stop_routes, _ = departures.build_stop_indexes(self.stop_times, self.trips, self.routes)
+        self.assertEqual([x["stop_id"] for x in stop_routes], ["A", "B", "C"])
+        self.assertEqual(stop_routes[0]["routes"], [gtfs.to_dict(self.routes[0])])
+
+    def test_departures_sorted_by_stop_and_time(self):
+        stop_times = list(reversed(self.stop_times))
+        _, board = departures.build_stop_indexes(iter(stop_times), self.trips, self.routes)
+        board = list(board)
+        self.assertEqual([(x["stop_id"], x["departure_time"]) for x in board],
+                         [("A", "07:00:00"), ("A", "08:00:00"), ("B", "07:05:00"), ("B", "08:05:00")])
+        self.assertEqual(board[0]["service_id"], "S1")
+        self.assertEqual(board[0]["departure_seconds"], 7 * 3600)
+        self.assertEqual(board[0]["headsign"], "Town")
+
+    def test_skips_no_pickup_and_unknown_trips(self):
+        stop_times = self.stop_times + [gtfs.StopTime("T9", "09:00:00", "09:00:00", "A", 1)]
+        stop_times[0].pickup_type = departures.NO_PICKUP
+        _, board = departures.build_stop_indexes(stop_times, self.trips, self.routes)
+        self.assertEqual([x["trip_id"] for x in board if x["stop_id"] == "A"], ["T2"])
+
+    def test_blank_stop_sequence(self):
+        stop_times = self.stop_times + [gtfs.StopTime("T1", "07:30:00", "07:30:00", "C", None)]
+        _, board = departures.build_stop_indexes(stop_times, self.trips, self.routes)
+        board = list(board)
+        self.assertEqual(len(board), 5, "Stops without a sequence are never the last stop")
+        self.assertEqual(board[-1]["stop_sequence"], None)
+
+    def test_columns_match_records(self):
+        columns = gtfs.load_stop_times_columns(os.path.join(FEED, "stop_times.txt"))
+        stop_routes, board = departures.build_stop_indexes(columns, self.trips, self.routes)
+        expected_routes, expected_board = departures.build_stop_indexes(self.stop_times, self.trips, self.routes)
+        self.assertEqual(stop_routes, expected_routes)
+        self.assertEqual(list(board), list(expected_board))
+
+    def test_insert_stop_indexes_keeps_other_feeds(self):
+        mongo_db = utils.FakeDatabase()
+        stop_routes, board = departures.build_stop_indexes(self.stop_times, self.trips, self.routes)
+        stop_routes, board = list(stop_routes), list(board)
+        departures.insert_stop_indexes(mongo_db, stop_routes, board, "a")
+        departures.insert_stop_indexes(mongo_db, stop_routes, board, "b")
+        self.assertEqual(departures.insert_stop_indexes(mongo_db, stop_routes, board[:3], "a"), (3, 3))
+        collection = mongo_db[departures.DEPARTURES_COLLECTION]
+        self.assertEqual((collection.count_documents({"feed": "a"}), collection.count_documents({"feed": "b"})),
+                         (3, 4))
+        self.assertEqual(collection.index_sizes, [7], "The staged collection is indexed once loaded")
+        self.assertNotIn(departures.DEPARTURES_COLLECTION + "_staging", mongo_db.collections)
+        departures.insert_stop_indexes(mongo_db, [], [], "a")
+        departures.insert_stop_indexes(mongo_db, [], [], "b")
+        self.assertEqual(mongo_db[departures.DEPARTURES_COLLECTION].count_documents({}), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
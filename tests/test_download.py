@@ -3,6 +3,7 @@ from unittest.mock import Mock, patch, mock_open
 from src import download
 from . import utils
 import os
+import tempfile
 DIRECTORY = os.path.dirname(os.path.realpath(__file__))
 
 
@@ -25,19 +26,45 @@ class Download_Tests(unittest.TestCase):
     def test_get_zip(self, mock_get):
         service = download.DownloadService()
         filezip = service.get_if_diff("something")
-        self.assertEqual(filezip.filename, None, "Filename be none")
+        self.assertIsNone(filezip.testzip(), "Zip streamed to disk should be intact")
         self.assertIn("trips.txt",[ x.filename for x in filezip.filelist])
 
     @patch('requests.get', side_effect=lambda *args,  **newkeywargs: utils.MockResponse(load_zip_bytes(os.path.join(DIRECTORY, "resources", "valid.zip")), 200))
     def test_get_zip_no_diff(self, mock_get):
         service = download.DownloadService()
         filezip = service.get_if_diff("something")
-        self.assertEqual(filezip.filename, None, "Filename be none")
+        self.assertIsNone(filezip.testzip(), "Zip streamed to disk should be intact")
         self.assertIn("trips.txt",[ x.filename for x in filezip.filelist])
+        service.commit("something")
         
         filezip = service.get_if_diff("something")
         self.assertEqual(filezip, None, "Second call should be none as content should be saved")
 
+    @patch('requests.get', side_effect=lambda *args,  **newkeywargs: utils.MockResponse(load_zip_bytes(os.path.join(DIRECTORY, "resources", "valid.zip")), 200))
+    def test_download_if_diff(self, mock_get):
+        service = download.DownloadService()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "feed.zip")
+            self.assertTrue(service.download_if_diff("something", path))
+            self.assertEqual(load_zip_bytes(path), load_zip_bytes(os.path.join(DIRECTORY, "resources", "valid.zip")))
+            os.remove(path)
+            service.commit("something")
+            self.assertFalse(service.download_if_diff("something", path))
+            self.assertEqual(os.listdir(directory), [], "Nothing should be left behind if unchanged")
+
+    @patch('requests.get', side_effect=lambda *args,  **newkeywargs: utils.MockResponse(load_zip_bytes(os.path.join(DIRECTORY, "resources", "valid.zip")), 200))
+    def test_download_if_diff_uncommitted(self, mock_get):
+        service = download.DownloadService()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "feed.zip")
+            self.assertTrue(service.download_if_diff("something", path))
+            self.assertTrue(service.download_if_diff("something", path),
+                            "A download that was never used should count as changed again")
+            self.assertIn("something", service.pending)
+            service.commit("something")
+            self.assertFalse(service.download_if_diff("something", path))
+            self.assertTrue(service.download_if_diff("something", path, force=True))
+
 
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
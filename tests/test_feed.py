@@ -0,0 +1,58 @@
+import os
+import tempfile
+import unittest
+import zipfile
+from unittest.mock import patch
+from src import feed, gtfs, metrics
+DIRECTORY = os.path.dirname(os.path.realpath(__file__))
+FEED = os.path.join(DIRECTORY, "resources", "feed")
+
+
+class Feed_Tests(unittest.TestCase):
+    def test_loads_on_first_use(self):
+        gtfs_feed = feed.Feed(FEED)
+        self.assertEqual(gtfs_feed.loaded, {})
+        stops = gtfs_feed["stops"]
+        self.assertEqual([x.stop_id for x in stops], ["A", "B", "C"])
+        self.assertIs(gtfs_feed["stops"], stops)
+        self.assertEqual(list(gtfs_feed.loaded), ["stops"])
+
+    def test_never_reads_unused_files(self):
+        gtfs_feed = feed.Feed(FEED)
+        with patch("src.feed.load_gtfs_from_file", wraps=gtfs.load_gtfs_from_file) as load:
+            gtfs_feed["stops"], gtfs_feed["routes"]
+        self.assertEqual([os.path.basename(x.args[0]) for x in load.call_args_list], ["stops.txt", "routes.txt"])
+
+    def test_columns(self):
+        gtfs_feed = feed.Feed(FEED, columns={"trips": ["trip_id"]})
+        self.assertEqual([(x.trip_id, x.route_id) for x in gtfs_feed["trips"]], [("T1", ""), ("T2", "")])
+
+    def test_missing_file(self):
+        gtfs_feed = feed.Feed(FEED)
+        self.assertNotIn("shapes", gtfs_feed)
+        self.assertIsNone(gtfs_feed.get("shapes"))
+        with self.assertRaises(KeyError):
+            gtfs_feed["shapes"]
+
+    def test_loaders_and_columnar(self):
+        gtfs_feed = feed.Feed(FEED, columnar=True, loaders={"stops": lambda: []})
+        self.assertEqual(gtfs_feed["stops"], [])
+        self.assertIsInstance(gtfs_feed["stop_times"], gtfs.StopTimeColumns)
+
+    def test_zip_iter_and_metrics(self):
+        run = metrics.Metrics()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "feed.zip")
+            with zipfile.ZipFile(path, 'w') as zip_file:
+                for filename in os.listdir(FEED):
+                    zip_file.write(os.path.join(FEED, filename), filename)
+            with zipfile.ZipFile(path) as zip_file:
+                gtfs_feed = feed.Feed(zip_file, metrics=run)
+                self.assertEqual(len(list(gtfs_feed.iter("stop_times"))), 6)
+                self.assertEqual(gtfs_feed.loaded, {})
+                self.assertEqual(len(gtfs_feed["trips"]), 2)
+        self.assertEqual([(x.labels["file"], x.rows) for x in run.stages], [("trips.txt", 2)])
+
+
+if __name__ == "__main__":
+    unittest.main()
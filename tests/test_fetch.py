@@ -0,0 +1,123 @@
+import io
+import os
+import tempfile
+import unittest
+import zipfile
+from src import cache, download, fetch, upload
+from . import utils
+DIRECTORY = os.path.dirname(os.path.realpath(__file__))
+FEED = os.path.join(DIRECTORY, "resources", "feed")
+
+
+def zip_feed():
+    content = io.BytesIO()
+    with zipfile.ZipFile(content, 'w') as zip_file:
+        for filename in os.listdir(FEED):
+            zip_file.write(os.path.join(FEED, filename), filename)
+    return content.getvalue()
+
+
+class Fetch_Tests(unittest.TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.TemporaryDirectory()
+        self.files = {f"/{x}.zip": x.encode("utf-8") * 1000 for x in ["a", "b", "c"]}
+
+    def tearDown(self):
+        self.work_dir.cleanup()
+
+    def targets(self, server, paths):
+        return [(server.url(x), os.path.join(self.work_dir.name, x.strip("/"))) for x in paths]
+
+    def test_fetch_all(self):
+        with utils.LocalHTTPServer(self.files) as server:
+            results = fetch.AsyncFetcher().run(self.targets(server, self.files))
+        for result, (path, content) in zip(results, self.files.items()):
+            self.assertTrue(result.ok and result.changed)
+            self.assertEqual(result.bytes, len(content))
+            self.assertGreater(result.seconds, 0)
+            with open(result.path, "rb") as f:
+                self.assertEqual(f.read(), content)
+
+    def test_unchanged_second_fetch(self):
+        fetcher = fetch.AsyncFetcher(download.DownloadService(cache.DownloadCache(self.work_dir.name)))
+        with utils.LocalHTTPServer(self.files) as server:
+            fetcher.run(self.targets(server, ["/a.zip"]))
+            fetcher.download_service.commit(server.url("/a.zip"))
+            result = fetcher.run(self.targets(server, ["/a.zip"]))[0]
+            self.assertIn("If-None-Match", server.requests[-1]["headers"])
+        self.assertTrue(result.ok)
+        self.assertFalse(result.changed)
+        self.assertEqual(result.bytes, 0)
+
+    def test_retries_with_backoff(self):
+        with utils.LocalHTTPServer(self.files, failures={"/a.zip": 2, "/b.zip": 5}) as server:
+            results = fetch.AsyncFetcher(retries=3, backoff=0.01).run(self.targets(server, ["/a.zip", "/b.zip"]))
+        self.assertTrue(results[0].ok)
+        self.assertEqual(results[0].attempts, 3)
+        self.assertFalse(results[1].ok)
+        self.assertEqual(results[1].attempts, 4)
+        self.assertIn("503", results[1].error)
+
+    def test_no_retry_for_missing(self):
+        with utils.LocalHTTPServer(self.files) as server:
+            results = fetch.AsyncFetcher(backoff=0.01).run(self.targets(server, ["/missing.zip", "/a.zip"]))
+        self.assertEqual(results[0].attempts, 1)
+        self.assertIn("404", results[0].error)
+        self.assertTrue(results[1].ok, "One failed download should not stop the others")
+
+    def test_timeout(self):
+        service = download.DownloadService(timeout=0.1)
+        with utils.LocalHTTPServer(self.files, delay=0.5) as server:
+            result = fetch.AsyncFetcher(service, retries=1, backoff=0.01).run(self.targets(server, ["/a.zip"]))[0]
+        self.assertFalse(result.ok)
+        self.assertEqual(result.attempts, 2)
+
+    def test_per_host_limit(self):
+        with utils.LocalHTTPServer(self.files, delay=0.2) as server:
+            fetch.AsyncFetcher(per_host=1).run(self.targets(server, self.files))
+            self.assertEqual(server.max_in_flight, 1)
+        with utils.LocalHTTPServer(self.files, delay=0.2) as server:
+            fetch.AsyncFetcher(per_host=3).run(self.targets(server, self.files))
+            self.assertGreater(server.max_in_flight, 1)
+
+    def test_connection_reuse(self):
+        with utils.LocalHTTPServer(self.files) as server:
+            fetch.AsyncFetcher(per_host=1).run(self.targets(server, self.files))
+            self.assertEqual(len({x["port"] for x in server.requests}), 1)
+
+    def test_download_and_insert(self):
+        cwd = os.getcwd()
+        os.chdir(self.work_dir.name)
+        try:
+            with utils.LocalHTTPServer({"/feed.zip": zip_feed()}) as server:
+                data_sets = [{"name": "A", "url": server.url("/feed.zip")}, {"name": "Bad", "url": server.url("/x")}]
+                mongo_db = utils.FakeDatabase()
+                result = upload.download_and_insert(data_sets, None, mongo_db,
+                                                    fetcher=fetch.AsyncFetcher(backoff=0.01))
+            self.assertEqual(list(result), ["A"])
+            self.assertEqual(len(result["A"]), 2)
+            self.assertEqual(os.listdir("."), [])
+            with self.assertRaises(ValueError):
+                upload.download_and_insert(data_sets, download.DownloadService(), mongo_db,
+                                           fetcher=fetch.AsyncFetcher())
+        finally:
+            os.chdir(cwd)
+
+    def test_download_and_insert_through_service(self):
+        cwd = os.getcwd()
+        os.chdir(self.work_dir.name)
+        try:
+            service = download.DownloadService(cache.DownloadCache(os.path.join(self.work_dir.name, "cache")))
+            with utils.LocalHTTPServer({"/feed.zip": zip_feed()}) as server:
+                data_sets = [{"name": "A", "url": server.url("/feed.zip")}]
+                mongo_db = utils.FakeDatabase()
+                first = upload.download_and_insert(data_sets, service, mongo_db, fetcher=fetch.AsyncFetcher(service))
+                second = upload.download_and_insert(data_sets, service, mongo_db, fetcher=fetch.AsyncFetcher(service))
+            self.assertEqual(len(first["A"]), 2)
+            self.assertEqual(second["A"], [], "The service's previous download should be used")
+        finally:
+            os.chdir(cwd)
+
+
+if __name__ == "__main__":
+    unittest.main()
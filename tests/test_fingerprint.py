@@ -0,0 +1,63 @@
+import copy
+import os
+import tempfile
+import unittest
+from src import fingerprint
+from . import utils
+
+
+def make_documents():
+    return [{"trip_id": str(i), "route_id": "R1", "service_id": "S1",
+             "stops": [{"stop_id": "A", "arrival_time": f"0{i}:00:00"}]} for i in range(1, 5)]
+
+
+class Fingerprint_Tests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "fingerprints.json")
+        utils.record_operations(self, fingerprint)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_fingerprint_ignores_key_order(self):
+        first = {"a": 1, "b": [1, 2]}
+        second = {"b": [1, 2], "a": 1}
+        self.assertEqual(fingerprint.fingerprint(first), fingerprint.fingerprint(second))
+        self.assertNotEqual(fingerprint.fingerprint(first), fingerprint.fingerprint({"a": 1, "b": [2, 1]}))
+
+    def test_store_persists(self):
+        fingerprint.FingerprintStore(self.path).update("feed", {"1": "abc"})
+        self.assertEqual(fingerprint.FingerprintStore(self.path).get("feed"), {"1": "abc"})
+        self.assertEqual(fingerprint.FingerprintStore(self.path).get("other"), {})
+
+    def test_sync_only_writes_changes(self):
+        collection = utils.FakeCollection()
+        stats = fingerprint.sync_documents(collection, make_documents(), "feed", fingerprint.FingerprintStore(self.path))
+        self.assertEqual(len(stats.upserted_ids), 4)
+        self.assertGreater(stats.bytes, 0)
+
+        documents = make_documents()
+        documents[0]["stops"][0]["arrival_time"] = "09:00:00"
+        del documents[3]
+        collection.calls.clear()
+        stats = fingerprint.sync_documents(collection, copy.deepcopy(documents), "feed",
+                                           fingerprint.FingerprintStore(self.path), batch_size=10)
+        self.assertEqual(stats.documents, 2, "One replace for the changed trip and one delete")
+        self.assertEqual(stats.modified, 1)
+        self.assertEqual(stats.deleted, 1)
+        self.assertEqual(collection.operations[-1].arguments["filter"], {"feed": "feed", "trip_id": {"$in": ["4"]}})
+        self.assertEqual(sorted(x["trip_id"] for x in collection.find({"feed": "feed"})), ["1", "2", "3"])
+        self.assertEqual(collection.find({"trip_id": "1"})[0]["stops"][0]["arrival_time"], "09:00:00")
+
+    def test_sync_unchanged_sends_nothing(self):
+        collection = utils.FakeCollection()
+        store = fingerprint.FingerprintStore(self.path)
+        fingerprint.sync_documents(collection, make_documents(), "feed", store)
+        collection.calls.clear()
+        fingerprint.sync_documents(collection, make_documents(), "feed", store)
+        self.assertEqual(collection.calls, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
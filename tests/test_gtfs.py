@@ -1,8 +1,23 @@
-import csv
+import math
+import os
+import tempfile
 import unittest
 from src import gtfs
 from unittest.mock import Mock, patch, mock_open
 
+STOP_TIMES_CSV = """trip_id,arrival_time,departure_time,stop_id,stop_sequence,stop_headsign,pickup_type,drop_off_type,shape_dist_traveled
+1,07:00:00,07:00:00,A,1,Town,0,0,
+1,7:05:30,07:06:00,B,2,Town,0,0,1.5
+2,24:10:00,24:10:00,A,1,,0,0,0
+"""
+
+
+def write_temp_csv(content):
+    handle, path = tempfile.mkstemp(suffix=".txt")
+    with os.fdopen(handle, 'w', encoding="utf-8") as f:
+        f.write(content)
+    return path
+
 
 class GTFS_Tests(unittest.TestCase):
     def test_load_gtfs_from_file_none_filename(self):
@@ -17,12 +32,93 @@ class GTFS_Tests(unittest.TestCase):
         with self.assertRaises(ValueError):
             gtfs.load_gtfs_from_file("valid", None)
 
+    @patch("csv.DictReader", new=Mock(side_effect=Exception("TEST")))
     @patch("builtins.open", new_callable=mock_open, read_data="data")
     def test_load_gtfs_from_file_csv_error(self, open_mock):
-        csv.DictReader = Mock(side_effect=Exception("TEST"))
         with self.assertRaises(Exception, msg="Should encounter exception"):
             gtfs.load_gtfs_from_file("valid", gtfs.Stop)
 
+    def test_record_from_row_converts_fields(self):
+        stop = gtfs.Stop.from_row({"stop_id": "1", "stop_name": "Alpha", "stop_lat": "53.35",
+                                   "stop_lon": "-6.26", "unexpected": "x"})
+        self.assertEqual(stop.stop_lat, 53.35)
+        self.assertEqual(stop.to_dict(), {"stop_id": "1", "stop_name": "Alpha", "stop_lat": 53.35, "stop_lon": -6.26})
+        self.assertFalse(hasattr(stop, "__dict__"), "Records should not have a per instance dict")
+        stop_time = gtfs.StopTime.from_row({"trip_id": "1", "stop_sequence": "2", "shape_dist_traveled": ""})
+        self.assertEqual(stop_time.stop_sequence, 2)
+        self.assertIsNone(stop_time.shape_dist_traveled)
+
+    def test_record_from_row_invalid_number(self):
+        with self.assertRaises(ValueError):
+            gtfs.Stop.from_row({"stop_lat": "north"})
+
+    def test_load_gtfs_from_file_typed(self):
+        path = write_temp_csv(STOP_TIMES_CSV)
+        try:
+            stop_times = gtfs.load_gtfs_from_file(path, gtfs.StopTime)
+        finally:
+            os.remove(path)
+        self.assertEqual([x.stop_sequence for x in stop_times], [1, 2, 1])
+        self.assertEqual(stop_times[1].shape_dist_traveled, 1.5)
+        self.assertIs(stop_times[0].trip_id, stop_times[1].trip_id)
+
+    def test_load_gtfs_from_file_columns(self):
+        path = write_temp_csv(STOP_TIMES_CSV + "3,08:00:00\n\n")
+        try:
+            stop_times = gtfs.load_gtfs_from_file(path, gtfs.StopTime, columns=["trip_id", "stop_sequence"])
+            with self.assertRaises(ValueError):
+                gtfs.load_gtfs_from_file(path, gtfs.StopTime, columns=["platform"])
+        finally:
+            os.remove(path)
+        self.assertEqual([(x.trip_id, x.stop_sequence) for x in stop_times], [("1", 1), ("1", 2), ("2", 1), ("3", 0)])
+        self.assertEqual(stop_times[1].stop_id, "", "Fields not asked for keep their defaults")
+        self.assertEqual(stop_times[1].shape_dist_traveled, 0)
+
+    def test_parse_gtfs_time(self):
+        self.assertEqual(gtfs.parse_gtfs_time("07:05:30"), 25530)
+        self.assertEqual(gtfs.parse_gtfs_time("25:00:00"), 90000)
+        self.assertEqual(gtfs.parse_gtfs_time(""), gtfs.MISSING_TIME)
+        self.assertEqual(gtfs.format_gtfs_time(90000), "25:00:00")
+        self.assertEqual(gtfs.format_gtfs_time(gtfs.MISSING_TIME), "")
+
+    def test_load_stop_times_columns(self):
+        path = write_temp_csv(STOP_TIMES_CSV)
+        try:
+            columns = gtfs.load_stop_times_columns(path)
+        finally:
+            os.remove(path)
+        self.assertEqual(len(columns), 3)
+        self.assertEqual(list(columns.arrival_time), [25200, 25530, 87000])
+        self.assertEqual(list(columns.stop_sequence), [1, 2, 1])
+        self.assertTrue(math.isnan(columns.shape_dist_traveled[0]))
+        self.assertIs(columns.stop_id[0], columns.stop_id[2])
+
+    def test_stop_time_columns_view(self):
+        path = write_temp_csv(STOP_TIMES_CSV)
+        try:
+            columns = gtfs.load_stop_times_columns(path)
+        finally:
+            os.remove(path)
+        stop_time = columns[-2]
+        self.assertIsInstance(stop_time, gtfs.StopTime)
+        self.assertEqual(stop_time.arrival_time, "07:05:30")
+        self.assertEqual(stop_time.shape_dist_traveled, 1.5)
+        self.assertEqual([x.trip_id for x in columns], ["1", "1", "2"])
+        with self.assertRaises(IndexError):
+            columns[3]
+
+    def test_stop_time_columns_blank_sequence(self):
+        path = write_temp_csv(STOP_TIMES_CSV + "2,24:20:00,24:20:00,B,,,0,0,\n")
+        try:
+            columns = gtfs.load_stop_times_columns(path)
+            records = gtfs.load_gtfs_from_file(path, gtfs.StopTime)
+        finally:
+            os.remove(path)
+        self.assertEqual(columns.stop_sequence[-1], gtfs.MISSING_SEQUENCE)
+        self.assertIsNone(columns[-1].stop_sequence)
+        self.assertEqual([columns.row_dict(i)["stop_sequence"] for i in range(len(columns))],
+                         [x.stop_sequence for x in records])
+
 
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,59 @@
+import os
+import unittest
+from src import feed, gtfs, merge
+DIRECTORY = os.path.dirname(os.path.realpath(__file__))
+FEED = os.path.join(DIRECTORY, "resources", "feed")
+RAIL = os.path.join(DIRECTORY, "resources", "rail")
+
+
+class Merge_Tests(unittest.TestCase):
+    def test_namespace(self):
+        self.assertEqual(merge.namespace("bus", "R1"), "bus:R1")
+        self.assertEqual(merge.namespace("bus", ""), "")
+        self.assertIsNone(merge.namespace("bus", None))
+
+    def test_normalise_name(self):
+        self.assertEqual(merge.normalise_name(" O'Connell  St. "), "o connell st")
+        self.assertEqual(merge.normalise_name(None), "")
+
+    def test_deduplicate_stops(self):
+        stops = merge.StopDeduplicator(distance=25)
+        self.assertEqual(stops.add(gtfs.Stop("bus:1", "Main St", 53.35, -6.26), "bus"), "bus:1")
+        # Same name about 10m away in another feed is the same stop
+        self.assertEqual(stops.add(gtfs.Stop("rail:1", "MAIN ST.", 53.35009, -6.26), "rail"), "bus:1")
+        # Too far away, a different name or the same feed are kept apart
+        self.assertEqual(stops.add(gtfs.Stop("rail:2", "Main St", 53.351, -6.26), "rail"), "rail:2")
+        self.assertEqual(stops.add(gtfs.Stop("rail:3", "Station", 53.35, -6.26), "rail"), "rail:3")
+        self.assertEqual(stops.add(gtfs.Stop("bus:2", "Main St", 53.35001, -6.26), "bus"), "bus:2")
+        self.assertEqual(stops.add(gtfs.Stop("tram:1", "Main St"), "tram"), "tram:1")
+        self.assertEqual(stops.duplicates, 1)
+        self.assertEqual(stops.ids["rail:1"], "bus:1")
+
+    def test_deduplicate_across_cells(self):
+        stops = merge.StopDeduplicator(distance=25)
+        stops.add(gtfs.Stop("a:1", "Stop", 53.35, -6.26), "a")
+        for lat, lon in [(53.35019, -6.26), (53.34981, -6.26), (53.35, -6.26028), (53.35, -6.25972)]:
+            self.assertEqual(stops.add(gtfs.Stop(f"b:{lat},{lon}", "Stop", lat, lon), f"b{lat}{lon}"), "a:1")
+
+    def test_merge_feeds(self):
+        merger = merge.FeedMerger()
+        merger.add("bus", feed.Feed(FEED))
+        merger.add("rail", feed.Feed(RAIL))
+        merged = merger.feed()
+        self.assertEqual([x.stop_id for x in merged["stops"]], ["bus:A", "bus:B", "bus:C", "rail:B", "rail:D"])
+        self.assertEqual([x.route_id for x in merged["routes"]], ["bus:R1", "rail:R1"])
+        self.assertEqual([x.agency_id for x in merged["routes"]], ["bus:1", "rail:1"])
+        self.assertEqual([x.service_id for x in merged["calendar"]], ["bus:S1", "rail:S1"])
+        self.assertEqual(len(merged["agency"]), 2)
+        rail_times = [x for x in merged["stop_times"] if x.trip_id == "rail:T1"]
+        self.assertEqual([x.stop_id for x in rail_times], ["bus:A", "rail:B", "rail:D"])
+
+    def test_merge_same_prefix(self):
+        merger = merge.FeedMerger()
+        merger.add("bus", feed.Feed(FEED))
+        with self.assertRaises(ValueError):
+            merger.add("bus", feed.Feed(RAIL))
+
+
+if __name__ == "__main__":
+    unittest.main()
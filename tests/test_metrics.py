@@ -0,0 +1,52 @@
+import json
+import os
+import pstats
+import tempfile
+import unittest
+from src import metrics
+
+
+class Metrics_Tests(unittest.TestCase):
+    def test_stage(self):
+        run = metrics.Metrics()
+        with run.stage("parse", rows=10, file="stops.txt") as stage:
+            sum(range(10000))
+        self.assertEqual(run.stages, [stage])
+        self.assertEqual(stage.labels, {"file": "stops.txt"})
+        self.assertGreater(stage.seconds, 0)
+        self.assertGreaterEqual(stage.cpu_seconds, 0)
+        self.assertAlmostEqual(stage.rows_per_second, 10 / stage.seconds)
+        self.assertIsNone(stage.traced_peak_bytes)
+
+    def test_stage_recorded_on_error(self):
+        run = metrics.Metrics()
+        with self.assertRaises(ValueError):
+            with run.stage("insert"):
+                raise ValueError("failed")
+        self.assertEqual(run.stages[0].name, "insert")
+        self.assertIsNone(run.stages[0].rows_per_second)
+
+    def test_trace_memory(self):
+        run = metrics.Metrics(trace_memory=True)
+        with run.stage("allocate"):
+            data = [0] * 100000
+        self.assertGreaterEqual(run.stages[0].traced_peak_bytes, len(data) * 8)
+
+    def test_write_and_profile(self):
+        with tempfile.TemporaryDirectory() as directory:
+            run = metrics.Metrics()
+            profile_path = os.path.join(directory, "run.prof")
+            with metrics.profiled(profile_path):
+                with run.stage("join"):
+                    sorted(range(1000), reverse=True)
+            run.write(os.path.join(directory, "metrics.json"))
+            with open(os.path.join(directory, "metrics.json")) as f:
+                written = json.load(f)
+            self.assertGreater(pstats.Stats(profile_path).total_calls, 0)
+        self.assertEqual([x["name"] for x in written["stages"]], ["join"])
+        with metrics.profiled(None) as profiler:
+            self.assertIsNone(profiler)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+import os
+import tempfile
+import unittest
+from src import gtfs, parallel
+
+HEADER = "trip_id,arrival_time,departure_time,stop_id,stop_sequence,stop_headsign\n"
+
+
+def write_rows(path, count):
+    with open(path, 'w', encoding="utf-8-sig", newline="") as f:
+        f.write(HEADER)
+        for i in range(count):
+            headsign = f'"Line one\nline ""{i}"", two"' if i % 3 == 0 else f"Town {i}"
+            f.write(f"T{i // 5},07:{i % 60:02d}:00,07:{i % 60:02d}:30,S{i},{i % 5 + 1},{headsign}\r\n")
+
+
+class Parallel_Tests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "stop_times.txt")
+        write_rows(self.path, 200)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_record_boundaries_skip_quoted_newlines(self):
+        boundaries = parallel.record_boundaries(self.path, 16)
+        self.assertEqual(boundaries, sorted(set(boundaries)))
+        self.assertEqual(boundaries[-1], os.path.getsize(self.path))
+        with open(self.path, 'rb') as f:
+            content = f.read()
+        for boundary in boundaries[:-1]:
+            self.assertEqual(content[boundary - 1:boundary], b"\n")
+            self.assertEqual(content[:boundary].count(b'"') % 2, 0, "Boundary should not be inside quotes")
+
+    def test_record_boundaries_small_blocks(self):
+        original = parallel.BLOCK_SIZE
+        parallel.BLOCK_SIZE = 7
+        try:
+            small = parallel.record_boundaries(self.path, 16)
+        finally:
+            parallel.BLOCK_SIZE = original
+        self.assertEqual(small, parallel.record_boundaries(self.path, 16))
+
+    def test_load_objects_matches_sequential(self):
+        expected = gtfs.load_gtfs_from_file(self.path, gtfs.StopTime)
+        result = parallel.load_gtfs_parallel(self.path, gtfs.StopTime, processes=2, chunks_per_process=5)
+        self.assertEqual([x.to_dict() for x in result], [x.to_dict() for x in expected])
+
+    def test_load_columns_matches_sequential(self):
+        expected = gtfs.load_stop_times_columns(self.path)
+        result = parallel.load_gtfs_parallel(self.path, gtfs.StopTimeColumns, processes=2, chunks_per_process=5)
+        self.assertEqual([x.to_dict() for x in result], [x.to_dict() for x in expected])
+        self.assertIs(result.trip_id[0], result.trip_id[1])
+
+    def test_blank_lines_match_sequential(self):
+        with open(self.path, 'w', encoding="utf-8", newline="") as f:
+            f.write(HEADER)
+            for i in range(40):
+                f.write(f"T{i // 5},07:{i % 60:02d}:00,07:{i % 60:02d}:30,S{i},{i % 5 + 1},Town\r\n")
+                if i % 4 == 0:
+                    f.write("\r\n\n")
+            f.write("\r\n")
+        expected = gtfs.load_gtfs_from_file(self.path, gtfs.StopTime)
+        self.assertEqual(len(expected), 40)
+        result = parallel.load_gtfs_parallel(self.path, gtfs.StopTime, processes=2, chunks_per_process=8)
+        self.assertEqual([x.to_dict() for x in result], [x.to_dict() for x in expected])
+        columns = parallel.load_gtfs_parallel(self.path, gtfs.StopTimeColumns, processes=2, chunks_per_process=8)
+        self.assertEqual([x.to_dict() for x in columns], [x.to_dict() for x in gtfs.load_stop_times_columns(self.path)])
+
+    def test_blank_filename(self):
+        with self.assertRaises(ValueError):
+            parallel.load_gtfs_parallel("", gtfs.StopTime)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,49 @@
+import os
+import unittest
+from src import gtfs, patterns, translation
+DIRECTORY = os.path.dirname(os.path.realpath(__file__))
+FEED = os.path.join(DIRECTORY, "resources", "feed")
+
+
+def load(filename, obj_type):
+    return gtfs.load_gtfs_from_file(os.path.join(FEED, filename), obj_type)
+
+
+class Patterns_Tests(unittest.TestCase):
+    def setUp(self):
+        self.connections = translation.connect_route_stops(load("routes.txt", gtfs.Route),
+                                                           load("stop_times.txt", gtfs.StopTime),
+                                                           load("trips.txt", gtfs.Trip))
+
+    def test_trips_share_pattern(self):
+        compressor = patterns.PatternCompressor()
+        trips = [compressor.trip(x) for x in self.connections]
+        self.assertEqual(len(compressor.patterns), 1)
+        self.assertEqual(trips[0]["pattern_id"], trips[1]["pattern_id"])
+        self.assertTrue(trips[0]["pattern_id"].startswith("R1:"))
+        self.assertEqual(trips[1]["start_time"], "08:00:00")
+        self.assertEqual(trips[1]["departure_offsets"], [0, 300, 600])
+        self.assertNotIn("stops", trips[0])
+
+    def test_pattern_id_is_stable(self):
+        first, second = patterns.PatternCompressor(), patterns.PatternCompressor()
+        self.assertEqual(first.trip(self.connections[0])["pattern_id"],
+                         second.trip(self.connections[1])["pattern_id"])
+
+    def test_different_stops_new_pattern(self):
+        compressor = patterns.PatternCompressor()
+        compressor.trip(self.connections[0])
+        changed = dict(self.connections[1], stops=self.connections[1]["stops"][:2])
+        compressor.trip(changed)
+        self.assertEqual(len(compressor.pattern_list()), 2)
+
+    def test_expand_round_trip(self):
+        compressor = patterns.PatternCompressor()
+        self.connections[0]["stops"][1]["arrival_time"] = ""
+        for connection in self.connections:
+            trip = compressor.trip(connection)
+            self.assertEqual(patterns.expand_trip(trip, compressor.patterns[trip["pattern_id"]]), connection)
+
+
+if __name__ == "__main__":
+    unittest.main()
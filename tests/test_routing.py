@@ -0,0 +1,123 @@
+import os
+import tempfile
+import unittest
+from datetime import date
+from src import gtfs, routing
+
+
+def stop_time(trip_id, stop_id, sequence, arrival, departure=None):
+    return gtfs.StopTime(trip_id, arrival, arrival if departure is None else departure, stop_id, sequence)
+
+
+class Routing_Tests(unittest.TestCase):
+    def setUp(self):
+        # Line 1 runs A-B-C twice, line 2 runs B-D, the express E1 overtakes the slow S1 on A-B-C
+        self.trips = [gtfs.Trip("R1", "S", "L1a"), gtfs.Trip("R1", "S", "L1b"), gtfs.Trip("R2", "S", "L2"),
+                      gtfs.Trip("R3", "S", "S1"), gtfs.Trip("R3", "S", "E1")]
+        self.stop_times = [
+            stop_time("L1a", "A", 1, "07:00:00"), stop_time("L1a", "B", 2, "07:10:00", "07:11:00"),
+            stop_time("L1a", "C", 3, "07:20:00"),
+            stop_time("L1b", "C", 3, "08:20:00"), stop_time("L1b", "A", 1, "08:00:00"),
+            stop_time("L1b", "B", 2, "08:10:00"),
+            stop_time("L2", "B", 1, "07:15:00"), stop_time("L2", "X", 2, ""), stop_time("L2", "D", 3, "07:30:00"),
+            stop_time("S1", "A", 1, "09:00:00"), stop_time("S1", "B", 2, "09:30:00"), stop_time("S1", "C", 3, "10:00:00"),
+            stop_time("E1", "A", 1, "09:10:00"), stop_time("E1", "B", 2, "09:20:00"), stop_time("E1", "C", 3, "09:30:00"),
+            stop_time("unknown", "A", 1, "06:00:00"), stop_time("unknown", "D", 2, "06:05:00"),
+        ]
+        self.timetable = routing.Timetable.build(self.trips, self.stop_times)
+
+    def test_connections_sorted(self):
+        timetable = self.timetable
+        self.assertEqual(len(timetable.connection_trip), 9)
+        self.assertEqual(timetable.connection_dep_time.tolist(), sorted(timetable.connection_dep_time.tolist()))
+        first = [timetable.stop_ids[timetable.connection_dep_stop[0]], timetable.stop_ids[timetable.connection_arr_stop[0]],
+                 timetable.connection_dep_time[0], timetable.connection_arr_time[0],
+                 timetable.trip_ids[timetable.connection_trip[0]]]
+        self.assertEqual(first, ["A", "B", 25200, 25800, "L1a"])
+
+    def test_routes(self):
+        timetable = self.timetable
+        # Routes go by stops rather than GTFS route, but E1 overtakes S1 so they are split
+        route_trips = [timetable.trip_ids[timetable.route_trips[timetable.route_trip_offsets[r]:
+                                                                timetable.route_trip_offsets[r + 1]]].tolist()
+                       for r in range(len(timetable.route_trip_offsets) - 1)]
+        self.assertEqual(sorted(route_trips), [["E1"], ["L1a", "L1b", "S1"], ["L2"]])
+        b = timetable.stop_index("B")
+        self.assertEqual(timetable.stop_route_offsets[b + 1] - timetable.stop_route_offsets[b], 3)
+        self.assertNotIn("X", timetable.stop_ids.tolist(), "Untimed stops are left out")
+
+    def test_earliest_arrival(self):
+        self.assertEqual(self.timetable.earliest_arrival("A", 6 * 3600),
+                         {"A": 21600, "B": 25800, "C": 26400, "D": 27000})
+        self.assertEqual(self.timetable.earliest_arrival("A", 6 * 3600, "D"), {"D": 27000})
+        # Too late for line 2, the express beats the slow trip to C
+        self.assertEqual(self.timetable.earliest_arrival("A", 8 * 3600 + 1, "C"), {"C": 34200})
+        self.assertEqual(self.timetable.earliest_arrival("C", 0), {"C": 0})
+        self.assertEqual(self.timetable.earliest_arrival("C", 0, "A"), {})
+        with self.assertRaises(KeyError):
+            self.timetable.earliest_arrival("Z", 0)
+
+    def test_raptor_matches_csa(self):
+        for source in self.timetable.stop_ids.tolist():
+            for departure in range(6 * 3600, 11 * 3600, 600):
+                self.assertEqual(self.timetable.raptor(source, departure),
+                                 self.timetable.earliest_arrival(source, departure), (source, departure))
+        self.assertEqual(self.timetable.raptor("A", 8 * 3600 + 1, "C"), {"C": 34200})
+
+    def test_raptor_max_transfers(self):
+        self.assertEqual(self.timetable.raptor("A", 6 * 3600, "D", max_transfers=0), {})
+        self.assertEqual(self.timetable.raptor("A", 6 * 3600, "D", max_transfers=1), {"D": 27000})
+
+    def test_day(self):
+        # E1 only runs on Saturdays, the rest on weekdays, from Monday 3 to Sunday 16 October 2022
+        trips = self.trips[:4] + [gtfs.Trip("R3", "SAT", "E1")]
+        calendars = [gtfs.Calendar("S", "1", "1", "1", "1", "1", "0", "0", "20221003", "20221016"),
+                     gtfs.Calendar("SAT", "0", "0", "0", "0", "0", "1", "0", "20221003", "20221016")]
+        timetable = routing.Timetable.build(trips, self.stop_times, calendars)
+        monday, saturday, sunday = date(2022, 10, 10), date(2022, 10, 15), date(2022, 10, 16)
+        self.assertEqual(timetable.running(saturday), [False, False, False, False, True])
+        self.assertEqual(timetable.earliest_arrival("A", 8 * 3600 + 1, "C", monday), {"C": 36000})
+        self.assertEqual(timetable.earliest_arrival("A", 8 * 3600 + 1, "C", saturday), {"C": 34200})
+        self.assertEqual(timetable.earliest_arrival("A", 0, day=saturday), {"A": 0, "B": 33600, "C": 34200})
+        self.assertEqual(timetable.earliest_arrival("A", 0, day=sunday), {"A": 0})
+        self.assertEqual(timetable.earliest_arrival("A", 0, day=date(2022, 10, 17)), {"A": 0})
+        self.assertEqual(timetable.raptor("A", 8 * 3600 + 1, "C", day=monday), {"C": 36000})
+        for day in (monday, saturday, sunday):
+            for source in timetable.stop_ids.tolist():
+                for departure in range(6 * 3600, 11 * 3600, 600):
+                    self.assertEqual(timetable.raptor(source, departure, day=day),
+                                     timetable.earliest_arrival(source, departure, day=day), (day, source, departure))
+        # Without calendars no trip runs on any date
+        self.assertEqual(self.timetable.earliest_arrival("A", 0, day=monday), {"A": 0})
+
+    def test_save_load(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "timetable.npz")
+            self.timetable.save(path)
+            loaded = routing.Timetable.load(path)
+        for name in routing.ARRAYS:
+            self.assertEqual(getattr(loaded, name).tolist(), getattr(self.timetable, name).tolist(), name)
+        self.assertEqual(loaded.earliest_arrival("A", 0), self.timetable.earliest_arrival("A", 0))
+
+    def test_build_from_columns(self):
+        columns = gtfs.StopTimeColumns()
+        for x in self.stop_times:
+            columns.append(gtfs.to_dict(x))
+        timetable = routing.Timetable.build(self.trips, columns)
+        for name in routing.ARRAYS:
+            self.assertEqual(getattr(timetable, name).tolist(), getattr(self.timetable, name).tolist(), name)
+
+    def test_blank_stop_sequence(self):
+        stop_times = [stop_time("L1a", "C", None, "07:20:00"), stop_time("L1a", "A", 1, "07:00:00"),
+                      stop_time("L1a", "B", 2, "07:10:00")]
+        timetable = routing.Timetable.build(self.trips[:1], stop_times)
+        self.assertEqual(timetable.earliest_arrival("A", 0, "C"), {"C": 26400})
+
+    def test_empty(self):
+        timetable = routing.Timetable.build([], [])
+        self.assertEqual(len(timetable.connection_trip), 0)
+        self.assertEqual(len(timetable.route_trip_offsets), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+import unittest
+from datetime import date
+from src import gtfs, services
+
+
+def make_calendar(service_id, days, start="20221003", end="20221016"):
+    return gtfs.Calendar(service_id, *[str(x) for x in days], start, end)
+
+
+class Services_Tests(unittest.TestCase):
+    def setUp(self):
+        self.index = services.ServiceIndex([
+            make_calendar("weekday", [1, 1, 1, 1, 1, 0, 0]),
+            make_calendar("weekend", [0, 0, 0, 0, 0, 1, 1]),
+            make_calendar("later", [1, 1, 1, 1, 1, 1, 1], "20221010"),
+        ])
+
+    def test_weekday_mask(self):
+        self.assertEqual(self.index.masks["weekday"], 0b0011111)
+        self.assertEqual(self.index.masks["weekend"], 0b1100000)
+
+    def test_get_dict(self):
+        self.assertEqual(self.index.get_dict("weekday")["start_date"], "20221003")
+        self.assertEqual(self.index.get_dict("missing"), {})
+
+    def test_services_on(self):
+        self.assertEqual(self.index.services_on(date(2022, 10, 5)), ["weekday"])
+        self.assertEqual(sorted(self.index.services_on(date(2022, 10, 15))), ["later", "weekend"])
+        self.assertEqual(self.index.services_on(date(2022, 10, 17)), [])
+
+    def test_runs_on(self):
+        self.assertTrue(self.index.runs_on("weekend", date(2022, 10, 9)))
+        self.assertFalse(self.index.runs_on("weekend", date(2022, 10, 10)))
+        self.assertFalse(self.index.runs_on("missing", date(2022, 10, 10)))
+
+    def test_service_days(self):
+        days = list(self.index.service_days("weekend"))
+        self.assertEqual(days, [date(2022, 10, 8), date(2022, 10, 9), date(2022, 10, 15), date(2022, 10, 16)])
+
+    def test_invalid_date_skipped(self):
+        with self.assertLogs(level="WARNING"):
+            index = services.ServiceIndex([make_calendar("bad", [1, 1, 1, 1, 1, 1, 1], "2022-10-03"),
+                                           make_calendar("good", [1, 1, 1, 1, 1, 1, 1])])
+        self.assertEqual(index.get_dict("bad")["start_date"], "2022-10-03", "The calendar is still passed through")
+        self.assertFalse(index.runs_on("bad", date(2022, 10, 5)))
+        self.assertEqual(index.services_on(date(2022, 10, 5)), ["good"])
+        self.assertEqual(list(index.service_days("bad")), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+import math
+import os
+import tempfile
+import unittest
+from src import gtfs, snapshot
+DIRECTORY = os.path.dirname(os.path.realpath(__file__))
+FEED = os.path.join(DIRECTORY, "resources", "feed")
+
+
+def load_feed():
+    return {gtfs.FILE_TO_PARAMETER_NAME[k]: gtfs.load_gtfs_from_file(os.path.join(FEED, k), v)
+            for k, v in gtfs.FILE_TO_OBJECT_MAPPINGS.items()}
+
+
+class Snapshot_Tests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "feed.snap")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_round_trip(self):
+        feed = load_feed()
+        snapshot.write_snapshot(self.path, feed)
+        with snapshot.Snapshot(self.path) as snap:
+            self.assertEqual(snap.lengths["stop_times"], len(feed["stop_times"]))
+            self.assertEqual([x.to_dict() for x in snap.load("trips")], [x.to_dict() for x in feed["trips"]])
+            stops = snap.load("stops")
+            self.assertEqual(stops[0].stop_lat, 53.35)
+            stop_times = snap.stop_time_columns()
+            self.assertEqual(stop_times[4].arrival_time, feed["stop_times"][4].arrival_time)
+            self.assertEqual(stop_times[4].stop_id, feed["stop_times"][4].stop_id)
+            del stop_times
+
+    def test_numeric_columns_are_views(self):
+        snapshot.write_snapshot(self.path, load_feed())
+        with snapshot.Snapshot(self.path) as snap:
+            arrivals = snap.column("stop_times", "arrival_time")
+            self.assertIsInstance(arrivals, memoryview)
+            self.assertEqual(arrivals[0], 7 * 3600)
+            arrivals.release()
+            with self.assertRaises(KeyError):
+                snap.column("stop_times", "missing")
+
+    def test_trip_stop_times_grouped_by_trip(self):
+        feed = load_feed()
+        # Interleave the trips so the snapshot has to group them
+        feed["stop_times"] = feed["stop_times"][::2] + feed["stop_times"][1::2]
+        snapshot.write_snapshot(self.path, feed)
+        with snapshot.Snapshot(self.path) as snap:
+            trip_ids = snap.column("stop_times", "trip_id")
+            for index, trip in enumerate(feed["trips"]):
+                rows = snap.trip_stop_times(index)
+                self.assertEqual(len(rows), 3)
+                self.assertTrue(all(trip_ids[i] == trip.trip_id for i in rows))
+
+    def test_missing_distance_is_nan(self):
+        columns = gtfs.StopTimeColumns()
+        columns.append({"trip_id": "T1", "arrival_time": "07:00:00", "stop_sequence": "1"})
+        snapshot.write_snapshot(self.path, {"trips": [gtfs.Trip(trip_id="T1")], "stop_times": columns})
+        with snapshot.Snapshot(self.path) as snap:
+            self.assertTrue(math.isnan(snap.column("stop_times", "shape_dist_traveled")[0]))
+            self.assertIsNone(snap.stop_time_columns()[0].shape_dist_traveled)
+
+    def test_not_a_snapshot(self):
+        with open(self.path, 'wb') as f:
+            f.write(b"\0" * 64)
+        with self.assertRaises(ValueError):
+            snapshot.Snapshot(self.path)
+
+
+if __name__ == "__main__":
+    unittest.main()
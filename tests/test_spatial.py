@@ -0,0 +1,76 @@
+import json
+import os
+import random
+import tempfile
+import unittest
+from benchmarks import synthetic
+from src import gtfs, spatial
+
+
+def make_stop(stop_id, lat, lon):
+    return gtfs.Stop(stop_id, stop_id, lat, lon)
+
+
+class Spatial_Tests(unittest.TestCase):
+    def setUp(self):
+        self.stops = [make_stop("A", 53.3498, -6.2603), make_stop("B", 53.3438, -6.2546),
+                      make_stop("C", 53.3331, -6.2489), make_stop("D", 53.2707, -9.0568),
+                      gtfs.Stop("E", "E")]
+        self.index = spatial.StopIndex(self.stops)
+
+    def test_skips_stops_without_coordinates(self):
+        self.assertEqual([x.stop_id for x in self.index.stops], ["A", "B", "C", "D"])
+
+    def test_nearest(self):
+        nearest = self.index.nearest(53.3490, -6.2600, 2)
+        self.assertEqual([x.stop_id for x, _ in nearest], ["A", "B"])
+        self.assertAlmostEqual(nearest[0][1], spatial.haversine(53.3490, -6.2600, 53.3498, -6.2603))
+        self.assertEqual([x.stop_id for x, _ in self.index.nearest(53.27, -9.05)], ["D"])
+        self.assertEqual(len(self.index.nearest(0, 0, 10)), 4)
+        self.assertEqual(spatial.StopIndex([]).nearest(53.3, -6.2), [])
+
+    def test_within_radius(self):
+        self.assertEqual([x.stop_id for x, _ in self.index.within_radius(53.3498, -6.2603, 1000)], ["A", "B"])
+        self.assertEqual(self.index.within_radius(0, 0, 1000), [])
+
+    def test_in_bbox(self):
+        self.assertEqual([x.stop_id for x in self.index.in_bbox(53.3, -6.3, 53.345, -6.2)], ["B", "C"])
+
+    def test_matches_brute_force(self):
+        with tempfile.TemporaryDirectory() as directory:
+            synthetic.generate_feed(directory, synthetic.SCALES["tiny"], seed=1)
+            stops = gtfs.load_gtfs_from_file(os.path.join(directory, "stops.txt"), gtfs.Stop)
+        index = spatial.StopIndex(stops)
+        rand = random.Random(2)
+        for _ in range(50):
+            lat, lon = synthetic.CENTRE_LAT + rand.uniform(-0.3, 0.3), synthetic.CENTRE_LON + rand.uniform(-0.3, 0.3)
+            self.assertEqual([x.stop_id for x, _ in index.nearest(lat, lon, 3)],
+                             [x.stop_id for x, _ in spatial.brute_force_nearest(stops, lat, lon, 3)])
+
+    def test_matches_brute_force_across_latitudes(self):
+        # Most stops are in the south, pulling the origin away from the northern ones, where with
+        # small cells the projection is furthest off
+        rand = random.Random(3)
+        stops = [make_stop(str(i), rand.uniform(51.0, 51.8) if i % 5 else rand.uniform(51.0, 55.5),
+                           rand.uniform(-8.5, -7.5)) for i in range(2000)]
+        stops += [make_stop("q", 55.4, -8.0), make_stop("east", 55.4, -8.0 + 995 / spatial.haversine(55.4, 0, 55.4, 1))]
+        index = spatial.StopIndex(stops, cell_size=50)
+        self.assertIn("east", [x.stop_id for x, _ in index.within_radius(55.4, -8.0, 1000)])
+        for _ in range(100):
+            lat, lon = rand.uniform(51.0, 55.5), rand.uniform(-8.5, -7.5)
+            radius = rand.uniform(100, 3000)
+            self.assertEqual([x.stop_id for x, _ in index.nearest(lat, lon, 3)],
+                             [x.stop_id for x, _ in spatial.brute_force_nearest(stops, lat, lon, 3)])
+            self.assertEqual(sorted(x.stop_id for x, _ in index.within_radius(lat, lon, radius)),
+                             sorted(x.stop_id for x in stops
+                                    if spatial.haversine(lat, lon, x.stop_lat, x.stop_lon) <= radius))
+
+    def test_serialise(self):
+        loaded = spatial.StopIndex.from_dict(json.loads(json.dumps(self.index.to_dict())))
+        self.assertEqual(loaded.cells, self.index.cells)
+        self.assertEqual([x.stop_id for x, _ in loaded.nearest(53.34, -6.25, 3)],
+                         [x.stop_id for x, _ in self.index.nearest(53.34, -6.25, 3)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+import os
+import unittest
+from src import indexes, staging
+from . import utils
+MONGO_TEST_URL = os.environ.get("MONGO_TEST_URL")  # e.g. mongodb://localhost:27017 to test against a mongod
+
+
+class Staging_Tests(unittest.TestCase):
+    def setUp(self):
+        self.mongo_db = utils.FakeDatabase()
+
+    def test_swap_replaces_live(self):
+        self.mongo_db["routes"].insert_many([{"trip_id": "old"}])
+        staged = staging.StagedCollection(self.mongo_db, "routes")
+        staged.write({"trip_id": str(i)} for i in range(3))
+        self.assertEqual(len(self.mongo_db["routes"].documents), 1, "Live collection changes only on swap")
+        self.assertEqual(staged.swap(indexes.ROUTE_INDEXES), 3)
+        self.assertEqual([x["trip_id"] for x in self.mongo_db["routes"].documents], ["0", "1", "2"])
+        self.assertEqual(self.mongo_db["routes"].index_sizes, [3] * len(indexes.ROUTE_INDEXES))
+        self.assertNotIn("routes_staging", self.mongo_db.collections)
+
+    def test_carry_over(self):
+        self.mongo_db["routes"].insert_many([{"feed": "a", "trip_id": "1"}, {"feed": "b", "trip_id": "2"}])
+        staged = staging.StagedCollection(self.mongo_db, "routes")
+        self.assertEqual(staged.carry_over({"feed": "b"}), 1)
+        staged.write([{"feed": "a", "trip_id": "3"}])
+        staged.swap([])
+        self.assertEqual(sorted(x["trip_id"] for x in self.mongo_db["routes"].documents), ["2", "3"])
+
+    def test_leftover_staging_dropped(self):
+        self.mongo_db["routes_staging"].insert_many([{"trip_id": "partial"}])
+        staged = staging.StagedCollection(self.mongo_db, "routes")
+        staged.write([{"trip_id": "1"}])
+        self.assertEqual(staged.swap([]), 1)
+
+    def test_count_mismatch_aborts(self):
+        self.mongo_db["routes"].insert_many([{"trip_id": "old"}])
+        staged = staging.StagedCollection(self.mongo_db, "routes")
+        staged.write([{"trip_id": "1"}])
+        # A write that failed part way leaves documents that were not counted
+        self.mongo_db["routes_staging"].insert_many([{"trip_id": "partial"}])
+        with self.assertRaises(staging.StagingError):
+            staged.swap([])
+        self.assertEqual([x["trip_id"] for x in self.mongo_db["routes"].documents], ["old"])
+        self.assertNotIn("routes_staging", self.mongo_db.collections)
+
+    def test_too_few_aborts(self):
+        self.mongo_db["routes"].insert_many([{"trip_id": str(i)} for i in range(10)])
+        for documents in ([], [{"trip_id": "1"}]):
+            staged = staging.StagedCollection(self.mongo_db, "routes")
+            staged.write(documents)
+            with self.assertRaises(staging.StagingError):
+                staged.swap([])
+        self.assertEqual(len(self.mongo_db["routes"].documents), 10)
+
+    @unittest.skipUnless(MONGO_TEST_URL, "MONGO_TEST_URL is not set")
+    def test_swap_mongod(self):
+        import pymongo
+        client = pymongo.MongoClient(MONGO_TEST_URL)
+        mongo_db = client["gtfs_staging_test"]
+        try:
+            mongo_db["routes"].insert_many([{"feed": "a", "trip_id": "old"}, {"feed": "b", "trip_id": "kept"}])
+            staged = staging.StagedCollection(mongo_db, "routes")
+            staged.carry_over({"feed": "b"})
+            staged.write({"feed": "a", "trip_id": str(i)} for i in range(3))
+            self.assertEqual(staged.swap(indexes.ROUTE_INDEXES), 4)
+            self.assertEqual(mongo_db["routes"].count_documents({"feed": "a"}), 3)
+            self.assertIn("stops.stop_id_1", mongo_db["routes"].index_information())
+            self.assertNotIn("routes_staging", mongo_db.list_collection_names())
+        finally:
+            client.drop_database("gtfs_staging_test")
+            client.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+import os
+import unittest
+from array import array
+from src import gtfs, times, translation
+DIRECTORY = os.path.dirname(os.path.realpath(__file__))
+FEED = os.path.join(DIRECTORY, "resources", "feed")
+
+
+class Times_Tests(unittest.TestCase):
+    def test_parse_times(self):
+        values = ["07:00:00", " 7:05:30", "", "25:01:02", "105:00:00"]
+        self.assertEqual(times.parse_times(values).tolist(),
+                         [25200, 25530, gtfs.MISSING_TIME, 90062, 378000])
+        self.assertEqual(times.parse_times(values).tolist(), [gtfs.parse_gtfs_time(x.strip()) for x in values])
+
+    def test_parse_times_empty(self):
+        self.assertEqual(len(times.parse_times([])), 0)
+
+    def test_parse_times_invalid(self):
+        for value in ["07-00-00", "7:5:00", "ab:00:00"]:
+            with self.assertRaises(ValueError):
+                times.parse_times(["07:00:00", value])
+
+    def test_column_array(self):
+        column = array('l', [1, 2, 3])
+        self.assertEqual(times.column_array(column).tolist(), [1, 2, 3])
+        self.assertEqual(times.column_array(memoryview(array('i', [4, 5]))).tolist(), [4, 5])
+        self.assertEqual(times.column_array([6]).tolist(), [6])
+
+    def test_trip_times(self):
+        # Out of order and with an untimed stop in the middle of t1
+        trip_ids = ["t1", "t2", "t1", "t1", "t2"]
+        sequence = [3, 1, 1, 2, 2]
+        arrivals = times.parse_times(["07:20:00", "08:00:00", "07:00:00", "", "08:10:00"])
+        departures = times.parse_times(["07:20:00", "08:01:00", "07:00:30", "", "08:10:00"])
+        trip_times = times.TripTimes(trip_ids, sequence, arrivals, departures)
+        self.assertEqual(trip_times.get("t1"), {"first_departure": 25230, "last_arrival": 26400, "duration": 1170,
+                                                "dwell_times": [30, None, 0], "run_times": [None, None]})
+        self.assertEqual(trip_times.get("t2"), {"first_departure": 28860, "last_arrival": 29400, "duration": 540,
+                                                "dwell_times": [60, 0], "run_times": [540]})
+        self.assertIsNone(trip_times.get("t3"))
+
+    def test_trip_times_of_matches_trip_times(self):
+        stops = [{"trip_id": "t1", "stop_sequence": 3, "arrival_time": "07:20:00", "departure_time": "07:20:00"},
+                 {"trip_id": "t1", "stop_sequence": 1, "arrival_time": "07:00:00", "departure_time": "07:00:30"},
+                 {"trip_id": "t1", "stop_sequence": 2, "arrival_time": "", "departure_time": ""},
+                 {"trip_id": "t1", "stop_sequence": 4, "arrival_time": "", "departure_time": "07:30:00"}]
+        expected = times.TripTimes.from_stop_times(stops).get("t1")
+        self.assertEqual(times.trip_times_of(stops), expected)
+        self.assertEqual(expected["run_times"], [None, None, 600])
+        self.assertEqual(times.trip_times_of([]), {})
+
+    def test_blank_stop_sequence(self):
+        # Record loaders parse a blank stop_sequence as None, those stops come last
+        stops = [{"trip_id": "t1", "stop_sequence": None, "arrival_time": "07:40:00", "departure_time": ""},
+                 {"trip_id": "t1", "stop_sequence": 2, "arrival_time": "07:20:00", "departure_time": "07:20:00"},
+                 {"trip_id": "t1", "stop_sequence": 1, "arrival_time": "07:00:00", "departure_time": "07:00:00"}]
+        expected = times.TripTimes.from_stop_times(stops).get("t1")
+        self.assertEqual(times.trip_times_of(stops), expected)
+        self.assertEqual((expected["last_arrival"], expected["run_times"]), (27600, [1200, 1200]))
+        records = [gtfs.StopTime(x["trip_id"], x["arrival_time"], x["departure_time"], "S", x["stop_sequence"])
+                   for x in stops]
+        self.assertEqual(times.TripTimes.from_stop_times(records).get("t1"), expected)
+        columns = gtfs.StopTimeColumns()
+        for x in records:
+            columns.append({k: "" if v is None else str(v) for k, v in x.to_dict().items()})
+        self.assertEqual(times.TripTimes.from_stop_times(columns).get("t1"), expected)
+
+    def test_from_stop_times_columns_match(self):
+        path = os.path.join(FEED, "stop_times.txt")
+        objects = times.TripTimes.from_stop_times(gtfs.load_gtfs_from_file(path, gtfs.StopTime))
+        columns = times.TripTimes.from_stop_times(gtfs.load_stop_times_columns(path))
+        self.assertEqual(objects.trip_ids, ["T1", "T2"])
+        for trip_id in objects.trip_ids:
+            self.assertEqual(objects.get(trip_id), columns.get(trip_id))
+        self.assertEqual(objects.get("T1")["run_times"], [300, 300])
+
+    def test_attach_trip_times(self):
+        def load(filename, obj_type):
+            return gtfs.load_gtfs_from_file(os.path.join(FEED, filename), obj_type)
+        stop_times = load("stop_times.txt", gtfs.StopTime)
+        connections = translation.connect_route_stops(load("routes.txt", gtfs.Route), stop_times,
+                                                      load("trips.txt", gtfs.Trip))
+        upfront = list(times.attach_trip_times(connections, times.TripTimes.from_stop_times(stop_times)))
+        self.assertEqual(list(times.attach_trip_times(connections)), upfront)
+        self.assertEqual(upfront[1]["first_departure"], 28800)
+        self.assertEqual(upfront[1]["duration"], 600)
+        self.assertEqual(upfront[1]["stops"], connections[1]["stops"])
+
+
+if __name__ == "__main__":
+    unittest.main()
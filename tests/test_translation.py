@@ -1,6 +1,21 @@
+import os
+import tempfile
 import unittest
+from unittest.mock import patch
 from src import gtfs, translation
 
+STOP_TIMES_HEADER = "trip_id,arrival_time,departure_time,stop_id,stop_sequence\n"
+
+
+def write_stop_times(rows):
+    handle, path = tempfile.mkstemp(suffix=".txt")
+    with os.fdopen(handle, 'w', encoding="utf-8") as f:
+        f.write(STOP_TIMES_HEADER)
+        for row in rows:
+            f.write(",".join(row) + "\n")
+    return path
+
+
 class Translation_Tests(unittest.TestCase):
     def test_group_by_invalid_field(self):
         stops = [gtfs.Stop("1"), gtfs.Stop("2")]
@@ -13,6 +28,45 @@ class Translation_Tests(unittest.TestCase):
         self.assertEqual(len(result.items()), 2)
         self.assertEqual(len(result["1"]), 2)
 
+    def test_is_clustered_by(self):
+        clustered = [gtfs.Stop("1"), gtfs.Stop("1"), gtfs.Stop("2")]
+        unclustered = [gtfs.Stop("1"), gtfs.Stop("2"), gtfs.Stop("1")]
+        self.assertTrue(translation.is_clustered_by("stop_id", clustered))
+        self.assertFalse(translation.is_clustered_by("stop_id", unclustered))
+
+    def test_external_sort_spills_and_is_stable(self):
+        stops = [gtfs.Stop(str(i % 3), str(i)) for i in range(10)]
+        result = list(translation.external_sort("stop_id", stops, chunk_size=3))
+        self.assertEqual([x.stop_id for x in result], sorted(x.stop_id for x in stops))
+        self.assertEqual([x.stop_name for x in result if x.stop_id == "1"], ["1", "4", "7"])
+
+    def test_stream_route_stops_matches_connect(self):
+        rows = [("t1", "07:00:00", "07:00:00", "A", "1"), ("t2", "08:00:00", "08:00:00", "A", "1"),
+                ("t1", "07:05:00", "07:05:00", "B", "2"), ("t2", "08:05:00", "08:05:00", "B", "2")]
+        path = write_stop_times(rows)
+        routes = [gtfs.Route("r1", "1", "1")]
+        trips = [gtfs.Trip("r1", "s1", "t1"), gtfs.Trip("r1", "s2", "t2"), gtfs.Trip("r1", "s1", "t3")]
+        try:
+            expected = translation.connect_route_stops(routes, gtfs.load_gtfs_from_file(path, gtfs.StopTime), trips[:2])
+            streamed = list(translation.stream_route_stops(routes, trips, path, chunk_size=1))
+        finally:
+            os.remove(path)
+        self.assertEqual(streamed, expected)
+
+    def test_connect_route_stops_columns(self):
+        rows = [("t1", "07:00:00", "07:00:00", "A", "1"), ("t2", "", "", "A", "1"),
+                ("t1", "07:05:00", "07:05:00", "B", "2"), ("t2", "08:05:00", "08:05:00", "B", "2")]
+        path = write_stop_times(rows)
+        routes = [gtfs.Route("r1", "1", "1")]
+        trips = [gtfs.Trip("r1", "s1", "t1"), gtfs.Trip("r1", "s2", "t2")]
+        try:
+            columns = gtfs.load_stop_times_columns(path)
+        finally:
+            os.remove(path)
+        expected = translation.connect_route_stops(routes, list(columns), trips)
+        with patch.object(gtfs.StopTimeColumns, "get", side_effect=AssertionError("StopTime built")):
+            self.assertEqual(translation.connect_route_stops(routes, columns, trips), expected)
+
 
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
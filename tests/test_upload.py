@@ -0,0 +1,344 @@
+import os
+import tempfile
+import time
+import unittest
+import zipfile
+from src import cache, checkpoint, departures, download, fingerprint, indexes, metrics, patterns, staging, upload
+from . import utils
+DIRECTORY = os.path.dirname(os.path.realpath(__file__))
+FEED = os.path.join(DIRECTORY, "resources", "feed")
+RAIL = os.path.join(DIRECTORY, "resources", "rail")
+
+
+class Upload_Tests(unittest.TestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.work_dir = tempfile.TemporaryDirectory()
+        os.chdir(self.work_dir.name)
+        utils.record_operations(self, fingerprint, upload)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.work_dir.cleanup()
+
+    def test_build_route_documents(self):
+        documents = upload.build_route_documents(FEED)
+        self.assertEqual(len(documents), 2)
+        self.assertEqual(documents[0]["route_id"], "R1")
+        self.assertEqual(documents[0]["start_date"], "20220101")
+        self.assertEqual(len(documents[0]["stops"]), 3)
+
+    def test_build_route_documents_from_zip(self):
+        with zipfile.ZipFile("feed.zip", 'w') as zip_file:
+            for filename in os.listdir(FEED):
+                zip_file.write(os.path.join(FEED, filename), filename)
+        with zipfile.ZipFile("feed.zip") as zip_file:
+            self.assertEqual(upload.build_route_documents(zip_file), upload.build_route_documents(FEED))
+            streamed = list(upload.build_route_documents(zip_file, stream=True))
+        self.assertEqual(streamed, upload.build_route_documents(FEED))
+
+    def test_build_route_documents_parallel(self):
+        with zipfile.ZipFile("feed.zip", 'w') as zip_file:
+            for filename in os.listdir(FEED):
+                zip_file.write(os.path.join(FEED, filename), filename)
+        with zipfile.ZipFile("feed.zip") as zip_file:
+            documents = upload.build_route_documents(zip_file, processes=2)
+        self.assertEqual(documents, upload.build_route_documents(FEED, columnar=True))
+
+    def test_build_route_documents_trip_times(self):
+        documents = upload.build_route_documents(FEED, trip_times=True)
+        self.assertEqual(documents[0]["duration"], 600)
+        self.assertEqual(documents[0]["run_times"], [300, 300])
+        self.assertEqual(list(upload.build_route_documents(FEED, stream=True, trip_times=True)), documents)
+        self.assertEqual(upload.build_route_documents(FEED, columnar=True, trip_times=True), documents)
+
+    def test_download_and_insert(self):
+        mongo_db = utils.FakeDatabase()
+        service = utils.FolderDownloadService({"a": FEED})
+        result = upload.download_and_insert([{"name": "A", "url": "a"}], service, mongo_db)
+        self.assertEqual(len(result["A"]), 2)
+        self.assertFalse(os.path.exists("A"))
+
+    def test_download_and_insert_indexes_once(self):
+        mongo_db = utils.FakeDatabase()
+        service = utils.FolderDownloadService({"a": FEED, "b": RAIL})
+        store = checkpoint.CheckpointStore(None)
+        data_sets = [{"name": "A", "url": "a"}, {"name": "B", "url": "b"}]
+        upload.download_and_insert(data_sets, service, mongo_db, checkpoints=store)
+        routes = mongo_db[upload.COLLECTION_NAME]
+        self.assertEqual(routes.index_sizes, [3] * len(indexes.ROUTE_INDEXES),
+                         "Indexes should be built once both feeds are loaded")
+        self.assertEqual(store.feeds, {})
+
+    def test_download_and_insert_failure_not_committed(self):
+        with zipfile.ZipFile("feed.zip", 'w') as zip_file:
+            for filename in os.listdir(FEED):
+                zip_file.write(os.path.join(FEED, filename), filename)
+        with open("feed.zip", 'rb') as f:
+            content = f.read()
+        mongo_db = utils.FakeDatabase()
+        routes = mongo_db[upload.COLLECTION_NAME]
+        insert_many = routes.insert_many
+
+        def fail(documents, ordered=True):
+            raise Exception("TEST")
+        with utils.LocalHTTPServer({"/feed.zip": content}) as server:
+            data_sets = [{"name": "A", "url": server.url("/feed.zip")}]
+            routes.insert_many = fail
+            service = download.DownloadService(cache.DownloadCache("cache"))
+            with self.assertRaises(Exception):
+                upload.download_and_insert(data_sets, service, mongo_db)
+            routes.insert_many = insert_many
+            # A restart with the same cache should still see the feed as new
+            result = upload.download_and_insert(data_sets, download.DownloadService(cache.DownloadCache("cache")),
+                                                mongo_db)
+            self.assertEqual(len(result["A"]), 2)
+            unchanged = upload.download_and_insert(data_sets, download.DownloadService(cache.DownloadCache("cache")),
+                                                   mongo_db)
+        self.assertEqual(unchanged["A"], [])
+        self.assertEqual(len(routes.documents), 2)
+
+    def test_download_and_insert_metrics(self):
+        mongo_db = utils.FakeDatabase()
+        service = utils.FolderDownloadService({"a": FEED})
+        run = metrics.Metrics()
+        upload.download_and_insert([{"name": "A", "url": "a"}], service, mongo_db, metrics=run)
+        names = [x.name for x in run.stages]
+        self.assertEqual(names[0], "download")
+        self.assertEqual(names[-4:], ["join", "calendar", "insert", "indexes"])
+        self.assertEqual(run.stages[-2].rows, 2)
+        self.assertIn({"file": "stop_times.txt"}, [x.labels for x in run.stages if x.name == "parse"])
+
+    def test_download_and_insert_fingerprints(self):
+        mongo_db = utils.FakeDatabase()
+        service = utils.FolderDownloadService({"a": FEED})
+        store = fingerprint.FingerprintStore("fingerprints.json")
+        first = upload.download_and_insert([{"name": "A", "url": "a"}], service, mongo_db, fingerprints=store)
+        second = upload.download_and_insert([{"name": "A", "url": "a"}], service, mongo_db, fingerprints=store)
+        self.assertEqual(len(first["A"]), 2)
+        self.assertEqual(second["A"], [], "Unchanged trips should not be written again")
+        self.assertEqual(len(mongo_db[upload.COLLECTION_NAME].documents), 2)
+
+    def test_insert_routes_stop_indexes(self):
+        mongo_db = utils.FakeDatabase()
+        service = utils.FolderDownloadService({"a": FEED})
+        for _ in range(2):
+            upload.insert_routes_to_db("a", "A", service, mongo_db, upload.COLLECTION_NAME, stop_indexes=True)
+        board = mongo_db[departures.DEPARTURES_COLLECTION]
+        self.assertEqual(len(board.documents), 4, "Reinserting a feed should replace its departures")
+        self.assertEqual(board.find({"stop_id": "A"})[0]["feed"], "a")
+        self.assertEqual(board.indexes, [[("stop_id", 1), ("departure_seconds", 1)]])
+        self.assertEqual(len(mongo_db[departures.STOP_ROUTES_COLLECTION].documents), 3)
+
+    def test_insert_routes_patterns(self):
+        mongo_db = utils.FakeDatabase()
+        service = utils.FolderDownloadService({"a": FEED})
+        for _ in range(2):
+            upload.insert_routes_to_db("a", "A", service, mongo_db, upload.COLLECTION_NAME, patterns=True)
+        stored = mongo_db[patterns.PATTERNS_COLLECTION].documents
+        self.assertEqual(len(stored), 1, "Reinserting a feed should replace its patterns")
+        trip = mongo_db[upload.COLLECTION_NAME].documents[0]
+        self.assertEqual(trip["pattern_id"], stored[0]["pattern_id"])
+        self.assertEqual(trip["start_date"], "20220101")
+        self.assertEqual(len(patterns.expand_trip(trip, stored[0])["stops"]), 3)
+        routes = mongo_db[upload.COLLECTION_NAME]
+        self.assertIn([("pattern_id", 1)], routes.indexes)
+        self.assertNotIn([("stops.stop_id", 1)], routes.indexes)
+
+    def test_insert_routes_indexes(self):
+        mongo_db = utils.FakeDatabase()
+        service = utils.FolderDownloadService({"a": FEED})
+        upload.insert_routes_to_db("a", "A", service, mongo_db, upload.COLLECTION_NAME)
+        routes = mongo_db[upload.COLLECTION_NAME]
+        self.assertIn([("stops.stop_id", 1)], routes.indexes)
+        self.assertIn([("start_date", 1), ("end_date", 1)], routes.indexes)
+        self.assertEqual(routes.index_sizes, [2] * len(indexes.ROUTE_INDEXES),
+                         "Indexes should be created after the documents are written")
+        self.assertEqual(mongo_db[upload.SERVICE_CALENDAR].documents, [])
+
+    def test_insert_routes_calendar_reference(self):
+        mongo_db = utils.FakeDatabase()
+        service = utils.FolderDownloadService({"a": FEED})
+        for _ in range(2):
+            upload.insert_routes_to_db("a", "A", service, mongo_db, upload.COLLECTION_NAME, calendar_reference=True)
+        trip = mongo_db[upload.COLLECTION_NAME].documents[0]
+        self.assertNotIn("start_date", trip)
+        self.assertEqual(trip["feed"], "a")
+        calendars = mongo_db[upload.SERVICE_CALENDAR]
+        self.assertEqual(len(calendars.documents), 1, "Reinserting a feed should replace its calendars")
+        self.assertEqual(calendars.find({"feed": trip["feed"], "service_id": trip["service_id"]})[0]["end_date"],
+                         "20221231")
+        self.assertIn([("feed", 1), ("service_id", 1)], calendars.indexes)
+        self.assertNotIn([("start_date", 1), ("end_date", 1)], mongo_db[upload.COLLECTION_NAME].indexes,
+                         "Trips without their calendar should not index its dates")
+
+    def test_download_and_insert_staging(self):
+        mongo_db = utils.FakeDatabase()
+        service = utils.FolderDownloadService({"a": FEED, "b": RAIL})
+        data_sets = [{"name": "A", "url": "a"}, {"name": "B", "url": "b"}]
+        upload.download_and_insert(data_sets, service, mongo_db, staging=True)
+        # Second run: a is reloaded, b fails to download and keeps its live documents
+        service.folders["b"] = None
+        result = upload.download_and_insert(data_sets, service, mongo_db, staging=True)
+        self.assertEqual(len(result["A"]), 2)
+        self.assertNotIn("B", result)
+        live = mongo_db[upload.COLLECTION_NAME]
+        self.assertEqual(sorted((x["feed"], x["trip_id"]) for x in live.documents),
+                         [("a", "T1"), ("a", "T2"), ("b", "T1")])
+        self.assertIn([("stops.stop_id", 1)], live.indexes)
+        self.assertEqual(sorted(mongo_db.collections), [upload.COLLECTION_NAME])
+        self.assertEqual(os.listdir("."), [])
+        self.assertEqual(service.commits, ["a", "b", "a"], "Failed downloads should not be committed")
+
+    def test_download_and_insert_staging_untagged(self):
+        mongo_db = utils.FakeDatabase()
+        service = utils.FolderDownloadService({"a": FEED})
+        data_sets = [{"name": "A", "url": "a"}]
+        upload.download_and_insert(data_sets, service, mongo_db)
+        # Unchanged since the plain upload, whose documents aren't tagged so can't be carried over
+        service.unchanged.add("a")
+        result = upload.download_and_insert(data_sets, service, mongo_db, staging=True)
+        self.assertEqual(len(result["A"]), 2)
+        self.assertEqual([x["feed"] for x in mongo_db[upload.COLLECTION_NAME].documents], ["a", "a"])
+        # Now tagged, an unchanged feed is carried over
+        self.assertEqual(upload.download_and_insert(data_sets, service, mongo_db, staging=True), {"A": []})
+        self.assertEqual(len(mongo_db[upload.COLLECTION_NAME].documents), 2)
+
+    def test_download_and_insert_staging_fingerprints(self):
+        store = fingerprint.FingerprintStore("fingerprints.json")
+        with self.assertRaises(ValueError):
+            upload.download_and_insert([], utils.FolderDownloadService({}), utils.FakeDatabase(), fingerprints=store,
+                                       staging=True)
+
+    def test_insert_routes_checkpoint_resume(self):
+        mongo_db = utils.FakeDatabase()
+        service = utils.FolderDownloadService({"a": FEED})
+        store = checkpoint.CheckpointStore("checkpoints.json")
+        routes = mongo_db[upload.COLLECTION_NAME]
+        insert_many = routes.insert_many
+        calls = []
+
+        def fail_second(documents, ordered=True):
+            calls.append(len(documents))
+            if len(calls) == 2:
+                raise Exception("TEST")
+            return insert_many(documents, ordered)
+        routes.insert_many = fail_second
+        with self.assertRaises(Exception):
+            upload.insert_routes_to_db("a", "A", service, mongo_db, upload.COLLECTION_NAME, batch_size=1,
+                                       patterns=True, checkpoints=store)
+        resumed = checkpoint.CheckpointStore("checkpoints.json")
+        self.assertTrue(resumed.done("a", "download"))
+        self.assertEqual(resumed.offset("a"), 1)
+
+        service.folders["a"] = None  # A second download would fail
+        ids = upload.insert_routes_to_db("a", "A", service, mongo_db, upload.COLLECTION_NAME, batch_size=1,
+                                         patterns=True, checkpoints=resumed)
+        self.assertEqual(len(ids), 1, "Only the trip missing from the first run should be written")
+        self.assertEqual(sorted(x["trip_id"] for x in routes.documents), ["T1", "T2"])
+        self.assertEqual(len(mongo_db[patterns.PATTERNS_COLLECTION].documents), 1)
+        self.assertEqual(checkpoint.CheckpointStore("checkpoints.json").feeds, {})
+
+    def test_resume_insert_after_slow_failure(self):
+        def documents():
+            return ({"feed": "a", "trip_id": str(i)} for i in range(200))
+        collection = utils.FakeCollection()
+        insert_many = collection.insert_many
+        calls = []
+
+        def slow_first_failure(batch, ordered=True):
+            calls.append(len(batch))
+            if len(calls) == 1:
+                time.sleep(0.2)
+                raise Exception("TEST")
+            return insert_many(batch, ordered)
+        collection.insert_many = slow_first_failure
+        store = checkpoint.CheckpointStore(None)
+        with self.assertRaises(Exception):
+            upload._resume_insert(collection, documents(), "a", store, 10)
+        self.assertEqual(store.offset("a"), 0)
+        collection.insert_many = insert_many
+        stats = upload._resume_insert(collection, documents(), "a", store, 10)
+        self.assertEqual(sorted(int(x["trip_id"]) for x in collection.documents), list(range(200)),
+                         "Documents written after the failed batch should not be written twice")
+        self.assertEqual(len(stats.upserted_ids), 200 - (len(calls) - 1) * 10)
+        self.assertEqual(store.offset("a"), 200)
+
+    def test_download_and_insert_checkpoint_keeps_download(self):
+        mongo_db = utils.FakeDatabase()
+        service = utils.FolderDownloadService({"a": FEED})
+        store = checkpoint.CheckpointStore("checkpoints.json")
+        routes = mongo_db[upload.COLLECTION_NAME]
+        insert_many = routes.insert_many
+
+        def fail(documents, ordered=True):
+            raise Exception("TEST")
+        routes.insert_many = fail
+        with self.assertRaises(Exception):
+            upload.download_and_insert([{"name": "A", "url": "a"}], service, mongo_db, checkpoints=store)
+        self.assertTrue(os.path.exists(os.path.join("A", upload.ZIP_NAME)))
+        routes.insert_many = insert_many
+        result = upload.download_and_insert([{"name": "A", "url": "a"}], service, mongo_db, checkpoints=store)
+        self.assertEqual(len(result["A"]), 2)
+        self.assertEqual(len(routes.documents), 2)
+        self.assertFalse(os.path.exists("A"))
+        with self.assertRaises(ValueError):
+            upload.download_and_insert([], service, mongo_db, checkpoints=store, fetcher=object())
+        with self.assertRaises(ValueError):
+            upload.download_and_insert([], service, mongo_db, checkpoints=store, staging=True)
+
+    def test_merge_and_insert(self):
+        mongo_db = utils.FakeDatabase()
+        service = utils.FolderDownloadService({"a": FEED, "b": RAIL, "bad": None})
+        data_sets = [{"name": "Bus", "url": "a", "prefix": "bus"}, {"name": "Rail", "url": "b", "prefix": "rail"}]
+        upload.merge_and_insert(data_sets, service, mongo_db, directory="zips")
+        # Rail fails to download and is merged from the zip of the first run
+        service.folders["b"] = None
+        ids = upload.merge_and_insert(data_sets, service, mongo_db, directory="zips")
+        self.assertEqual(len(ids), 3)
+        stored = mongo_db[upload.MERGED_COLLECTION].documents
+        self.assertEqual(len(stored), 3, "Merging again should replace the merged trips")
+        rail = [x for x in stored if x["trip_id"] == "rail:T1"][0]
+        self.assertEqual(rail["route_id"], "rail:R1")
+        self.assertEqual(rail["start_date"], "20220601")
+        self.assertEqual(rail["stops"][0]["stop_id"], "bus:A")
+        self.assertEqual(sorted(os.listdir("zips")), ["Bus.zip", "Rail.zip"])
+        self.assertEqual(sorted(mongo_db.collections), [upload.MERGED_COLLECTION])
+
+        # A feed that has never downloaded would drop an operator, the merge is refused
+        with self.assertRaises(staging.StagingError):
+            upload.merge_and_insert(data_sets + [{"name": "Bad", "url": "bad"}], service, mongo_db, directory="zips")
+        self.assertEqual(mongo_db[upload.MERGED_COLLECTION].documents, stored)
+
+    def test_download_and_insert_concurrent(self):
+        mongo_db = utils.FakeDatabase()
+        service = utils.FolderDownloadService({"a": FEED, "b": FEED, "bad": None})
+        data_sets = [{"name": "A", "url": "a"}, {"name": "Bad", "url": "bad"}, {"name": "B", "url": "b"}]
+        result = upload.download_and_insert_concurrent(data_sets, service, mongo_db, max_workers=2, max_processes=2)
+        self.assertEqual(sorted(result.keys()), ["A", "B"])
+        self.assertEqual(len(result["B"]), 2)
+        self.assertEqual(len(mongo_db[upload.COLLECTION_NAME].documents), 4)
+        self.assertEqual(mongo_db[upload.COLLECTION_NAME].index_sizes, [4] * len(indexes.ROUTE_INDEXES))
+        self.assertEqual(os.listdir("."), [])
+
+    def test_download_and_insert_concurrent_options(self):
+        mongo_db = utils.FakeDatabase()
+        service = utils.FolderDownloadService({"a": FEED, "b": RAIL})
+        data_sets = [{"name": "A", "url": "a"}, {"name": "B", "url": "b"}]
+        store = fingerprint.FingerprintStore("fingerprints.json")
+        run = metrics.Metrics()
+        for _ in range(2):
+            result = upload.download_and_insert_concurrent(data_sets, service, mongo_db, max_workers=2,
+                                                           max_processes=1, stream=True, fingerprints=store,
+                                                           metrics=run)
+        self.assertEqual(result, {"A": [], "B": []}, "Unchanged trips should not be written again")
+        stored = mongo_db[upload.COLLECTION_NAME].documents
+        self.assertEqual(sorted((x["feed"], x["trip_id"]) for x in stored), [("a", "T1"), ("a", "T2"), ("b", "T1")])
+        self.assertEqual(sorted(x.labels["feed"] for x in run.stages if x.name == "build"), ["a", "a", "b", "b"])
+        self.assertEqual(sorted(service.commits), ["a", "a", "b", "b"])
+        os.remove("fingerprints.json")
+        self.assertEqual(os.listdir("."), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
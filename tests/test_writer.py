@@ -0,0 +1,29 @@
+import io
+import json
+import unittest
+from src import writer
+
+
+class Writer_Tests(unittest.TestCase):
+    def test_write_json_array(self):
+        records = [{"a": 1}, {"b": "two"}, {"c": [3]}]
+        out = io.StringIO()
+        count = writer.write_json_array((x for x in records), out, buffer_size=4)
+        self.assertEqual(count, 3)
+        self.assertEqual(json.loads(out.getvalue()), records)
+
+    def test_write_json_array_empty(self):
+        out = io.StringIO()
+        self.assertEqual(writer.write_json_array(iter([]), out), 0)
+        self.assertEqual(json.loads(out.getvalue()), [])
+
+    def test_write_ndjson(self):
+        records = [{"a": 1}, {"b": "two"}]
+        out = io.StringIO()
+        count = writer.write_ndjson(iter(records), out)
+        self.assertEqual(count, 2)
+        self.assertEqual([json.loads(x) for x in out.getvalue().splitlines()], records)
+
+
+if __name__ == "__main__":
+    unittest.main()
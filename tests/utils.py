@@ -1,7 +1,19 @@
+import hashlib
+import os
+import shutil
+import threading
+import time
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+import pymongo
+
+
 class MockResponse:
-    def __init__(self, data, status_code):
+    def __init__(self, data, status_code, headers=None):
         self.data = data
         self.status_code = status_code
+        self.headers = headers or {}
 
     @property
     def json(self):
@@ -13,4 +25,267 @@ class MockResponse:
 
     @property
     def content(self):
-        return self.data
\ No newline at end of file
+        return self.data
+
+    def iter_content(self, chunk_size=1):
+        for i in range(0, len(self.data), chunk_size):
+            yield self.data[i:i + chunk_size]
+
+class InsertManyResult:
+    def __init__(self, inserted_ids):
+        self.inserted_ids = inserted_ids
+
+
+class BulkWriteResult:
+    def __init__(self):
+        self.upserted_ids = {}
+        self.modified_count = 0
+        self.deleted_count = 0
+
+
+class ReplaceOne(pymongo.ReplaceOne):
+    """pymongo.ReplaceOne that keeps its arguments for FakeCollection to apply."""
+    def __init__(self, filter, replacement, upsert=False, **kwargs):
+        super().__init__(filter, replacement, upsert, **kwargs)
+        self.arguments = {"filter": filter, "replacement": replacement, "upsert": upsert}
+
+
+class DeleteMany(pymongo.DeleteMany):
+    """pymongo.DeleteMany that keeps its arguments for FakeCollection to apply."""
+    def __init__(self, filter, **kwargs):
+        super().__init__(filter, **kwargs)
+        self.arguments = {"filter": filter}
+
+
+def record_operations(test_case, *modules):
+    """Have modules build the recording ReplaceOne and DeleteMany for the rest of a test."""
+    for module in modules:
+        patcher = mock.patch.multiple(module, ReplaceOne=ReplaceOne, DeleteMany=DeleteMany, create=True)
+        patcher.start()
+        test_case.addCleanup(patcher.stop)
+
+
+def matches(document, query):
+    for field, expected in query.items():
+        if isinstance(expected, dict) and "$in" in expected:
+            if document.get(field) not in expected["$in"]:
+                return False
+        elif isinstance(expected, dict) and "$ne" in expected:
+            if document.get(field) == expected["$ne"]:
+                return False
+        elif document.get(field) != expected:
+            return False
+    return True
+
+
+class FakeCollection:
+    """Stand in for a pymongo collection that keeps documents in a list, shared by the
+    tests and the benchmarks so neither needs a Mongo server."""
+    def __init__(self, name="fake", delay=0, database=None):
+        self.name = name
+        self.database = database
+        self.documents = []
+        self.delay = delay
+        self.calls = []
+        self.operations = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+        self._next_id = 0
+        self.indexes = []
+        self.index_sizes = []
+
+    def _new_id(self):
+        self._next_id += 1
+        return self._next_id - 1
+
+    def insert_many(self, documents, ordered=True):
+        documents = list(documents)
+        if len(documents) == 0:
+            raise TypeError("documents must be a non-empty list")
+        with self._lock:
+            self.calls.append({"count": len(documents), "ordered": ordered})
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(self.delay)
+        with self._lock:
+            self.in_flight -= 1
+            ids = []
+            for document in documents:
+                document.setdefault("_id", self._new_id())
+                ids.append(document["_id"])
+                self.documents.append(document)
+        return InsertManyResult(ids)
+
+    def bulk_write(self, operations, ordered=True):
+        result = BulkWriteResult()
+        with self._lock:
+            self.calls.append({"count": len(operations), "ordered": ordered})
+            for index, operation in enumerate(operations):
+                self.operations.append(operation)
+                if isinstance(operation, ReplaceOne):
+                    arguments = operation.arguments
+                    existing = [x for x in self.documents if matches(x, arguments["filter"])]
+                    if len(existing) > 0:
+                        replacement = dict(arguments["replacement"], _id=existing[0]["_id"])
+                        self.documents[self.documents.index(existing[0])] = replacement
+                        result.modified_count += 1
+                    elif arguments["upsert"]:
+                        document = dict(arguments["replacement"], _id=self._new_id())
+                        self.documents.append(document)
+                        result.upserted_ids[index] = document["_id"]
+                elif isinstance(operation, DeleteMany):
+                    kept = [x for x in self.documents if not matches(x, operation.arguments["filter"])]
+                    result.deleted_count += len(self.documents) - len(kept)
+                    self.documents = kept
+                else:
+                    raise TypeError(f"Unsupported operation {operation}, build it through record_operations")
+        return result
+
+    def find(self, query=None):
+        return [x for x in self.documents if matches(x, query or {})]
+
+    def delete_many(self, query):
+        with self._lock:
+            self.documents = [x for x in self.documents if not matches(x, query)]
+
+    def count_documents(self, query):
+        return len(self.find(query))
+
+    def drop(self):
+        self.database.drop_collection(self.name)
+
+    def rename(self, new_name, dropTarget=False):
+        self.database.rename_collection(self, new_name, dropTarget)
+
+    def create_index(self, keys, **kwargs):
+        self.indexes.append(keys)
+        # Number of documents when the index was asked for, to check indexes come after loads
+        self.index_sizes.append(len(self.documents))
+
+
+class FakeDatabase:
+    """Stand in for a pymongo database that hands out FakeCollections."""
+    def __init__(self):
+        self.collections = {}
+
+    def __getitem__(self, name):
+        if name not in self.collections:
+            self.collections[name] = FakeCollection(name, database=self)
+        return self.collections[name]
+
+    def drop_collection(self, name):
+        self.collections.pop(name, None)
+
+    def rename_collection(self, collection, new_name, drop_target):
+        if self.collections.get(collection.name) is not collection:
+            raise Exception(f"Collection {collection.name} does not exist")
+        if new_name in self.collections and not drop_target:
+            raise Exception(f"Target collection {new_name} exists")
+        del self.collections[collection.name]
+        collection.name = new_name
+        self.collections[new_name] = collection
+
+
+class FolderDownloadService:
+    """Stand in for DownloadService that zips GTFS files from a folder instead of
+    downloading, also used by the benchmarks."""
+    def __init__(self, folders, compression=zipfile.ZIP_STORED):
+        self.folders = folders
+        self.compression = compression
+        self.pending = {}
+        self.commits = []
+        self.unchanged = set()  # Urls reported as unchanged unless forced
+
+    def commit(self, url, entry=None):
+        self.commits.append(url)
+
+    def download_if_diff(self, zip_url, path, force=False):
+        if self.folders[zip_url] is None:
+            raise Exception(f"Unable to download {zip_url}")
+        if zip_url in self.unchanged and not force:
+            return False
+        with zipfile.ZipFile(path, 'w', self.compression) as zip_file:
+            for filename in os.listdir(self.folders[zip_url]):
+                zip_file.write(os.path.join(self.folders[zip_url], filename), filename)
+        return True
+
+
+class LocalHTTPServer:
+    """HTTP/1.1 server on localhost serving fixed content per path. Supports ETag and
+    Last-Modified validators and records the headers and client port of every request.
+    Paths in failures answer 503 that many times before succeeding, and every response
+    waits delay seconds first."""
+    LAST_MODIFIED = "Thu, 29 Sep 2022 15:00:00 GMT"
+
+    def __init__(self, files, failures=None, delay=0):
+        self.files = files
+        self.failures = dict(failures or {})
+        self.delay = delay
+        self.requests = []
+        self.bytes_sent = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def send_empty(self, status):
+                self.send_response(status)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def do_GET(self):
+                with server._lock:
+                    server.requests.append({"path": self.path, "headers": dict(self.headers),
+                                            "port": self.client_address[1]})
+                    server.in_flight += 1
+                    server.max_in_flight = max(server.max_in_flight, server.in_flight)
+                try:
+                    time.sleep(server.delay)
+                    self.respond()
+                finally:
+                    with server._lock:
+                        server.in_flight -= 1
+
+            def respond(self):
+                if self.path not in server.files:
+                    self.send_empty(404)
+                    return
+                if server.failures.get(self.path, 0) > 0:
+                    server.failures[self.path] -= 1
+                    self.send_empty(503)
+                    return
+                content = server.files[self.path]
+                etag = '"' + hashlib.sha256(content).hexdigest() + '"'
+                if self.headers.get("If-None-Match") == etag:
+                    self.send_empty(304)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Length", str(len(content)))
+                self.send_header("ETag", etag)
+                self.send_header("Last-Modified", server.LAST_MODIFIED)
+                self.end_headers()
+                self.wfile.write(content)
+                server.bytes_sent += len(content)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        # Clients that time out close their connection mid response, that is expected
+        self.httpd.handle_error = lambda request, client_address: None
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def url(self, path):
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}{path}"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.httpd.shutdown()
+        self.httpd.server_close()